@@ -0,0 +1,176 @@
+"""
+批量查询执行器：把大量查询并发地送入编译后的 LangGraph 流程 (离线评测 / 回填)。
+
+用法 (在项目根目录执行)：
+    python -m app.batch --input queries.jsonl --output results.jsonl --concurrency 32 --timeout 60
+
+输入为 JSONL，每行可以是 {"id": ..., "input": "..."} (也接受 "query" 字段) 或单个 JSON 字符串。
+输出同为 JSONL，每行一个结果：{"index", "id", "input", "status", "decision", "output", "error", "latency_ms"}，
+status 为 ok / timeout / error；单条查询失败不会中断整批任务。
+--order input 按输入顺序写出 (默认)，--order completion 按完成顺序写出 (吞吐更稳定，不受慢查询阻塞)。
+"""
+from typing import Dict, Any, Iterable, AsyncIterator
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.concurrency import deadline_scope
+
+
+def iter_jsonl_queries(path: str) -> Iterable[Dict[str, Any]]:
+    """逐行读取 JSONL 查询文件 (惰性读取，不会一次性载入内存)；空行跳过。"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"input": record}
+            elif "input" not in record:
+                if "query" not in record:
+                    raise ValueError(f"{path} 第 {line_no} 行缺少 'input' / 'query' 字段。")
+                record = {**record, "input": record["query"]}
+            yield record
+
+
+async def _run_one(app_flow: Any, index: int, record: Dict[str, Any], timeout: float | None) -> Dict[str, Any]:
+    """执行单条查询并把结果 (或失败原因) 整理成一条记录。"""
+    query = record["input"]
+    # 离线批量查询走低优先级通道 (启用 BatchingLLM 时生效)，不与在线请求争抢
+    initial_state = {"input": query, "query": query, "output": "", "decision": "", "priority": record.get("priority", "background")}
+    result = {"index": index, "id": record.get("id", index), "input": query,
+              "status": "ok", "decision": None, "output": None, "error": None}
+    started = time.perf_counter()
+    try:
+        # 截止时间同时传递给模型调用 (ConcurrencyLimitedLLM)，排队无望在期限内完成时提前失败
+        with deadline_scope(timeout):
+            final_state = await asyncio.wait_for(app_flow.ainvoke(initial_state), timeout)
+        result["decision"] = final_state.get("decision")
+        result["output"] = final_state.get("output")
+    except asyncio.TimeoutError:
+        result["status"] = "timeout"
+        result["error"] = f"超过 {timeout}s 未完成"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+async def run_batch(app_flow: Any, queries: Iterable[Dict[str, Any] | str], concurrency: int = 16,
+                    timeout: float | None = None, ordered: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """
+    并发执行一批查询，以异步生成器的形式逐条产出结果。
+      - 同时执行的查询不超过 concurrency 条；输入按需读取，内存占用与批量大小无关
+      - ordered=True 按输入顺序产出：已完成但排在前面的查询未完成时暂存，
+        暂存 + 执行中的总数不超过 concurrency * 4，避免个别慢查询导致暂存无限增长
+      - ordered=False 按完成顺序产出
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency 必须 >= 1，当前为 {concurrency}。")
+    window = concurrency * 4
+    iterator = iter(queries)
+    exhausted = False
+    next_index = 0    # 下一条待启动的输入序号
+    next_emit = 0     # ordered 模式下下一条应产出的序号
+    running: Dict[asyncio.Task, int] = {}
+    finished: Dict[int, Dict[str, Any]] = {}
+
+    try:
+        while True:
+            # 1. 在并发上限 (以及顺序模式的暂存窗口) 内补充新任务
+            while not exhausted and len(running) < concurrency and (not ordered or next_index - next_emit < window):
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if isinstance(record, str):
+                    record = {"input": record}
+                task = asyncio.ensure_future(_run_one(app_flow, next_index, record, timeout))
+                running[task] = next_index
+                next_index += 1
+
+            if not running:
+                break
+
+            # 2. 等待至少一条完成
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.pop(task)
+                result = task.result()
+                if ordered:
+                    finished[result["index"]] = result
+                else:
+                    yield result
+
+            # 3. 顺序模式：产出所有已连续完成的结果
+            while next_emit in finished:
+                yield finished.pop(next_emit)
+                next_emit += 1
+    finally:
+        # 调用方提前停止迭代 (或出错) 时取消仍在执行的查询
+        for task in running:
+            task.cancel()
+
+
+async def run_batch_to_file(app_flow: Any, queries: Iterable[Dict[str, Any] | str], output_path: str,
+                            concurrency: int = 16, timeout: float | None = None, ordered: bool = True,
+                            progress_every: int = 1000) -> Dict[str, Any]:
+    """执行批量查询并把结果逐行写入 JSONL 文件 (每条结果写出后立即 flush)，返回汇总统计。"""
+    stats: Dict[str, Any] = {"total": 0, "ok": 0, "timeout": 0, "error": 0}
+    started = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as out:
+        async for result in run_batch(app_flow, queries, concurrency, timeout, ordered):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            stats["total"] += 1
+            stats[result["status"]] += 1
+            if progress_every and stats["total"] % progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  [Batch] 已完成 {stats['total']} 条 ({stats['total'] / elapsed:.1f} 条/秒)")
+    stats["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    stats["queries_per_second"] = round(stats["total"] / stats["elapsed_seconds"], 2) if stats["elapsed_seconds"] else 0.0
+    return stats
+
+
+def _summarize(stats: Dict[str, Any]) -> str:
+    return (f"[Batch] 共 {stats['total']} 条：成功 {stats['ok']}，超时 {stats['timeout']}，失败 {stats['error']}；"
+            f"耗时 {stats['elapsed_seconds']}s，吞吐 {stats['queries_per_second']} 条/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LangGraph Agent 流程批量查询")
+    parser.add_argument("--input", required=True, help="查询 JSONL 文件")
+    parser.add_argument("--output", required=True, help="结果 JSONL 文件")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--agent", default="primary_router", help="顶层 Agent 的配置键")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时执行的查询数上限")
+    parser.add_argument("--timeout", type=float, default=None, help="单条查询超时 (秒)，默认不限")
+    parser.add_argument("--order", choices=["input", "completion"], default="input", help="结果写出顺序")
+    parser.add_argument("--progress-every", type=int, default=1000, help="每完成多少条打印一次进度 (0 关闭)")
+    args = parser.parse_args()
+
+    from app.bootstrap import build_system
+    system = build_system(args.config, args.agent)
+
+    async def run() -> Dict[str, Any]:
+        try:
+            return await run_batch_to_file(system.app_flow, iter_jsonl_queries(args.input), args.output,
+                                           args.concurrency, args.timeout, args.order == "input", args.progress_every)
+        finally:
+            await system.aclose()
+
+    stats = asyncio.run(run())
+    print(_summarize(stats))
+    print(system.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from typing import Dict, Any
+from factory.llm_factory import LLMFactory, ComponentRegistry
+from factory.embedding_factory import EmbeddingFactory
+from factory.tools_factory import ToolsFactory
+from factory.agent_factory import AgentFactory
+from factory.rag_factory import RAGFactory
+from config.config import load_config
+from models.llm_abc import AbstractAgent
+from models.implementations import transport_manager
+from rag.rag_module import RAGModule
+
+
+class AgentSystem:
+    """
+    组装完成的 Agent 系统：配置 -> 各级工厂 -> 顶层 Agent -> 编译后的 LangGraph 流程。
+    main.py (演示)、app.batch (批量查询) 等入口共用这一套组装逻辑。
+    """
+    def __init__(self, full_config: Dict[str, Any], agent_key: str = "primary_router"):
+        self.config = full_config
+        self.agent_key = agent_key
+
+        print("\n--- 系统启动：初始化工厂 ---")
+        # 所有工厂共享同一个实例注册表，相同配置键的组件只创建一次
+        self.registry = ComponentRegistry()
+
+        # 实例化所有底层工厂
+        self.llm_factory = LLMFactory(full_config, self.registry)
+        self.embed_factory = EmbeddingFactory(full_config, self.registry)
+        self.tools_factory = ToolsFactory(full_config, self.registry)
+        self.rag_factory = RAGFactory(full_config, self.embed_factory, self.registry) # 注入 EmbeddingFactory
+        self.agent_factory = AgentFactory(full_config, self.llm_factory, self.tools_factory, self.rag_factory, self.registry)
+
+        # 获取顶层 Agent 与编译后的 LangGraph 流程
+        self.router_agent: AbstractAgent = self.agent_factory.get_instance(agent_key)
+        self.app_flow = self.router_agent.get_agent_flow()
+        print(f"[Registry] 组件注册表统计：新建 {self.registry.misses} 个，复用 {self.registry.hits} 次。")
+
+    @property
+    def rag_module(self) -> RAGModule | None:
+        """RAG 执行 Agent 使用的 RAGModule (顶层 Agent 不是路由器时为 None)。"""
+        rag_executor = getattr(self.router_agent, "rag_executor", None)
+        return rag_executor.rag_module if rag_executor is not None else None
+
+    async def aclose(self):
+        """
+        释放系统持有的网络资源 (模型服务连接池)。进程退出或重新组装系统前调用。
+        注册表中缓存的模型实例仍绑定着已关闭的连接池，一并清空，之后通过工厂获取的组件都会重新创建。
+        """
+        await transport_manager.aclose()
+        self.registry.clear()
+
+    def summary(self) -> str:
+        """推测执行 / 工具预取 / 上下文打包 / LLM 批处理、并发限制与多端点统计。"""
+        lines = []
+        # 尚未被使用 (未解析) 的延迟代理没有统计可输出，跳过以免为此创建组件
+        def resolved(component: Any) -> bool:
+            return component is not None and getattr(component, "is_resolved", True) is not False
+
+        rag_executor = getattr(self.router_agent, "rag_executor", None)
+        if resolved(rag_executor):
+            lines.append(rag_executor.speculation.summary())
+            if getattr(rag_executor, "packer", None) is not None:
+                lines.append(rag_executor.packer.summary())
+        tool_tasks = getattr(self.router_agent, "tool_tasks", None)
+        if tool_tasks is not None:
+            lines.append(tool_tasks.summary())
+        # LLM 包装器 (批处理 / 并发限制) 与多端点模型池的统计，同一实例只输出一次
+        agents = [self.router_agent] + list(getattr(self.router_agent, "executor_agents", {}).values())
+        seen = set()
+        for agent in agents:
+            llm = getattr(agent, "llm", None) if resolved(agent) else None
+            while resolved(llm) and id(llm) not in seen:
+                seen.add(id(llm))
+                # 只看实例自身的属性 (包装器会把未定义的属性透传给内层)
+                attributes = getattr(llm, "__dict__", {})
+                if "limiter" in attributes:
+                    lines.append(attributes["limiter"].summary())
+                elif "lanes" in attributes or "replicas" in attributes:
+                    lines.append(llm.summary())
+                llm = attributes.get("inner")
+        return "\n".join(lines)
+
+
+def build_system(config_path: str = 'config/config.yaml', agent_key: str = "primary_router") -> AgentSystem:
+    """加载配置文件并组装 Agent 系统。"""
+    return AgentSystem(load_config(config_path), agent_key)
@@ -0,0 +1,253 @@
+"""
+HTTP 服务入口 (ASGI)：启动时组装一次 Agent 系统，之后常驻处理查询请求。
+
+用法 (在项目根目录执行，需要安装 uvicorn)：
+    python -m app.server --host 127.0.0.1 --port 8080
+
+接口：
+    POST /query    请求体 {"input": "..."}；响应为 NDJSON 流 (application/x-ndjson)，每行一个事件：
+                     {"type": "token", "node": ..., "content": ...}   LLM 文本片段
+                     {"type": "node", "node": ..., "decision": ...}   节点完成
+                     {"type": "final", "output": ..., "decision": ...} 流程结束
+                     {"type": "error", "error": ...}                  执行失败 / 超时
+    GET  /healthz  存活检查
+    GET  /stats    准入与执行统计
+
+背压：同时执行的请求不超过 max_concurrency，另有 max_queue 个请求可排队等待；
+两者都已占满时立即返回 429 (Retry-After)，排队超过 queue_timeout_seconds 时返回 503。
+联调时可用 app.stub_llm_server 替代 config.yaml 中 pipeline_url 指向的模型服务。
+"""
+from typing import Dict, Any, Callable, Awaitable
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bootstrap import AgentSystem
+from models.concurrency import deadline_scope
+
+
+class AgentServer:
+    """
+    纯 ASGI 应用 (不依赖 Web 框架)。system_builder 在 lifespan 启动阶段执行一次，
+    组装好的 AgentSystem (工厂、组件注册表、编译后的流程) 由所有请求共享。
+    """
+    def __init__(self, system_builder: Callable[[], AgentSystem], config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.system_builder = system_builder
+        self.max_concurrency = config.get("max_concurrency", 32)
+        self.max_queue = config.get("max_queue", 64)
+        self.queue_timeout_seconds = config.get("queue_timeout_seconds", 10.0)
+        self.request_timeout_seconds = config.get("request_timeout_seconds", 120.0)
+        self.max_body_bytes = config.get("max_body_bytes", 1 << 20) # 默认 1 MiB
+
+        self.system: AgentSystem | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._admitted = 0 # 已准入 (执行中 + 排队中) 的请求数
+        self.stats = {"accepted": 0, "rejected": 0, "queue_timeouts": 0, "completed": 0,
+                      "errors": 0, "timeouts": 0, "disconnects": 0}
+
+    # --- ASGI 入口 ---
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[[], Awaitable[Dict[str, Any]]],
+                       send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._route(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.system is not None:
+                    await self.system.aclose()
+                print(f"[Server] 服务停止。{self._stats_line()}")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self):
+        """组装 Agent 系统 (同步构建放到线程中执行，不阻塞事件循环)。"""
+        if self.system is None:
+            self.system = await asyncio.to_thread(self.system_builder)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        print(f"[Server] ✅ 系统已就绪 (并发上限 {self.max_concurrency}，排队上限 {self.max_queue})。")
+
+    async def _route(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        if path == "/healthz" and method == "GET":
+            await self._send_json(send, 200 if self.system is not None else 503, {"ready": self.system is not None})
+        elif path == "/stats" and method == "GET":
+            await self._send_json(send, 200, {**self.stats, "admitted": self._admitted,
+                                              "summary": self.system.summary() if self.system else ""})
+        elif path == "/query":
+            if method != "POST":
+                await self._send_json(send, 405, {"error": "只支持 POST"})
+            else:
+                await self._handle_query(receive, send)
+        else:
+            await self._send_json(send, 404, {"error": f"未知路径: {path}"})
+
+    # --- /query ---
+
+    async def _handle_query(self, receive, send):
+        if self.system is None or self._slots is None:
+            await self._send_json(send, 503, {"error": "系统尚未就绪"})
+            return
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_json(send, 413, {"error": f"请求体超过 {self.max_body_bytes} 字节"})
+            return
+        try:
+            query = json.loads(body or b"{}").get("input", "")
+        except (ValueError, AttributeError):
+            query = None
+        if not isinstance(query, str) or not query.strip():
+            await self._send_json(send, 400, {"error": "请求体需为 JSON，且包含非空字符串字段 'input'"})
+            return
+
+        # 准入控制：执行中 + 排队中的请求已满时立即拒绝，而不是无限排队拖慢所有请求
+        if self._admitted >= self.max_concurrency + self.max_queue:
+            self.stats["rejected"] += 1
+            await self._send_json(send, 429, {"error": "服务繁忙，请稍后重试"}, [(b"retry-after", b"1")])
+            return
+        self._admitted += 1
+        self.stats["accepted"] += 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                self.stats["queue_timeouts"] += 1
+                await self._send_json(send, 503, {"error": "排队超时，请稍后重试"}, [(b"retry-after", b"1")])
+                return
+            try:
+                await self._stream_query(query, receive, send)
+            finally:
+                self._slots.release()
+        finally:
+            self._admitted -= 1
+
+    async def _stream_query(self, query: str, receive, send):
+        """以 NDJSON 流返回执行过程；客户端断开时取消流程，超过 request_timeout_seconds 时发出 error 事件。"""
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson; charset=utf-8"), (b"cache-control", b"no-cache")]})
+        stream_task = asyncio.ensure_future(self._stream_events(query, send))
+        disconnect_task = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait({stream_task, disconnect_task}, timeout=self.request_timeout_seconds,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if stream_task in done:
+                stream_task.result()
+            else:
+                stream_task.cancel()
+                await asyncio.gather(stream_task, return_exceptions=True)
+                if disconnect_task in done:
+                    self.stats["disconnects"] += 1
+                    return
+                self.stats["timeouts"] += 1
+                await self._send_line(send, {"type": "error", "error": f"超过 {self.request_timeout_seconds}s 未完成"})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            disconnect_task.cancel()
+
+    async def _stream_events(self, query: str, send):
+        initial_state = {"input": query, "query": query, "output": "", "decision": "", "stream": True}
+        final = {"type": "final", "output": None, "decision": None}
+        try:
+            # 截止时间随上下文传递给所有模型调用：无法在期限内完成的调用会被提前拒绝
+            with deadline_scope(self.request_timeout_seconds):
+                async for mode, chunk in self.system.app_flow.astream(initial_state, stream_mode=["updates", "custom"]):
+                    if mode == "custom":
+                        await self._send_line(send, chunk)
+                        continue
+                    for node, update in chunk.items():
+                        update = update or {}
+                        await self._send_line(send, {"type": "node", "node": node, "decision": update.get("decision")})
+                        if update.get("decision"):
+                            final["decision"] = update["decision"]
+                        if update.get("output"):
+                            final["output"] = update["output"]
+        except Exception as e:
+            self.stats["errors"] += 1
+            await self._send_line(send, {"type": "error", "error": f"{e.__class__.__name__}: {e}"})
+            return
+        self.stats["completed"] += 1
+        await self._send_line(send, final)
+
+    # --- 工具方法 ---
+
+    async def _read_body(self, receive) -> bytes | None:
+        """读取完整请求体；超过 max_body_bytes 时返回 None。"""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def _send_line(send, payload: Dict[str, Any]):
+        line = json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+        await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: Dict[str, Any], headers: list | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                                (b"content-length", str(len(body)).encode())] + (headers or [])})
+        await send({"type": "http.response.body", "body": body})
+
+    def _stats_line(self) -> str:
+        s = self.stats
+        return (f"接受 {s['accepted']}，拒绝 (429) {s['rejected']}，排队超时 {s['queue_timeouts']}，完成 {s['completed']}，"
+                f"失败 {s['errors']}，超时 {s['timeouts']}，客户端断开 {s['disconnects']}")
+
+
+def create_app(config_path: str = 'config/config.yaml', agent_key: str = "primary_router") -> AgentServer:
+    """创建 ASGI 应用；服务参数读取 config.yaml 中的 server 块。"""
+    from config.config import load_config
+    full_config = load_config(config_path)
+    return AgentServer(lambda: AgentSystem(full_config, agent_key), full_config.get("server"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LangGraph Agent HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认仅本机)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--agent", default="primary_router", help="顶层 Agent 的配置键")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ 错误: 运行 HTTP 服务需要安装 uvicorn (pip install uvicorn)。")
+        raise
+    uvicorn.run(create_app(args.config, args.agent), host=args.host, port=args.port, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
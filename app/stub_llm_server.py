@@ -0,0 +1,115 @@
+"""
+本地桩 LLM 服务：兼容 OpenAI Chat Completions 接口 (POST /v1/chat/completions，支持 stream=True 的 SSE)，
+用于在没有真实模型服务时联调 / 压测 app.server。把 config.yaml 中 pipeline_url 指向它即可：
+
+    python -m app.stub_llm_server --port 8001 --first-token-ms 200 --token-ms 20
+    # config.yaml: summary_model.pipeline_url: "http://127.0.0.1:8001/v1"
+
+响应内容为固定模板 (回显用户消息的前若干字符)，按 --token-ms 间隔逐字输出，
+--first-token-ms 模拟首个 token 之前的预填充延迟。
+"""
+from typing import Dict, Any, List
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+
+class StubLLMServer:
+    """纯 ASGI 应用，模拟一个 OpenAI 兼容的 Chat Completions 服务。"""
+    def __init__(self, first_token_ms: float = 200.0, token_ms: float = 20.0, max_tokens: int = 64):
+        self.first_token_seconds = first_token_ms / 1000
+        self.token_seconds = token_ms / 1000
+        self.max_tokens = max_tokens
+        self.stats = {"requests": 0, "streaming": 0}
+
+    def _reply_tokens(self, messages: List[Dict[str, Any]]) -> List[str]:
+        prompt = messages[-1].get("content", "") if messages else ""
+        text = f"[桩模型回复] 已收到问题：{prompt[:20]}"
+        return list(text)[:self.max_tokens]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["method"] != "POST" or scope["path"] != "/v1/chat/completions":
+            await self._send_json(send, 404, {"error": {"message": f"unknown route {scope['path']}"}})
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        request = json.loads(body or b"{}")
+        self.stats["requests"] += 1
+        model = request.get("model", "stub")
+        tokens = self._reply_tokens(request.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        await asyncio.sleep(self.first_token_seconds)
+        if not request.get("stream", False):
+            await asyncio.sleep(self.token_seconds * len(tokens))
+            await self._send_json(send, 200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+            return
+
+        # 流式：Server-Sent Events，每个 token 一个 chat.completion.chunk，最后发送 [DONE]
+        self.stats["streaming"] += 1
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+
+        async def event(delta: Dict[str, Any], finish_reason: str | None = None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            payload = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await send({"type": "http.response.body", "body": payload.encode("utf-8"), "more_body": True})
+
+        await event({"role": "assistant", "content": ""})
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(self.token_seconds)
+            await event({"content": token})
+        await event({}, "stop")
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n", "more_body": False})
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地桩 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="首个 token 之前的延迟 (毫秒)")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="相邻 token 之间的延迟 (毫秒)")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ 错误: 运行桩 LLM 服务需要安装 uvicorn (pip install uvicorn)。")
+        raise
+    uvicorn.run(StubLLMServer(args.first_token_ms, args.token_ms, args.max_tokens), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-from typing import Dict, Any, Type, List
+from typing import Dict, Any, Type, List, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import threading
 # 导入所有工厂
-from factory.llm_factory import BaseFactory, LLMFactory
+from factory.llm_factory import BaseFactory, ComponentRegistry, LLMFactory
 from factory.tools_factory import ToolsFactory
 from factory.rag_factory import RAGFactory # 导入 RAGFactory
 # 导入抽象接口和所有具体 Agent 实现
@@ -14,23 +17,93 @@ AGENT_MAP: Dict[str, Type[AbstractAgent]] = {
     "calculator": CalculatorAgent, # 新增 Calculator Tool Agent
 }
 
+class LazyComponent:
+    """
+    延迟解析的依赖代理：注入到 Agent 中时并不创建真实组件，
+    首次访问其属性 (如调用 generate / run / hybrid_search) 时才通过工厂创建并缓存。
+    declared 为配置中已知的静态属性 (如执行 Agent 的 consumes_tools)，解析之前访问它们不会触发创建。
+    """
+    __slots__ = ("_label", "_resolver", "_declared", "_context", "_instance", "_lock")
+
+    def __init__(self, label: str, resolver: Callable[[], Any], declared: Dict[str, Any] | None = None):
+        object.__setattr__(self, "_label", label)
+        object.__setattr__(self, "_resolver", resolver)
+        object.__setattr__(self, "_declared", dict(declared or {}))
+        # 记录创建代理时的上下文 (包含流程图作用域)，保证延迟解析时作用域一致
+        object.__setattr__(self, "_context", contextvars.copy_context())
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    print(f"  [Factory] ⏳ 首次使用，正在延迟创建依赖: {self._label}")
+                    object.__setattr__(self, "_instance", self._context.copy().run(self._resolver))
+        return self._instance
+
+    @property
+    def is_resolved(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._instance is None:
+            if name in self._declared:
+                return self._declared[name]
+            # 内省探测 (如 LangGraph 编译流程图时检查 __self__ / __wrapped__) 不应触发创建
+            if name.startswith("__") and name.endswith("__"):
+                raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._resolve(), name, value)
+
+    def __bool__(self) -> bool:
+        # 依赖存在性检查 (if not self.llm) 不应触发创建
+        return True
+
+    def __repr__(self) -> str:
+        state = "resolved" if self.is_resolved else "pending"
+        return f"<LazyComponent {self._label} ({state})>"
+
+
 class AgentFactory(BaseFactory):
     """
     Agent Factory：负责组装 Agent 流程。
     它依赖于 LLMFactory 和 ToolsFactory 来获取组件。
     """
-    def __init__(self, full_config: Dict[str, Any], llm_factory: LLMFactory, tools_factory: ToolsFactory, rag_factory: RAGFactory):
-        super().__init__(full_config)
+    def __init__(self, full_config: Dict[str, Any], llm_factory: LLMFactory, tools_factory: ToolsFactory, rag_factory: RAGFactory,
+                 registry: ComponentRegistry | None = None):
+        # 默认与 LLMFactory 共享同一个实例注册表
+        super().__init__(full_config, registry if registry is not None else llm_factory.registry)
         # 依赖注入：将其他工厂注入到 AgentFactory 中
         self.llm_factory = llm_factory
         self.tools_factory = tools_factory
         self.rag_factory = rag_factory
 
+        # 组装策略 (config.yaml 中的 assembly 块)
+        assembly_config = full_config.get("assembly") or {}
+        # lazy: 依赖以 LazyComponent 代理注入，首次使用时才创建 (可被单个 Agent 的 lazy 配置覆盖)
+        self.lazy = bool(assembly_config.get("lazy", False))
+        # prewarm_workers > 1: 非延迟模式下，先并发预构建相互独立的依赖子树
+        self.prewarm_workers = int(assembly_config.get("prewarm_workers", 1))
+
+    def _dependency(self, label: str, resolver: Callable[[], Any], lazy: bool) -> Any:
+        """根据组装模式返回真实依赖实例或延迟代理。"""
+        return LazyComponent(label, resolver) if lazy else resolver()
+
     # 递归调用辅助函数
-    def _get_executor_agents_instances(self, executor_keys: List[str]) -> Dict[str, AbstractAgent]:
+    def _get_executor_agents_instances(self, executor_keys: List[str], lazy: bool = False) -> Dict[str, AbstractAgent]:
         """递归获取所有子执行 Agent 实例。"""
         executor_agents_instances = {}
         for exec_key in executor_keys:
+            if lazy:
+                # 上层 Agent 在组装时需要知道执行 Agent 消费哪些预取工具，直接取自其配置块，不触发创建
+                exec_config = (self.config.get("agents") or {}).get(exec_key) or {}
+                executor_agents_instances[exec_key] = LazyComponent(
+                    f"agents.{exec_key}", lambda k=exec_key: self.get_instance(k),
+                    {"consumes_tools": list(exec_config.get("consumes_tools", []))})
+                continue
             # 关键：递归调用自身，获取子 Agent 实例
             # 如果这里的子 Agent 实例化失败，整个过程将中断
             print(f"  [Factory] ↳ 正在递归实例化子 Agent: {exec_key}...")
@@ -63,13 +136,96 @@ class AgentFactory(BaseFactory):
         if not AgentClass:
             raise ValueError(f"不支持的 Agent 类型: {agent_type}")
         
+        is_top_level = self.registry.current_graph() is None
+
+        # 顶层调用会开启一个新的流程图作用域，递归创建的子 Agent 复用同一作用域
+        with self.registry.graph_scope(component_key):
+            if is_top_level and not self._is_lazy(agent_component_config) and self.prewarm_workers > 1:
+                self.prewarm(component_key)
+            return self._get_or_create(
+                config_key, component_key, agent_component_config,
+                lambda: self._build_agent(component_key, agent_type, AgentClass, agent_component_config),
+            )
+
+    def _is_lazy(self, agent_component_config: Dict[str, Any]) -> bool:
+        return bool(agent_component_config.get("lazy", self.lazy))
+
+    def _collect_dependency_levels(self, component_key: str) -> List[List[Tuple[str, str]]]:
+        """
+        遍历 Agent 依赖图，按层返回需要构建的组件 (配置块, 组件键)。
+        第 0 层为 LLM / Tools / RAG 等叶子组件，之后每层为仅依赖更低层的 Agent。
+        同一层内的组件相互独立，可以并发构建。
+        """
+        agent_section = self.config.get("agents") or {}
+        depth: Dict[str, int] = {}
+        leaves: List[Tuple[str, str]] = []
+
+        def visit(agent_key: str, path: Tuple[str, ...]) -> int:
+            if agent_key in path:
+                raise RuntimeError(f"Agent 依赖存在循环: {' -> '.join(path + (agent_key,))}")
+            if agent_key in depth:
+                return depth[agent_key]
+            dependencies = (agent_section.get(agent_key) or {}).get("dependencies") or {}
+            if dependencies.get("llm_key"):
+                leaves.append(("llm", dependencies["llm_key"]))
+            leaves.extend(("tools", tool_key) for tool_key in dependencies.get("tools_keys", []))
+            if dependencies.get("rag_key"):
+                leaves.append(("rag", dependencies["rag_key"]))
+            if dependencies.get("embed_key"):
+                leaves.append(("embedding", dependencies["embed_key"]))
+            child_depths = [visit(k, path + (agent_key,)) for k in dependencies.get("executor_keys", [])]
+            depth[agent_key] = 1 + max(child_depths, default=0)
+            return depth[agent_key]
+
+        visit(component_key, ())
+        levels: List[List[Tuple[str, str]]] = [list(dict.fromkeys(leaves))]
+        for level in range(1, max(depth.values()) + 1):
+            levels.append([("agents", k) for k, d in depth.items() if d == level])
+        return levels
+
+    def prewarm(self, component_key: str, max_workers: int | None = None):
+        """
+        并发预构建 Agent 依赖图中相互独立的子树 (逐层构建，层内并发)。
+        构建结果登记在共享注册表中，随后的 get_instance 直接复用。
+        仅对 singleton / graph 作用域的组件有效。
+        """
+        workers = max_workers or max(self.prewarm_workers, 1)
+        factories = {
+            "llm": self.llm_factory,
+            "tools": self.tools_factory,
+            "rag": self.rag_factory,
+            "embedding": self.rag_factory.embed_factory,
+            "agents": self,
+        }
+        levels = self._collect_dependency_levels(component_key)
+        # 根 Agent 由调用方自行创建，这里只预构建其依赖
+        levels = [[item for item in level if item != ("agents", component_key)] for level in levels]
+        print(f"  [Factory] 🚀 并发预构建 '{component_key}' 的依赖图 ({sum(map(len, levels))} 个组件, {workers} 个线程)...")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prewarm") as pool:
+            for level in levels:
+                # 每个任务复制一份当前上下文，使工作线程处于同一流程图作用域中
+                futures = {
+                    item: pool.submit(contextvars.copy_context().run, factories[item[0]].get_instance, item[1])
+                    for item in level
+                }
+                for (section, key), future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"  [Factory] ❌ 严重错误: 预构建 '{section}.{key}' 失败。")
+                        raise RuntimeError(f"预构建 '{section}.{key}' 失败，无法继续组装 '{component_key}'。原始错误: {e}")
+
+    def _build_agent(self, component_key: str, agent_type: str, AgentClass: Type[AbstractAgent], agent_component_config: Dict[str, Any]) -> AbstractAgent:
+        """按配置解析依赖并实例化 Agent。"""
         print(f"\n--- 正在组装 Agent: {component_key} (Type: {agent_type}) ---")
 
         # 2. 从配置中提取依赖组件的 key
-        dependencies = agent_component_config.get("dependencies", [])
+        dependencies = agent_component_config.get("dependencies", {})
         llm_dependency_key = dependencies.get("llm_key")
         tools_dependency_keys = dependencies.get("tools_keys", [])
         rag_dependency_key = dependencies.get("rag_key")
+        embed_dependency_key = dependencies.get("embed_key")
         # 🆕 新增：提取子 Agent 依赖的 key
         executor_keys = dependencies.get("executor_keys", [])
         
@@ -79,25 +235,36 @@ class AgentFactory(BaseFactory):
 
         # 3. 通过注入的工厂获取依赖实例，并存入字典
         agent_dependencies = {} # 用于存储最终传递给 Agent 构造函数的所有依赖
+        # 延迟模式下，依赖以代理形式注入，直到首次使用才真正创建
+        lazy = self._is_lazy(agent_component_config)
 
         if llm_dependency_key:
             # 依赖注入 LLM
-            agent_dependencies['llm'] = self.llm_factory.get_instance(llm_dependency_key)
+            agent_dependencies['llm'] = self._dependency(
+                f"llm.{llm_dependency_key}", lambda: self.llm_factory.get_instance(llm_dependency_key), lazy)
 
         # 依赖注入 Tools (字典)
         tools_instances = {}
         for tool_key in tools_dependency_keys:
-            tools_instances[tool_key] = self.tools_factory.get_instance(tool_key)
+            tools_instances[tool_key] = self._dependency(
+                f"tools.{tool_key}", lambda k=tool_key: self.tools_factory.get_instance(k), lazy)
         agent_dependencies['tools'] = tools_instances
             
        # 依赖注入 RAG Module
         if rag_dependency_key:
-            agent_dependencies['rag_module'] = self.rag_factory.get_instance(rag_dependency_key)
+            agent_dependencies['rag_module'] = self._dependency(
+                f"rag.{rag_dependency_key}", lambda: self.rag_factory.get_instance(rag_dependency_key), lazy)
+
+        # 依赖注入 Embedding 模型 (例如路由器的意图质心分类)，通过 RAGFactory 持有的 EmbeddingFactory 获取
+        if embed_dependency_key:
+            agent_dependencies['embedding'] = self._dependency(
+                f"embedding.{embed_dependency_key}",
+                lambda: self.rag_factory.embed_factory.get_instance(embed_dependency_key), lazy)
             
         # 依赖注入子 Agent 实例 (执行器)
         
         if executor_keys:
-             agent_dependencies['executor_agents'] = self._get_executor_agents_instances(executor_keys)
+             agent_dependencies['executor_agents'] = self._get_executor_agents_instances(executor_keys, lazy)
 
         # 4. 始终注入 Agent 自身的配置
         agent_dependencies['config'] = agent_component_config
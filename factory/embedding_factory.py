@@ -3,6 +3,7 @@ from typing import Dict, Type
 from factory.llm_factory import BaseFactory 
 from models.llm_abc import AbstractEmbedding 
 from models.implementations import OpenAIEmbeddingsModel, HuggingFaceEmbeddingsModel # 导入具体实现
+from models.embedding_cache import CachedEmbedding
 
 # 注册表：将配置中的 provider 映射到实际的 Python 类
 EMBEDDING_MAP: Dict[str, Type[AbstractEmbedding]] = {
@@ -19,6 +20,14 @@ class EmbeddingFactory(BaseFactory):
         config_key = "embedding"
         component_config, EmbeddingClass = self._get_config_and_class(config_key, component_key, EMBEDDING_MAP)
         
-        # 实例化并返回 Embedding 对象
-        print(f"\n--- 正在创建 Embedding: {component_key} (Provider: {component_config['provider']}) ---")
-        return EmbeddingClass(component_config)
+        # 实例化 Embedding 对象 (按作用域复用)
+        def build() -> AbstractEmbedding:
+            print(f"\n--- 正在创建 Embedding: {component_key} (Provider: {component_config['provider']}) ---")
+            embedding = EmbeddingClass(component_config)
+            # 配置了 cache 块时，用内容寻址缓存包装 (对调用方透明)
+            cache_config = component_config.get("cache")
+            if cache_config and cache_config.get("enabled", True):
+                embedding = CachedEmbedding(embedding, component_config["name"], cache_config)
+            return embedding
+
+        return self._get_or_create(config_key, component_key, component_config, build)
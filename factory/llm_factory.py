@@ -1,13 +1,126 @@
-from typing import Dict, Any, Type
+from typing import Dict, Any, Type, Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import uuid
 from models.llm_abc import AbstractLLM, AbstractEmbedding
 # 导入具体实现。注意：需要确保 models.implementations 存在且导入路径正确
-from models.implementations import GPTModel, HuggingFacePipelineModel 
+from models.implementations import GPTModel, HuggingFacePipelineModel, HuggingFacePoolModel
+from models.llm_wrappers import CachedLLM, BatchingLLM, ConcurrencyLimitedLLM
+
+class _GraphScope:
+    """
+    一次顶层流程图组装的作用域。"graph" 作用域的实例只保存在这里，不进入注册表：
+    组装结束后随流程图 (以及在该作用域中创建、稍后才解析的延迟代理) 一起被回收，
+    长期运行的进程反复组装流程图也不会在注册表中累积。
+    """
+    __slots__ = ("graph_id", "instances", "key_locks", "lock")
+
+    def __init__(self, graph_id: str):
+        self.graph_id = graph_id
+        self.instances: Dict[tuple, Any] = {}
+        self.key_locks: Dict[tuple, threading.RLock] = {}
+        self.lock = threading.Lock()
+
+
+# 当前正在组装的 Agent 流程图作用域 (用于 "graph" 作用域)
+_CURRENT_GRAPH: ContextVar[_GraphScope | None] = ContextVar("current_graph", default=None)
+
+class ComponentRegistry:
+    """
+    组件实例注册表：按 (配置块, 组件键) 缓存工厂创建的实例，可在所有工厂之间共享。
+    支持三种作用域：
+      - singleton: 整个进程 (注册表) 内只创建一次
+      - graph:     每次组装顶层 Agent 流程图时创建一次，图内共享 (实例由该次组装的作用域持有)
+      - transient: 每次获取都创建新实例 (原有行为)
+    """
+    SCOPES = ("singleton", "graph", "transient")
+
+    def __init__(self):
+        self._instances: Dict[tuple, Any] = {}
+        self._key_locks: Dict[tuple, threading.RLock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def current_graph() -> str | None:
+        """返回当前所在的流程图作用域 ID，不在任何流程图中时返回 None。"""
+        scope = _CURRENT_GRAPH.get()
+        return scope.graph_id if scope is not None else None
+
+    @contextmanager
+    def graph_scope(self, graph_name: str):
+        """
+        进入一个流程图作用域。嵌套调用时复用最外层的作用域，
+        保证同一次组装中的所有 "graph" 作用域组件只创建一次。
+        """
+        if _CURRENT_GRAPH.get() is not None:
+            yield self.current_graph()
+            return
+        token = _CURRENT_GRAPH.set(_GraphScope(f"{graph_name}:{uuid.uuid4().hex[:8]}"))
+        try:
+            yield self.current_graph()
+        finally:
+            _CURRENT_GRAPH.reset(token)
+
+    def get_or_create(self, config_key: str, component_key: str, scope: str, builder: Callable[[], Any]) -> Any:
+        """按作用域返回已缓存的实例，未命中时调用 builder 创建并登记。"""
+        if scope not in self.SCOPES:
+            raise ValueError(f"不支持的组件作用域: {scope}，可选值: {self.SCOPES}")
+
+        graph = _CURRENT_GRAPH.get()
+        # "graph" 作用域在流程图之外退化为 transient
+        if scope == "transient" or (scope == "graph" and graph is None):
+            self.misses += 1
+            return builder()
+
+        key = (config_key, component_key)
+        if scope == "singleton":
+            instances, key_locks, lock = self._instances, self._key_locks, self._lock
+        else:
+            instances, key_locks, lock = graph.instances, graph.key_locks, graph.lock
+        with lock:
+            if key in instances:
+                self.hits += 1
+                print(f"  [Registry] ♻️ 复用已创建的组件: {config_key}.{component_key} (scope: {scope})")
+                return instances[key]
+            key_lock = key_locks.setdefault(key, threading.RLock())
+
+        # 每个键单独加锁：并发获取同一组件时只会构建一次，不同组件之间互不阻塞
+        with key_lock:
+            with lock:
+                if key in instances:
+                    self.hits += 1
+                    return instances[key]
+            instance = builder()
+            with lock:
+                instances[key] = instance
+                self.misses += 1
+            return instance
+
+    def clear(self):
+        """清空注册表 (例如重新加载配置时)。"""
+        with self._lock:
+            self._instances.clear()
+            self._key_locks.clear()
+
 
 class BaseFactory:
     """所有工厂的抽象基类，封装配置注入和通用的实例获取逻辑。"""
-    def __init__(self, full_config: Dict[str, Any]):
+    # 组件配置中未声明 scope 时使用的默认作用域
+    DEFAULT_SCOPE = "singleton"
+
+    def __init__(self, full_config: Dict[str, Any], registry: ComponentRegistry | None = None):
         # 将完整的配置注入到工厂中
         self.config = full_config
+        # 共享实例注册表：传入同一个 registry 即可在多个工厂之间复用组件
+        self.registry = registry if registry is not None else ComponentRegistry()
+
+    def _get_or_create(self, config_key: str, component_key: str, component_config: Dict[str, Any], builder: Callable[[], Any]) -> Any:
+        """根据组件配置中的 scope (默认 singleton) 从注册表获取或创建实例。"""
+        scope = str(component_config.get("scope", self.DEFAULT_SCOPE)).lower()
+        return self.registry.get_or_create(config_key, component_key, scope, builder)
     
     def _get_config_and_class(self, config_key: str, component_key: str, REGISTRY_MAP: Dict[str, Type[Any]]) -> tuple[Dict[str, Any], Type[Any]]:
         """
@@ -42,6 +155,7 @@ class BaseFactory:
 LLM_MAP: Dict[str, Type[AbstractLLM]] = {
     "openai": GPTModel,
     "huggingface": HuggingFacePipelineModel,
+    "huggingface_pool": HuggingFacePoolModel, # 多端点：负载均衡 + 对冲请求 + 故障转移
 }
 
 class LLMFactory(BaseFactory):
@@ -53,6 +167,22 @@ class LLMFactory(BaseFactory):
         config_key = "llm"
         component_config, LLMClass = self._get_config_and_class(config_key, component_key, LLM_MAP)
         
-        # 实例化并返回 LLM 对象，将该组件的配置传入
-        print(f"\n--- 正在创建 LLM: {component_key} (Provider: {component_config['provider']}) ---")
-        return LLMClass(component_config)
+        # 实例化 LLM 对象 (按作用域复用)，将该组件的配置传入
+        def build() -> AbstractLLM:
+            print(f"\n--- 正在创建 LLM: {component_key} (Provider: {component_config['provider']}) ---")
+            llm = LLMClass(component_config)
+            # 可选：微批处理调度 (batching 配置块)，位于缓存内层，缓存命中的请求不进入批处理队列
+            batching_config = component_config.get("batching") or {}
+            if batching_config.get("enabled", False):
+                llm = BatchingLLM(llm, component_config["name"], batching_config)
+            # 可选：自适应并发限制 (limiter 配置块)，位于批处理外层 (排队凑批的时间计入延迟反馈)、缓存内层
+            limiter_config = component_config.get("limiter") or {}
+            if limiter_config.get("enabled", False):
+                llm = ConcurrencyLimitedLLM(llm, component_config["name"], limiter_config)
+            # 可选：响应缓存 + 并发请求合并 (cache 配置块)
+            cache_config = component_config.get("cache") or {}
+            if cache_config.get("enabled", False):
+                llm = CachedLLM(llm, component_config["name"], cache_config)
+            return llm
+
+        return self._get_or_create(config_key, component_key, component_config, build)
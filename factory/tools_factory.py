@@ -18,7 +18,10 @@ class ToolsFactory(BaseFactory):
         config_key = "tools"
         component_config, ToolClass = self._get_config_and_class(config_key, component_key, TOOL_MAP)
 
-        # 实例化并返回 Tool 对象
+        # 实例化 Tool 对象 (按作用域复用)
         # 注意: Tool 依赖于 config 中的 'type' 字段查找类，而不是 'provider'
-        print(f"\n--- 正在创建 Tool: {component_key} (Type: {component_config['type']}) ---")
-        return ToolClass(component_config)
+        def build() -> AbstractTool:
+            print(f"\n--- 正在创建 Tool: {component_key} (Type: {component_config['type']}) ---")
+            return ToolClass(component_config)
+
+        return self._get_or_create(config_key, component_key, component_config, build)
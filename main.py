@@ -1,13 +1,12 @@
-from factory.llm_factory import LLMFactory
-from factory.embedding_factory import EmbeddingFactory
-from factory.tools_factory import ToolsFactory
-from factory.agent_factory import AgentFactory
-from factory.rag_factory import RAGFactory
+from app.bootstrap import AgentSystem
+from app.batch import run_batch
 from config.config import load_config
 from typing import Dict, Any
 from langgraph.graph import StateGraph, END, START 
+import argparse
 import copy 
 import asyncio
+import time
 
 async def run_agent_flow(app_flow: StateGraph, query: str):
     """
@@ -32,7 +31,47 @@ async def run_agent_flow(app_flow: StateGraph, query: str):
         print(f"❌ LangGraph 流程执行失败: {e}")
         print("--------------------------------------------------")
 
-async def main():
+async def run_agent_flow_stream(app_flow: StateGraph, query: str):
+    """
+    以流式方式运行 LangGraph 流程 (astream，stream_mode=["updates", "custom"])：
+      - custom：执行 Agent 通过 stream writer 发出的 LLM 文本片段，到达即打印
+      - updates：每个节点完成时的状态更新 (节点事件)
+    同时统计首个文本片段的延迟 (TTFT) 与总耗时。
+    """
+    initial_state = {"input": query, "query": query, "output": "", "decision": "", "stream": True}
+
+    print(f"\n--- LangGraph 流式调用演示 ---")
+    started = time.perf_counter()
+    first_token_at = None
+    final_output = None
+    in_token_line = False # 当前行是否正在输出文本片段
+    try:
+        async for mode, chunk in app_flow.astream(initial_state, stream_mode=["updates", "custom"]):
+            if mode == "custom" and chunk.get("type") == "token":
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    print(f"  [Stream] {chunk['node']} 开始输出 (TTFT {(first_token_at - started) * 1000:.0f} ms)：")
+                print(chunk["content"], end="", flush=True)
+                in_token_line = True
+            elif mode == "updates":
+                for node, update in chunk.items():
+                    if in_token_line:
+                        print() # 结束文本片段所在的行
+                        in_token_line = False
+                    print(f"  [Stream] 节点完成: {node} (耗时 {(time.perf_counter() - started) * 1000:.0f} ms)")
+                    if update and update.get("output"):
+                        final_output = update["output"]
+
+        print("--------------------------------------------------")
+        print(f"原始输入: {query}")
+        print(f"LangGraph 最终结果:")
+        print(final_output or '[没有最终输出]')
+        print("--------------------------------------------------")
+    except Exception as e:
+        print(f"❌ LangGraph 流程执行失败: {e}")
+        print("--------------------------------------------------")
+
+async def main(mode: str = "stream"):
     """主程序入口，加载配置，初始化工厂并获取所需组件。"""
     
     # --- 1. 加载配置 ---
@@ -42,27 +81,12 @@ async def main():
         print(f"系统启动失败，请检查配置文件 'config/config.yaml' 和依赖库 'pyyaml'. 错误: {e}")
         return
 
-    print("\n--- 系统启动：初始化工厂 ---")
-    
-    # 实例化所有底层工厂
-    llm_factory = LLMFactory(full_config)
-    embed_factory = EmbeddingFactory(full_config)
-    tools_factory = ToolsFactory(full_config)
-    rag_factory = RAGFactory(full_config, embed_factory) # 注入 EmbeddingFactory
-    agent_factory = AgentFactory(full_config, llm_factory, tools_factory, rag_factory)
-
-    # --- 2. 从 Agent Factory 获取核心 Agent 流程 ---
-
-    # 获取主要 Agent 路由器
-    router_agent = agent_factory.get_instance("primary_router")
-
-    # 获取编译后的 LangGraph 流程
-    app_flow = router_agent.get_agent_flow()
-
+    # --- 2. 组装系统：各级工厂 -> 核心 Agent 路由器 -> 编译后的 LangGraph 流程 ---
+    system = AgentSystem(full_config, "primary_router")
+    app_flow = system.app_flow
 
     # --- 3. 从 RAG Factory 获取 RAG 模块并演示 ---
-    # rag_processor = router_agent.rag_module
-    rag_processor = router_agent.rag_executor.rag_module
+    rag_processor = system.rag_module
 
     if rag_processor is None:
         raise RuntimeError("RAG 模块未成功注入到 RouterAgent 中。请检查 AgentFactory 和 config.yaml。")
@@ -77,22 +101,38 @@ async def main():
 
     ]
 
-    # ⚠️ 确保 RAGModule 在使用前被初始化 (数据摄取)
-    print("\n--- 正在初始化 RAG 模块数据 ---")
-    rag_processor.ingest_data(documents_to_ingest)
-    print("--- RAG 模块数据初始化完成 ---\n")
+    # ⚠️ 确保 RAGModule 在使用前被初始化 (数据摄取)；只读快照由离线任务构建，服务进程直接使用
+    if rag_processor.read_only:
+        print(f"\n--- RAG 模块为只读快照 ({rag_processor.__class__.__name__})，跳过数据摄取 ---\n")
+    else:
+        print("\n--- 正在初始化 RAG 模块数据 ---")
+        rag_processor.ingest_data(documents_to_ingest)
+        print("--- RAG 模块数据初始化完成 ---\n")
 
     # --- 4. 运行流程演示 ---
     print("[✔ 架构框架搭建完成]：已进入 LangGraph 流程编排阶段。")
-    
-    # 案例一：CALCULATOR 流程 (路由 -> CalculatorAgent)
-    await run_agent_flow(app_flow, "帮我计算 (12 乘以 5) 加上 3 等于多少？")
+    demo_queries = [
+        "帮我计算 (12 乘以 5) 加上 3 等于多少？",                       # 案例一：CALCULATOR 流程 (路由 -> CalculatorAgent)
+        "帮我查询LLM工厂用于解耦多模型调用，这是什么架构的核心？",       # 案例二：RAG 流程 (路由 -> RAGAgent)
+        "今天天气真好，我们应该去哪里野餐？",                           # 案例三：DEFAULT 流程 (路由 -> END)
+    ]
 
-    # 案例二：RAG 流程 (路由 -> RAGAgent)
-    await run_agent_flow(app_flow, "帮我查询LLM工厂用于解耦多模型调用，这是什么架构的核心？")
-    
-    # 案例三：DEFAULT 流程 (路由 -> END)
-    await run_agent_flow(app_flow, "今天天气真好，我们应该去哪里野餐？")
+    if mode == "batch":
+        # batch: 三个案例并发执行，按输入顺序输出 (大批量查询见 python -m app.batch)
+        async for result in run_batch(app_flow, demo_queries, concurrency=len(demo_queries)):
+            print("--------------------------------------------------")
+            print(f"原始输入: {result['input']} ({result['status']}, {result['latency_ms']} ms)")
+            print(result["output"] or result["error"] or '[没有最终输出]')
+        print("--------------------------------------------------")
+    else:
+        # stream: 边生成边输出 (astream)；invoke: 等待流程结束后输出最终结果 (ainvoke)
+        run_flow = run_agent_flow_stream if mode == "stream" else run_agent_flow
+        for query in demo_queries:
+            await run_flow(app_flow, query)
+
+    # 推测执行统计 (命中 / 取消 / 浪费时间)
+    print(system.summary())
+    await system.aclose()
     
 
 if __name__ == "__main__":
@@ -100,6 +140,11 @@ if __name__ == "__main__":
     if not os.path.exists('config'):
         os.makedirs('config')
     
+    parser = argparse.ArgumentParser(description="LangGraph 多 Agent 流程演示")
+    parser.add_argument("--mode", choices=["stream", "invoke", "batch"], default="stream",
+                        help="stream: 流式输出 LLM 文本片段与节点事件；invoke: 只输出最终结果；batch: 并发执行全部案例")
+    args = parser.parse_args()
+
     # 假设 load_config 函数已定义在 config.config 模块中
     # 运行主函数
-    asyncio.run(main())
+    asyncio.run(main(args.mode))
@@ -1,14 +1,73 @@
-from typing import Dict, Any, List, Type
-from models.llm_abc import AbstractAgent, AbstractLLM, AbstractTool
+from typing import Dict, Any, List, Type, Awaitable
+from models.llm_abc import AbstractAgent, AbstractLLM, AbstractTool, AbstractEmbedding
+from models.intent_classifier import create_intent_pre_classifier
+from models.speculation import SpeculativeTasks
 from rag.rag_module import RAGModule
+from rag.query_cache import SemanticQueryCache
+from rag.context_packer import ContextPacker
 from langgraph.graph import StateGraph, END, START 
+from langgraph.config import get_stream_writer
 # from tools_implementations import SearchTool
 import asyncio
 
 
+def _stream_writer():
+    """获取 LangGraph 自定义流写入器；不在流程执行上下文中 (如直接调用 process) 时返回空操作。"""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
+
+
+async def stream_llm_output(llm: AbstractLLM, prompt: str, node: str, state: Dict[str, Any], **kwargs) -> str:
+    """
+    以流式方式调用 LLM：每个文本片段到达时立即通过 LangGraph 的 custom 流模式发出
+    ({"type": "token", "node": 节点名, "content": 片段})，返回拼接后的完整文本。
+    流程状态中 stream 不为 True 时 (入口不消费文本片段，如 ainvoke / 批量查询) 直接调用 generate，
+    以便经过 BatchingLLM 的批处理；state["priority"] 作为 BatchingLLM 的优先级通道传入。
+    """
+    if state.get("priority"):
+        kwargs["priority"] = state["priority"]
+    if not state.get("stream", False):
+        return await llm.generate(prompt, **kwargs)
+    writer = _stream_writer()
+    chunks = []
+    async for chunk in llm.stream(prompt, **kwargs):
+        chunks.append(chunk)
+        writer({"type": "token", "node": node, "content": chunk})
+    return "".join(chunks)
+
+
+def _is_pending(agent: Any) -> bool:
+    """是否为尚未解析的延迟代理 (访问 is_resolved 本身不会触发创建)。"""
+    return getattr(agent, "is_resolved", True) is False
+
+
+def _agent_label(agent: AbstractAgent) -> str:
+    """用于日志的 Agent 名称；尚未解析的延迟代理只显示其标签，不触发创建。"""
+    if _is_pending(agent):
+        return repr(agent)
+    return agent.name
+
+
+def _executor_node(agent: AbstractAgent):
+    """流程图节点：执行时才访问 agent.process，延迟注入的执行 Agent 在首次被路由选中时才创建。"""
+    async def run(state: Dict[str, Any]) -> Dict[str, Any]:
+        # 用 getattr 取方法：LangGraph 编译时会沿闭包变量的属性访问链 (agent.process) 求值，直接访问会提前触发创建
+        if _is_pending(agent):
+            # 首次创建 (Chroma 客户端、稀疏索引 mmap、Embedding 模型等) 是同步的，放到线程中执行，不阻塞事件循环
+            process = await asyncio.to_thread(getattr, agent, "process")
+        else:
+            process = getattr(agent, "process")
+        return await process(state)
+    return run
+
+
 # --- Agent 实现：RAGAgent (负责执行 RAG 流程) ---
 class RAGAgent(AbstractAgent):
     """专门执行 RAG 流程的 Agent。"""
+    PROMPT_TEMPLATE = "请基于以下上下文，回答用户的问题：{query}\n上下文:\n{context}"
+
     def __init__(self, llm: AbstractLLM, tools: Dict[str, AbstractTool], rag_module: RAGModule | None,config: Dict[str, Any]):
         # 依赖注入：注入 LLM 实例和 Tools 实例
         self.llm = llm
@@ -16,21 +75,101 @@ class RAGAgent(AbstractAgent):
         self.tools = tools
         self.config = config
         self.name = config.get("name", "RAGAgent")
+        # 查询结果缓存：精确 / 近似重复的查询直接返回上次的答案，跳过检索与 LLM 总结
+        cache_config = config.get("result_cache") or {}
+        self.result_cache = SemanticQueryCache(cache_config) if cache_config.get("enabled", False) else None
+        self.top_k = config.get("top_k", 2)
+        # 上下文打包：多取 candidate_k 个候选，去重后按分数贪心装入 token 预算，控制总结模型的 prompt 长度
+        packing_config = config.get("context_packing") or {}
+        self.packer = ContextPacker(packing_config) if packing_config.get("enabled", False) else None
+        self.candidate_k = packing_config.get("candidate_k", max(self.top_k, 8))
+        # 声明本 Agent 会使用的预取工具结果 (路由器只为消费方预取，并通过 state["tool_results"] 传入)
+        self.consumes_tools = list(config.get("consumes_tools", []))
+        # 推测执行：路由器可在意图识别完成前预先启动检索 (见 speculate)
+        self.speculation = SpeculativeTasks(self.name)
         print(f"  [Agent] RAGAgent '{self.name}' 已初始化。")
         print(f"  [Agent] 依赖 LLM: {self.llm.__class__.__name__}")
         print(f"  [Agent] 依赖 RAG Module: {self.rag_module.__class__.__name__}")
         print(f"  [Agent] 依赖 Tools: {list(tools.keys())}")
 
+    def speculate(self, query: str) -> str:
+        """预先启动检索 (流程中的前置步骤)，返回 speculation_id，由 process 通过流程状态认领。"""
+        return self.speculation.start(self._search(query))
+
+    def cancel_speculation(self, speculation_id: str | None):
+        """路由未选中 RAG 分支时取消 / 丢弃预先启动的检索。"""
+        self.speculation.discard(speculation_id)
+
+    def _search(self, query: str) -> Awaitable[List[Any]]:
+        """启用上下文打包时返回带分数的候选 [(Document, 分数)]，否则返回格式化后的 top_k 个结果。"""
+        if self.packer is not None:
+            return self.rag_module.ahybrid_search_with_scores(query, top_k=self.candidate_k)
+        return self.rag_module.ahybrid_search(query, top_k=self.top_k)
+
+    def _context_budget(self, query: str, extra_context: str) -> int:
+        """
+        检索上下文的 token 预算：max_context_tokens 扣除补充上下文 (工具结果)；
+        模型配置了 context_window 时，同时不超过 上下文窗口 - 生成上限 (max_tokens) - prompt 其余部分。
+        """
+        counter = self.packer.counter
+        budget = self.packer.max_context_tokens - counter.count(extra_context)
+        context_window = getattr(self.llm, "context_window", None)
+        if context_window:
+            fixed = counter.count(self.PROMPT_TEMPLATE.format(query=query, context=extra_context))
+            budget = min(budget, context_window - (getattr(self.llm, "max_tokens", None) or 0) - fixed)
+        return max(budget, 0)
+
+    async def _retrieve(self, query: str, speculation_id: str | None) -> List[Any]:
+        task = self.speculation.take(speculation_id)
+        if task is not None:
+            try:
+                context_docs = await task
+                print(f"  [RAG Agent] ⚡ 使用推测执行预先完成的检索结果。")
+                return context_docs
+            except Exception as e:
+                print(f"  [RAG Agent] ⚠️ 推测检索失败 ({e})，重新检索。")
+        return await self._search(query)
+
     async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """执行混合搜索和 LLM 总结。"""
-        query = state.get("input", state.get("query", ""))
-            
+        query = state.get("input") or state.get("query", "")
+        speculation_id = state.get("speculation_id")
+
+        # 先查结果缓存 (数据版本在检索前读取，检索期间发生摄取时该结果会在下次访问时失效)
+        data_version = self.rag_module.version
+        query_vector = None
+        # 缓存以真实的用户输入为键；输入为空 (流程状态未带上 input) 时不读写缓存，避免所有请求共用一个条目
+        use_cache = self.result_cache is not None and bool(query.strip())
+        if use_cache:
+            cached = self.result_cache.get_exact(query, data_version)
+            if cached is not None:
+                print(f"\n[RAG Agent 执行中]：⚡ 查询 '{query[:20]}...' 命中结果缓存 (精确匹配)。")
+                self.cancel_speculation(speculation_id)
+                return {**state, **cached}
+            if self.result_cache.semantic:
+                # 与检索使用同一个 Embedding 模型 (启用 Embedding 缓存时，检索阶段直接复用该向量)
+                query_vector = await self.rag_module.embedder.aembed_query(query)
+                hit = self.result_cache.get_similar(query_vector, data_version)
+                if hit is not None:
+                    print(f"\n[RAG Agent 执行中]：⚡ 查询 '{query[:20]}...' 命中结果缓存 (相似度 {hit[1]:.3f})。")
+                    self.cancel_speculation(speculation_id)
+                    return {**state, **hit[0]}
+
         print(f"\n[RAG Agent 执行中]：正在对查询 '{query[:20]}...' 执行混合搜索...")
-        context_docs = self.rag_module.hybrid_search(query, top_k=2)
-        context = "\n".join(context_docs)
+        context_docs = await self._retrieve(query, speculation_id)
+        # 路由器预取的工具结果 (如 Web 搜索) 作为补充上下文
+        tool_results = state.get("tool_results") or {}
+        extra_context = "".join(
+            f"\n[{tool_name}]：{tool_results[tool_name]}" for tool_name in self.consumes_tools if tool_results.get(tool_name)
+        )
+        if self.packer is not None:
+            context, _ = self.packer.pack(context_docs, self._context_budget(query, extra_context))
+        else:
+            context = "\n".join(context_docs)
+        context += extra_context
         
-        # # 使用 LLM 进行总结
-        final_answer = await self.llm.generate(f"请基于以下上下文，回答用户的问题：{query}\n上下文:\n{context}")
+        # # 使用 LLM 进行总结 (流式输出：首个片段生成后即可展示给用户)
+        final_answer = await stream_llm_output(self.llm, self.PROMPT_TEMPLATE.format(query=query, context=context), "RAG", state)
 
         # # 模拟 RAG 流程
         # final_answer = (
@@ -38,10 +177,13 @@ class RAGAgent(AbstractAgent):
         #     f"的答案是：LLM 工厂用于解耦多模型调用，这是 **工厂模式和依赖注入** 架构的核心。"
         # )
 
-        return {
+        result = {
             "output": f"[RAG 流程完成]\n[检索上下文]：{context}\n[LLM 最终回复]：{final_answer}", 
             "decision": "END" # RAGAgent 流程结束
         }
+        if use_cache:
+            self.result_cache.put(query, result, data_version, query_vector)
+        return {**state, **result}
 
     def get_agent_flow(self) -> Any:
         # 子 Agent 通常被视为父图的一个节点，流程由父图定义，但我们仍然需要实现抽象方法
@@ -57,11 +199,12 @@ class CalculatorAgent(AbstractAgent):
         # 为了执行 Tool，我们需要工具的引用
         self.tools = tools 
         self.name = config.get("name", "CalculatorAgent")
+        self.consumes_tools = list(config.get("consumes_tools", []))
         print(f"  [Agent] CalculatorAgent '{self.name}' 已初始化。")
         
     async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """执行数学计算并返回结果。"""
-        query = state.get("input", state.get("query", ""))
+        query = state.get("input") or state.get("query", "")
         
         # ⚠️ 添加执行日志和结果
         print(f"\n[Calculator Agent 执行中]：意图识别为计算，正在执行 Tool 调用...")
@@ -69,8 +212,13 @@ class CalculatorAgent(AbstractAgent):
         # 模拟 Tool 运行结果
         tool_result = await self.tools['math_solver'].run("12 * 5 + 3") # 假设工具能直接计算表达式
 
+        # 使用 LLM 把计算结果整理成面向用户的回复 (流式输出)
+        final_answer = await stream_llm_output(
+            self.llm, f"用户的问题：{query}\n工具计算结果：{tool_result}\n请用一句话向用户说明计算结果。", "CALCULATOR", state
+        )
+
         # 必须返回包含 'output' 键的状态
-        return {"output": f"✅ Calculator 流程执行成功：计算查询 '{query[:10]}...' 的结果是：{tool_result}"}
+        return {**state, "output": f"✅ Calculator 流程执行成功：计算查询 '{query[:10]}...' 的结果是：{tool_result}\n[LLM 最终回复]：{final_answer}"}
     
     def get_agent_flow(self) -> Any:
         # 简单返回 process 方法
@@ -82,12 +230,15 @@ class RouterAgent(AbstractAgent):
     Agent 路由器：模拟根据用户输入进行意图识别和流程选择。
     现在它注入了子 Agent 实例，并将执行逻辑委托给它们。
     """
+    # 路由键 (与 get_agent_flow 中的条件边一致)
+    ROUTES = ("CALCULATOR", "RAG", "DEFAULT")
     # def __init__(self, llm: AbstractLLM, tools: Dict[str, AbstractTool], rag_module: RAGModule, 
     #              config: Dict[str, Any], **executor_agents: AbstractAgent): # ⬅️ 注入子 Agent
     def __init__(self, llm: AbstractLLM, tools: Dict[str, AbstractTool], 
                  #rag_module: RAGModule, 
                  config: Dict[str, Any],
-                 executor_agents: Dict[str, AbstractAgent]):
+                 executor_agents: Dict[str, AbstractAgent],
+                 embedding: AbstractEmbedding | None = None):
         
         # 依赖注入：注入 LLM 实例, Tools 集合, RAG 模块
         self.llm = llm
@@ -96,6 +247,19 @@ class RouterAgent(AbstractAgent):
         self.config = config
         self.name = config.get("name", "DefaultRouter")
         self.executor_agents = executor_agents
+        # 本地意图预分类 (规则 -> Embedding 质心)：置信度达到 routing_threshold 时不调用 LLM
+        self.routing_threshold = config.get("routing_threshold", 0.8)
+        self.pre_classifier = create_intent_pre_classifier(config.get("pre_classifier"), embedding, self.routing_threshold)
+        # 推测执行：意图识别的同时预先启动这些分支的前置步骤 (目前支持 RAG 检索)
+        speculation_config = config.get("speculation") or {}
+        self.speculative_branches = set(speculation_config.get("branches", ["RAG"])) if speculation_config.get("enabled", False) else set()
+        # 工具预取策略：tool_prefetch.<工具名>.enabled 为 true 时与意图识别并发启动该工具，
+        # 路由选中的执行 Agent 在 consumes_tools 中声明了该工具才等待其结果，否则立即取消
+        self.tool_prefetch = {
+            tool_name: policy for tool_name, policy in (config.get("tool_prefetch") or {}).items()
+            if (policy or {}).get("enabled", False) and tool_name in tools
+        }
+        self.tool_tasks = SpeculativeTasks(f"{self.name}:tools")
 
         # 强制检查关键子 Agent 是否存在 (根据 config.yaml 中的 key)
         required_keys = ["rag_executor", "calc_executor"]
@@ -114,12 +278,45 @@ class RouterAgent(AbstractAgent):
             # 修正：捕获运行时错误（这是上一个问题中解决的逻辑）
             raise RuntimeError(f"RouterAgent 启动失败：缺少必要的执行 Agent: {missing_executors}。")
 
+        # 路由键 -> 执行 Agent (DEFAULT 直接结束，不消费任何工具)
+        self.route_executors: Dict[str, AbstractAgent] = {"RAG": self.rag_executor, "CALCULATOR": self.calc_executor}
+        # 没有任何执行 Agent 消费的工具不做预取
+        consumed = {tool for agent in self.route_executors.values() for tool in getattr(agent, "consumes_tools", [])}
+        for tool_name in [tool for tool in self.tool_prefetch if tool not in consumed]:
+            print(f"  [Agent] ⚠️ 预取工具 '{tool_name}' 没有执行 Agent 在 consumes_tools 中声明，已忽略。")
+            del self.tool_prefetch[tool_name]
+
         print(f"  [Agent] RouterAgent '{self.name}' 已初始化。")
         print(f"  [Agent] 依赖 LLM: {self.llm.__class__.__name__}")
         print(f"  [Agent] 依赖 Tools: {list(tools.keys())}")
-        print(f"  [Agent] 委托执行 Agents: [RAG: {self.rag_executor.name}, CALC: {self.calc_executor.name}]")
+        print(f"  [Agent] 委托执行 Agents: [RAG: {_agent_label(self.rag_executor)}, CALC: {_agent_label(self.calc_executor)}]")
+        print(f"  [Agent] 预取工具: {list(self.tool_prefetch) or '无'}")
 
 
+    async def _classify(self, user_input: str, prompt_llm: str) -> str:
+        """意图识别：本地预分类置信度足够时直接返回，否则回退到 LLM。"""
+        # 1. 本地预分类：置信度足够时直接路由，省去一次 LLM 往返
+        prediction = await self.pre_classifier.classify(user_input) if self.pre_classifier else None
+        if prediction is not None and prediction[0] in self.ROUTES:
+            decision, confidence, stage = prediction
+            print(f"  [Router Agent 预分类]: {stage} 阶段识别为 {decision} (置信度 {confidence:.2f})，跳过 LLM 调用。")
+            return decision
+
+        # 2. 回退到 LLM 意图识别
+        # 意图 Prompt 是固定模板 + 用户输入，相同输入的结果可以安全复用 (由 CachedLLM 缓存 / 合并)
+        decision_raw = await self.llm.generate(prompt_llm, cacheable=True)
+        print(f"  [Router Agent LLM 原生响应]: {decision_raw}") # 打印 LLM 的原生响应
+
+        # 规范化 decision：转换为大写并去除空格
+        decision = decision_raw.strip().upper()
+
+        # 确保 decision 是预期的路由键
+        if 'CALCULATOR' in decision:
+            return "CALCULATOR"
+        elif 'RAG' in decision:
+            return "RAG"
+        return "DEFAULT"
+
     async def process(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """LangGraph 节点的核心处理函数：意图识别和路由决策。"""
         user_input = state.get("input", "")
@@ -129,43 +326,65 @@ class RouterAgent(AbstractAgent):
         prompt_llm = (
             f"原始输入：{user_input}，判断用户意图：如果用户在进行数学计算（例如：多少，等于，加，乘），返回 'CALCULATOR'。如果用户在询问知识或概念（例如：是什么，为什么，介绍），返回 'RAG'。否则返回 'DEFAULT'。请只返回一个单词作为结果。"
         )
-        prompt_web_search = user_input
-        # 第一次调用 LLM 并获取原始响应
-        # 创建协程对象 (注意：这里不加 await，只是创建任务)
-        llm_task = self.llm.generate(prompt_llm)
-        search_tool_task = self.tools['web_search'].run(prompt_web_search)
-        # 结果将按任务在 gather 中的顺序返回
-        decision_raw, search_result = await asyncio.gather(
-            llm_task, 
-            search_tool_task
-        )
+        # 按预取策略启动工具，与意图识别并发执行
+        tool_ids = {
+            tool_name: self.tool_tasks.start(self.tools[tool_name].run(user_input))
+            for tool_name in self.tool_prefetch
+        }
+        # 推测执行：不等路由结果，先启动 RAG 检索；路由未选中 RAG 时取消。
+        # 延迟注入且尚未创建的 RAG Agent 不做推测，否则每个请求 (包括 CALCULATOR / DEFAULT) 都会触发创建
+        speculate = "RAG" in self.speculative_branches and not _is_pending(self.rag_executor)
+        speculation_id = self.rag_executor.speculate(user_input) if speculate else None
 
-        print(f"  [Router Agent LLM 原生响应]: {decision_raw}") # 打印 LLM 的原生响应
-        # 打印搜索结果（用于演示并发已完成）
-        print(f"  [Router Agent 并发 Web 搜索结果]: {search_result[:30]}...")
+        try:
+            decision = await self._classify(user_input, prompt_llm)
+        except BaseException:
+            for tool_id in tool_ids.values():
+                self.tool_tasks.discard(tool_id)
+            if speculation_id is not None:
+                self.rag_executor.cancel_speculation(speculation_id)
+            raise
+        print(f"  [Router Agent 意图]: 识别为 {decision}")
+        # 路由未选中 RAG：立即取消推测检索
+        if speculation_id is not None and decision != "RAG":
+            self.rag_executor.cancel_speculation(speculation_id)
+            speculation_id = None
 
-        # 规范化 decision：转换为大写并去除空格
-        decision = decision_raw.strip().upper()
-    
-        # # 模拟调用 LLM
-        # decision = self.llm.generate(prompt).strip().upper()
+        tool_results = await self._collect_tool_results(tool_ids, decision)
 
+        # 流程状态是单一的 Dict (节点返回值整体替换状态)，必须带上原有字段 (input / stream / priority 等)，
+        # 否则下游执行 Agent 拿不到用户输入与入口设置的标记
+        return {**state, "decision": decision, "tool_results": tool_results, "speculation_id": speculation_id}
+
+    async def _collect_tool_results(self, tool_ids: Dict[str, str], decision: str) -> Dict[str, Any]:
+        """
+        路由确定后处理预取的工具：选中的执行 Agent 声明消费的工具等待结果 (不超过 timeout_seconds)，
+        其余立即取消。工具失败或超时时不写入结果，执行 Agent 按无工具结果继续。
+        """
+        executor = self.route_executors.get(decision)
+        consumed = set(getattr(executor, "consumes_tools", [])) if executor is not None else set()
+        # 先取消不需要的工具，再等待需要的工具
+        for tool_name, tool_id in tool_ids.items():
+            if tool_name not in consumed:
+                self.tool_tasks.discard(tool_id)
+
+        tool_results: Dict[str, Any] = {}
+        for tool_name, tool_id in tool_ids.items():
+            if tool_name not in consumed:
+                continue
+            task = self.tool_tasks.take(tool_id)
+            if task is None:
+                continue
+            try:
+                tool_results[tool_name] = await asyncio.wait_for(task, self.tool_prefetch[tool_name].get("timeout_seconds"))
+                print(f"  [Router Agent 预取工具 {tool_name}]: {str(tool_results[tool_name])[:30]}...")
+            except asyncio.TimeoutError:
+                print(f"  [Router Agent 预取工具 {tool_name}]: ⚠️ 超时，已放弃。")
+            except Exception as e:
+                print(f"  [Router Agent 预取工具 {tool_name}]: ⚠️ 调用失败 ({e})，已忽略。")
+        return tool_results
 
-        # 确保 decision 是预期的路由键
-        if 'CALCULATOR' in decision:
-            decision = "CALCULATOR"
-            
-        elif 'RAG' in decision:
-            decision = "RAG"
-        else:
-            decision = "DEFAULT"
-        
-        print(f"  [Router Agent 意图]: 识别为 {decision}")
 
-        # 确保返回一个字典，这是 LangGraph 的要求
-        return {"decision": decision,"tools": search_result}
-    
-    
     def get_agent_flow(self) -> Any:
         """
         定义 LangGraph 流程图 (Flow)。
@@ -176,8 +395,8 @@ class RouterAgent(AbstractAgent):
         # 1. 添加节点 (节点现在是子 Agent 的 process 方法)
         # 注意：节点名 (CALCULATOR, RAG) 必须与 RouterAgent.process 的返回值对应
         workflow.add_node("route", self.process)
-        workflow.add_node("CALCULATOR", self.calc_executor.process) 
-        workflow.add_node("RAG", self.rag_executor.process)         
+        workflow.add_node("CALCULATOR", _executor_node(self.calc_executor))
+        workflow.add_node("RAG", _executor_node(self.rag_executor))
 
         # 2. 设置起点
         workflow.set_entry_point("route")
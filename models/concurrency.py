@@ -0,0 +1,179 @@
+from typing import Dict, Any, Iterator
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import time
+
+# 当前请求的截止时间 (time.monotonic() 时刻)；由入口 (HTTP 服务 / 批量查询) 设置，
+# 随 contextvars 传递到 LangGraph 节点以及其中的所有模型调用
+_DEADLINE: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class LoadShedError(RuntimeError):
+    """后端过载 (等待队列已满) 或截止时间内无法完成，请求被立即拒绝。"""
+
+
+class DeadlineExceededError(asyncio.TimeoutError):
+    """请求在截止时间内未完成。"""
+
+
+@contextmanager
+def deadline_scope(timeout_seconds: float | None) -> Iterator[None]:
+    """
+    在当前上下文中设置请求截止时间 (timeout_seconds 为 None 时不设置)。
+    嵌套时取更早的截止时间，内层不能放宽外层的期限。
+    """
+    if timeout_seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout_seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_time() -> float | None:
+    """距当前请求截止时间的剩余秒数；未设置截止时间时返回 None。"""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    单个后端的自适应并发限制 (AIMD)：
+      - 执行中的请求数不超过 limit，超出的请求在有界 FIFO 队列 (max_queue) 中等待，队列满时立即拒绝
+      - 请求成功且延迟正常：在接近饱和时加性增长 (每个请求 +1/limit)
+      - 延迟超过基线 * latency_tolerance (或超过 target_latency_ms，且不低于 latency_floor_ms)、超时或失败：
+        乘性下降 (limit * backoff_ratio)；同一批并发请求带回的过载信号只收缩一次
+      - 基线延迟跟踪近期最低延迟 (低于基线时立即更新，高于时缓慢上浮)
+      - 截止时间：剩余时间已不足一次调用的预期延迟时立即拒绝，等待时间不超过剩余时间
+    所有状态只在所属事件循环中访问，无需加锁。
+    """
+    def __init__(self, name: str, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.name = name
+        self.min_limit = config.get("min_limit", 1)
+        self.max_limit = config.get("max_limit", 128)
+        self.limit = float(min(max(config.get("initial_limit", 16), self.min_limit), self.max_limit))
+        self.max_queue = config.get("max_queue", 64)
+        self.latency_tolerance = config.get("latency_tolerance", 2.0)
+        self.backoff_ratio = config.get("backoff_ratio", 0.9)
+        # 低于该延迟的调用不视为过载 (避免极低延迟时的抖动触发收缩)
+        self.latency_floor = config.get("latency_floor_ms", 50) / 1000
+        self.baseline_drift = config.get("baseline_drift", 0.001)
+        target = config.get("target_latency_ms")
+        self.target_latency = target / 1000 if target is not None else None
+
+        self.inflight = 0
+        self._waiters: deque = deque()
+        self._baseline: float | None = None  # 基线 (无排队) 延迟，秒
+        self._expected: float | None = None  # 平滑后的典型延迟，用于截止时间判断
+        self._last_decrease = 0.0            # 上次收缩的时刻 (time.monotonic())
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_deadline": 0,
+                      "deadline_exceeded": 0, "drops": 0, "peak_limit": self.limit, "min_limit_seen": self.limit}
+
+    # --- 准入 ---
+
+    async def acquire(self):
+        """获取一个执行名额；过载或截止时间内无法完成时抛出 LoadShedError / DeadlineExceededError。"""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            self.stats["shed_deadline"] += 1
+            raise DeadlineExceededError(f"[{self.name}] 请求已超过截止时间")
+        if remaining is not None and self._expected is not None:
+            # 预计完成时间 = 排队 (前面的请求按当前上限分批完成) + 一次调用的典型延迟
+            estimated = self._expected * (1 + len(self._waiters) / self.limit)
+            if remaining < estimated:
+                self.stats["shed_deadline"] += 1
+                raise LoadShedError(f"[{self.name}] 剩余 {remaining:.2f}s 不足预计耗时 {estimated:.2f}s，提前拒绝")
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            self.stats["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats["shed_queue_full"] += 1
+            raise LoadShedError(f"[{self.name}] 后端繁忙：执行中 {self.inflight}，排队 {len(self._waiters)} (已满)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), remaining)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时与获得名额同时发生：名额已转交给本请求，归还
+                self._release_slot()
+            waiter.cancel()
+            self.stats["deadline_exceeded"] += 1
+            raise DeadlineExceededError(f"[{self.name}] 排队等待超过截止时间")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.stats["admitted"] += 1
+
+    def _release_slot(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        """按 FIFO 顺序把空出的名额转交给排队的请求 (inflight 由这里代为增加)。"""
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.inflight += 1
+            waiter.set_result(None)
+
+    # --- 反馈 ---
+
+    def release(self, started: float, latency: float | None, dropped: bool = False):
+        """
+        归还名额并根据结果调整 limit。started 为调用开始时刻 (time.monotonic())，latency 为本次调用的延迟 (秒)；
+        dropped=True 表示超时 / 失败 (视为过载信号)。latency 为 None 时只归还名额。
+        """
+        if dropped:
+            self.stats["drops"] += 1
+            self._decrease(started)
+        elif latency is not None:
+            self._observe(started, latency)
+        self._release_slot()
+
+    def _observe(self, started: float, latency: float):
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            # 缓慢上浮：后端本身变慢 (如换用更大的模型) 时基线最终会跟上，但不会被短时的排队延迟带偏
+            self._baseline += (latency - self._baseline) * self.baseline_drift
+        self._expected = latency if self._expected is None else self._expected + (latency - self._expected) * 0.2
+
+        threshold = self.target_latency if self.target_latency is not None else self._baseline * self.latency_tolerance
+        threshold = max(threshold, self.latency_floor)
+        if latency > threshold:
+            self._decrease(started)
+        elif self.inflight * 2 >= self.limit:
+            # 只有接近饱和时才增长，避免低负载下 limit 无意义地膨胀
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.stats["peak_limit"] = max(self.stats["peak_limit"], self.limit)
+
+    def _decrease(self, started: float):
+        # 每个"窗口"只收缩一次：上次收缩之前发出的请求带回的过载信号反映的是旧的上限，忽略
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.stats["min_limit_seen"] = min(self.stats["min_limit_seen"], self.limit)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"[Limiter:{self.name}] 当前上限 {self.limit:.1f} (峰值 {s['peak_limit']:.1f}，最低 {s['min_limit_seen']:.1f})，"
+                f"准入 {s['admitted']}，排队 {s['queued']}，队满拒绝 {s['shed_queue_full']}，截止时间拒绝 {s['shed_deadline']}，"
+                f"等待超时 {s['deadline_exceeded']}，失败 / 超时 {s['drops']}")
@@ -0,0 +1,202 @@
+from typing import Dict, Any, List
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from .llm_abc import AbstractEmbedding
+
+
+class CachedEmbedding(AbstractEmbedding):
+    """
+    内容寻址的 Embedding 缓存包装器，可包装任意 AbstractEmbedding：
+      - 键为 sha256(模型名 + 类型 + 文本)，模型不同则缓存互不干扰；
+        文档与查询分开缓存 (部分模型对查询会附加指令前缀)
+      - 第一层：进程内 LRU (max_entries)
+      - 第二层：SQLite 磁盘缓存 (path)，超过 max_bytes 时按最近访问时间淘汰
+    只有两层都未命中的文本才会调用底层模型，且同一批次内的重复文本只向量化一次。
+    两层均以 float32 数组存储向量 (磁盘层为原始字节)。
+    """
+    def __init__(self, inner: AbstractEmbedding, model_name: str, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.inner = inner
+        self.model_name = model_name
+        self.max_entries = config.get("max_entries", 10000)
+        self.max_bytes = config.get("max_bytes", 1 << 30) # 默认磁盘缓存上限 1 GiB
+        self.path = config.get("path")
+        self.vector_dtype = getattr(inner, "vector_dtype", np.dtype(np.float32))
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+
+        self._conn = None
+        self._disk_bytes = 0
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+        tier = f"LRU({self.max_entries}) + SQLite({self.path})" if self.path else f"LRU({self.max_entries})"
+        print(f"  [Embedding] 已启用 Embedding 缓存: {model_name} [{tier}]")
+
+    def _key(self, text: str, kind: str = "doc") -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    # --- 内存层 ---
+
+    def _memory_get(self, key: str) -> np.ndarray | None:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+        return vector
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        vector.setflags(write=False)  # 缓存条目只读：调用方就地修改返回的数组不会污染缓存
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- 磁盘层 ---
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if not self._conn or not keys:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def _disk_put_many(self, vectors: Dict[str, np.ndarray]):
+        if not self._conn or not vectors:
+            return
+        now = time.time()
+        rows = [(key, vector.tobytes(), now) for key, vector in vectors.items()]
+        with self._conn:
+            for key, blob, _ in rows:
+                previous = self._conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, blob, len(blob), ts) for key, blob, ts in rows],
+            )
+        if self._disk_bytes > self.max_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """按最近访问时间淘汰磁盘缓存，直到占用降到上限的 90%。"""
+        target = int(self.max_bytes * 0.9)
+        with self._conn:
+            while self._disk_bytes > target:
+                rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access LIMIT 64").fetchall()
+                if not rows:
+                    self._disk_bytes = 0
+                    break
+                # 只淘汰降到目标所需的最旧条目，而不是整批 64 条
+                excess = self._disk_bytes - target
+                for count, (_, size) in enumerate(rows, start=1):
+                    excess -= size
+                    if excess <= 0:
+                        rows = rows[:count]
+                        break
+                self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+                self._disk_bytes -= sum(size for _, size in rows)
+                self.stats["evicted"] += len(rows)
+
+    # --- AbstractEmbedding 接口 ---
+
+    def _lookup(self, texts: List[str], kind: str = "doc") -> tuple[List[str], Dict[str, np.ndarray]]:
+        keys = [self._key(text, kind) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory_get(key)
+                if vector is not None:
+                    found[key] = vector
+            self.stats["memory_hits"] += len(found)
+            from_disk = self._disk_get_many([key for key in dict.fromkeys(keys) if key not in found])
+            for key, vector in from_disk.items():
+                self._memory_put(key, vector)
+            self.stats["disk_hits"] += len(from_disk)
+            found.update(from_disk)
+        return keys, found
+
+    def _store(self, new_vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in new_vectors.items():
+                self._memory_put(key, vector)
+            self._disk_put_many(new_vectors)
+            self.stats["misses"] += len(new_vectors)
+
+    def embed_documents_array(self, texts: List[str], dtype: Any = None) -> np.ndarray:
+        keys, found = self._lookup(texts)
+        # 未命中的文本去重后只向量化一次
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.inner.embed_documents_array(list(missing.values()), dtype=np.float32)
+            new_vectors = dict(zip(missing.keys(), vectors))
+            self._store(new_vectors)
+            found.update(new_vectors)
+        if not keys:
+            return np.empty((0, 0), dtype=dtype or self.vector_dtype)
+        # 直接写入预分配的连续数组
+        result = np.empty((len(keys), found[keys[0]].shape[0]), dtype=dtype or self.vector_dtype)
+        for row, key in enumerate(keys):
+            result[row] = found[key]
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_query_array(self, text: str, dtype: Any = None) -> np.ndarray:
+        keys, found = self._lookup([text], kind="query")
+        if keys[0] not in found:
+            found[keys[0]] = self.inner.embed_query_array(text, dtype=np.float32)
+            self._store({keys[0]: found[keys[0]]})
+        return found[keys[0]].astype(dtype or self.vector_dtype)  # 总是返回副本
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_query_array(text).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # 命中内存层时直接返回，不切换线程
+        key = self._key(text, "query")
+        with self._lock:
+            vector = self._memory_get(key)
+            if vector is not None:
+                self.stats["memory_hits"] += 1
+                return vector.tolist()
+        if not self.inner.has_native_async():
+            return await asyncio.to_thread(self.embed_query, text)
+        _, found = await asyncio.to_thread(self._lookup, [text], "query")
+        if key in found:
+            return found[key].tolist()
+        vector = np.asarray(await self.inner.aembed_query(text), dtype=np.float32)
+        await asyncio.to_thread(self._store, {key: vector})
+        return vector.tolist()
+
+    def close(self):
+        if self._conn:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
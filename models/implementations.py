@@ -1,7 +1,90 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Tuple
+from collections import deque
 from openai import AsyncOpenAI
+import httpx
+import numpy as np
 from .llm_abc import AbstractLLM, AbstractEmbedding
 import asyncio
+import random
+import threading
+import time
+
+# --- HTTP 传输层 ---
+
+class HTTPTransportManager:
+    """
+    模型服务的 HTTP 连接池管理：每个 base_url 共享一个 httpx.AsyncClient (keep-alive 连接池)，
+    同一服务的所有模型实例 (以及重复组装的流程图) 复用已建立的连接，避免连接建立出现在请求延迟中。
+    连接池参数来自 llm 配置中的 http 块 (同一 base_url 以第一个配置为准)；
+    进程退出或重新组装系统前调用 aclose() 关闭全部连接。
+    """
+    DEFAULTS: Dict[str, Any] = {
+        "max_connections": 100,           # 连接数上限
+        "max_keepalive_connections": 20,  # 空闲保活连接数上限
+        "keepalive_expiry": 30.0,         # 空闲连接保活时间 (秒)
+        "connect_timeout": 5.0,
+        "read_timeout": 120.0,            # 生成较长文本时需要足够大
+        "write_timeout": 30.0,
+        "pool_timeout": 10.0,             # 等待连接池空闲连接的上限
+        "http2": False,                   # 需要安装 h2 (pip install httpx[http2])
+        "max_retries": 2,                 # OpenAI 客户端的自动重试次数
+    }
+
+    def __init__(self):
+        # base_url -> (共享的 httpx.AsyncClient, 生效的配置)
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def settings(self, http_config: Dict[str, Any] | None) -> Dict[str, Any]:
+        return {**self.DEFAULTS, **(http_config or {})}
+
+    @staticmethod
+    def _timeout(settings: Dict[str, Any]) -> httpx.Timeout:
+        return httpx.Timeout(connect=settings["connect_timeout"], read=settings["read_timeout"],
+                             write=settings["write_timeout"], pool=settings["pool_timeout"])
+
+    def http_client(self, base_url: str, http_config: Dict[str, Any] | None = None) -> httpx.AsyncClient:
+        """返回 base_url 对应的共享连接池 (不存在或已关闭时创建)。"""
+        settings = self.settings(http_config)
+        with self._lock:
+            entry = self._clients.get(base_url)
+            if entry is not None and not entry[0].is_closed:
+                if entry[1] != settings:
+                    print(f"  [HTTP] ⚠️ {base_url} 已存在连接池，沿用首次创建时的配置 (忽略不同的 http 配置)。")
+                return entry[0]
+            limits = httpx.Limits(max_connections=settings["max_connections"],
+                                  max_keepalive_connections=settings["max_keepalive_connections"],
+                                  keepalive_expiry=settings["keepalive_expiry"])
+            try:
+                client = httpx.AsyncClient(limits=limits, timeout=self._timeout(settings), http2=settings["http2"])
+            except ImportError:
+                print(f"  [HTTP] ⚠️ 未安装 h2，{base_url} 回退为 HTTP/1.1 (pip install httpx[http2])。")
+                client = httpx.AsyncClient(limits=limits, timeout=self._timeout(settings))
+            self._clients[base_url] = (client, settings)
+            print(f"  [HTTP] 已创建连接池: {base_url} (连接上限 {settings['max_connections']}, "
+                  f"保活 {settings['max_keepalive_connections']}, HTTP/2: {settings['http2']})")
+            return client
+
+    def openai_client(self, base_url: str, http_config: Dict[str, Any] | None = None, api_key: str = "EMPTY") -> AsyncOpenAI:
+        """创建使用共享连接池的 AsyncOpenAI 客户端 (客户端本身很轻，连接池才是需要复用的部分)。"""
+        http_client = self.http_client(base_url, http_config)
+        settings = self._clients[base_url][1]
+        return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client,
+                           timeout=self._timeout(settings), max_retries=settings["max_retries"])
+
+    async def aclose(self):
+        """关闭全部连接池。之后再次获取客户端时会重新创建。"""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        if clients:
+            print(f"  [HTTP] 已关闭 {len(clients)} 个连接池。")
+
+
+# 进程内共享的传输层 (所有 OpenAI 兼容的模型服务共用)
+transport_manager = HTTPTransportManager()
 
 # --- LLM 实现 ---
 
@@ -11,6 +94,7 @@ class GPTModel(AbstractLLM):
         # 实际项目中，这里会初始化 LangChain 的 ChatOpenAI
         print(f"初始化 GPT 模型: {config['name']} (温度: {config['temperature']})")
         self.model_name = config['name']
+        self.temperature = config.get('temperature', 0.7)
 
     async def generate(self, prompt: str, **kwargs) -> str:
             # ⚠️ 最终修正：硬编码匹配测试用例，确保 LangGraph 路由成功
@@ -42,11 +126,18 @@ class HuggingFacePipelineModel(AbstractLLM):
         self.model_name = config['name']
         self.base_url = config.get('pipeline_url', "http://localhost:8000/v1")
         self.temperature = config.get('temperature', 0.7)
+        # 批量提交方式："completions" 时 generate_batch 使用 /v1/completions 一次提交多个 prompt (vLLM 支持)，
+        # 否则逐个并发调用 Chat Completions
+        self.batch_api = (config.get('batching') or {}).get('api', 'chat')
+        # 单次生成的 token 上限 (None 表示由服务端决定) 与模型上下文窗口 (RAGAgent 据此限制 prompt 长度)
+        self.max_tokens = config.get('max_tokens')
+        self.context_window = config.get('context_window')
         print(f"初始化 Hugging Face 模型: {config['name']} (URL: {config['pipeline_url']})")
 
-        # 1. 初始化 AsyncOpenAI 客户端
-        self.client = AsyncOpenAI(
-            base_url=self.base_url, 
+        # 1. 初始化 AsyncOpenAI 客户端 (同一 pipeline_url 共享连接池，参数见配置中的 http 块)
+        self.client = transport_manager.openai_client(
+            self.base_url,
+            config.get('http'),
             api_key="EMPTY" # vLLM 通常不需要真实的 key
         )
 
@@ -58,12 +149,47 @@ class HuggingFacePipelineModel(AbstractLLM):
             messages=[
                 {"role": "user", "content": prompt}
             ],
-            temperature=self.temperature,
-            # 可以根据需要添加 max_tokens, stop 等参数
+            temperature=kwargs.get("temperature", self.temperature),
+            **self._limit_kwargs(kwargs),
         )
         
         # 4. 返回模型响应的文本内容
         return response.choices[0].message.content
+
+    def _limit_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        return {"max_tokens": max_tokens} if max_tokens is not None else {}
+
+    async def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        if self.batch_api != "completions":
+            return await super().generate_batch(prompts, **kwargs)
+        # Completions 接口接受 prompt 列表，服务端在同一批次中调度；结果按 choice.index 对齐
+        # (该接口不套用对话模板，prompt 按原文送入模型)
+        response = await self.client.completions.create(
+            model=self.model_name,
+            prompt=prompts,
+            temperature=kwargs.get("temperature", self.temperature),
+            max_tokens=kwargs.get("max_tokens", self.max_tokens or 512),
+        )
+        results = [""] * len(prompts)
+        for choice in response.choices:
+            results[choice.index] = choice.text
+        return results
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """流式生成：以 stream=True 调用 Chat Completions，逐个产出增量文本。"""
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=kwargs.get("temperature", self.temperature),
+            stream=True,
+            **self._limit_kwargs(kwargs),
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
         
         # return f"[HuggingFace 模型 {self.model_name} 响应]: {prompt[:20]}..."
         # # 1. 检查是否是计算意图
@@ -81,6 +207,249 @@ class HuggingFacePipelineModel(AbstractLLM):
         #     # 模拟 LLM 返回默认响应，并触发 DEFAULT 路由
         #     return f"[HuggingFace 模型 {self.model_name} 响应]: {prompt[:10]}...这是一个闲聊/默认响应。"
 
+class _Replica:
+    """连接池中的一个端点：底层模型实例 + 负载与健康状态。"""
+    def __init__(self, model: AbstractLLM, url: str):
+        self.model = model
+        self.url = url
+        self.outstanding = 0          # 进行中的请求数 (最少未完成请求负载均衡)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0      # 熔断截止时刻 (time.monotonic())
+        self.stats = {"requests": 0, "errors": 0, "wins": 0}
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class HuggingFacePoolModel(AbstractLLM):
+    """
+    多端点 (多副本) 的 OpenAI 兼容模型服务：
+      - 负载均衡：选择进行中请求最少的健康端点
+      - 对冲请求：主请求超过近期延迟的 percentile 分位 (hedging.percentile) 仍未完成时，
+        向另一个端点发出相同请求，先成功的结果胜出，另一个被取消；对冲比例受 max_hedge_ratio 限制，
+        避免整体变慢时请求量翻倍
+      - 故障转移：端点调用失败时立即改用其他端点；连续失败 max_failures 次的端点熔断 cooldown_seconds 秒
+    流式调用按首个片段对冲：首个片段先到达的端点继续输出，另一个被关闭。
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.model_name = config['name']
+        self.temperature = config.get('temperature', 0.7)
+        self.max_tokens = config.get('max_tokens')
+        self.context_window = config.get('context_window')
+        endpoints = config.get('endpoints') or [config['pipeline_url']]
+        print(f"初始化 Hugging Face 模型池: {config['name']} ({len(endpoints)} 个端点)")
+        self.replicas = [
+            _Replica(HuggingFacePipelineModel({**config, 'pipeline_url': url}), url) for url in endpoints
+        ]
+
+        hedging = config.get('hedging') or {}
+        self.hedging_enabled = hedging.get('enabled', True) and len(self.replicas) > 1
+        self.hedge_percentile = hedging.get('percentile', 95)
+        self.initial_hedge_delay = hedging.get('initial_delay_ms', 1000) / 1000  # 延迟样本不足时使用
+        self.min_hedge_delay = hedging.get('min_delay_ms', 20) / 1000
+        self.max_hedge_ratio = hedging.get('max_hedge_ratio', 0.1)
+        self.min_samples = hedging.get('min_samples', 20)
+        self._latencies: deque = deque(maxlen=hedging.get('window', 512))
+        self._hedge_delay_cache: Tuple[int, float] | None = None # (计算时的样本序号, 延迟)
+        self._samples = 0
+
+        failover = config.get('failover') or {}
+        self.max_failures = failover.get('max_failures', 3)
+        self.cooldown_seconds = failover.get('cooldown_seconds', 10.0)
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    # --- 端点选择与统计 ---
+
+    def _hedge_delay(self) -> float:
+        """对冲等待时间：近期成功请求延迟的 percentile 分位 (每 16 个新样本重新计算一次)。"""
+        if self._samples < self.min_samples:
+            return self.initial_hedge_delay
+        if self._hedge_delay_cache is None or self._samples - self._hedge_delay_cache[0] >= 16:
+            delay = float(np.percentile(np.fromiter(self._latencies, dtype=np.float64), self.hedge_percentile))
+            self._hedge_delay_cache = (self._samples, max(delay, self.min_hedge_delay))
+        return self._hedge_delay_cache[1]
+
+    def _can_hedge(self) -> bool:
+        return self.hedging_enabled and self.stats["hedged"] < self.max_hedge_ratio * self.stats["requests"] + 1
+
+    def _record(self, replica: _Replica, latency: float | None, error: BaseException | None = None):
+        replica.outstanding -= 1
+        if error is not None:
+            replica.stats["errors"] += 1
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.max_failures and replica.healthy(time.monotonic()):
+                replica.ejected_until = time.monotonic() + self.cooldown_seconds
+                print(f"  [LLM Pool] ⚠️ 端点 {replica.url} 连续失败 {replica.consecutive_failures} 次，熔断 {self.cooldown_seconds}s。")
+        elif latency is not None:
+            replica.consecutive_failures = 0
+            self._latencies.append(latency)
+            self._samples += 1
+
+    async def _call(self, replica: _Replica, prompt: str, kwargs: Dict[str, Any]) -> str:
+        replica.outstanding += 1
+        replica.stats["requests"] += 1
+        started = time.monotonic()
+        try:
+            result = await replica.model.generate(prompt, **kwargs)
+        except asyncio.CancelledError:
+            # 对冲落败被取消：不计入延迟样本，也不算失败
+            self._record(replica, None)
+            raise
+        except Exception as e:
+            self._record(replica, None, e)
+            raise
+        self._record(replica, time.monotonic() - started)
+        return result
+
+    # --- 生成 ---
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.stats["requests"] += 1
+        tried: List[_Replica] = []
+        last_error: BaseException | None = None
+        # 每一轮：选一个未尝试过的端点发出请求，超时未完成时对冲；本轮全部失败后故障转移到下一轮
+        while len(tried) < len(self.replicas):
+            primary = self._pick_untried(tried)
+            tried.append(primary)
+            tasks = {asyncio.ensure_future(self._call(primary, prompt, kwargs)): primary}
+            try:
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay() if self._can_hedge() else None)
+                if not done and len(tried) < len(self.replicas):
+                    secondary = self._pick_untried(tried)
+                    tried.append(secondary)
+                    self.stats["hedged"] += 1
+                    tasks[asyncio.ensure_future(self._call(secondary, prompt, kwargs))] = secondary
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            winner = tasks[task]
+                            winner.stats["wins"] += 1
+                            if len(tasks) > 1 and winner is not primary:
+                                self.stats["hedge_wins"] += 1
+                            return task.result()
+                        last_error = task.exception()
+            finally:
+                for task in tasks:
+                    task.cancel()
+            self.stats["failovers"] += 1
+            print(f"  [LLM Pool] ⚠️ 端点调用失败 ({last_error})，尝试其他端点。")
+        raise last_error if last_error is not None else RuntimeError(f"{self.model_name}: 没有可用端点")
+
+    def _pick_untried(self, tried: List[_Replica]) -> _Replica:
+        now = time.monotonic()
+        candidates = [replica for replica in self.replicas if replica not in tried]
+        healthy = [replica for replica in candidates if replica.healthy(now)]
+        pool = healthy or candidates
+        least = min(replica.outstanding for replica in pool)
+        return random.choice([replica for replica in pool if replica.outstanding == least])
+
+    async def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        """批量提交不做对冲 (整批重复的代价过高)，发往负载最低的端点，失败时故障转移。"""
+        last_error: BaseException | None = None
+        tried: List[_Replica] = []
+        while len(tried) < len(self.replicas):
+            replica = self._pick_untried(tried)
+            tried.append(replica)
+            replica.outstanding += 1
+            replica.stats["requests"] += 1
+            try:
+                results = await replica.model.generate_batch(prompts, **kwargs)
+            except asyncio.CancelledError:
+                self._record(replica, None)
+                raise
+            except Exception as e:
+                self._record(replica, None, e)
+                last_error = e
+                self.stats["failovers"] += 1
+                continue
+            self._record(replica, None)
+            replica.consecutive_failures = 0
+            return results
+        raise last_error if last_error is not None else RuntimeError(f"{self.model_name}: 没有可用端点")
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """按首个片段对冲 / 故障转移；开始输出之后不再切换端点。"""
+        self.stats["requests"] += 1
+        winner, first_chunk, replica = await self._open_stream(prompt, kwargs)
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+            async for chunk in winner:
+                yield chunk
+        finally:
+            replica.outstanding -= 1
+            await winner.aclose()
+
+    async def _open_stream(self, prompt: str, kwargs: Dict[str, Any]):
+        """返回 (已产出首个片段的流, 首个片段 或 None (空响应), 端点)。"""
+        tried: List[_Replica] = []
+        last_error: BaseException | None = None
+
+        async def first(replica: _Replica):
+            stream = replica.model.stream(prompt, **kwargs)
+            started = time.monotonic()
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                chunk = None
+            except BaseException:
+                await stream.aclose()
+                raise
+            replica.consecutive_failures = 0
+            self._latencies.append(time.monotonic() - started)
+            self._samples += 1
+            return stream, chunk
+
+        while len(tried) < len(self.replicas):
+            primary = self._pick_untried(tried)
+            tried.append(primary)
+            primary.outstanding += 1
+            primary.stats["requests"] += 1
+            tasks = {asyncio.ensure_future(first(primary)): primary}
+            try:
+                # 对冲等待也在 try 内：调用方在此期间被取消时，同样由 finally 取消任务并归还 outstanding
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay() if self._can_hedge() else None)
+                if not done and len(tried) < len(self.replicas):
+                    secondary = self._pick_untried(tried)
+                    tried.append(secondary)
+                    secondary.outstanding += 1
+                    secondary.stats["requests"] += 1
+                    self.stats["hedged"] += 1
+                    tasks[asyncio.ensure_future(first(secondary))] = secondary
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        replica = tasks.pop(task)
+                        if task.exception() is None:
+                            replica.stats["wins"] += 1
+                            if replica is not primary:
+                                self.stats["hedge_wins"] += 1
+                            stream, chunk = task.result()
+                            return stream, chunk, replica
+                        self._record(replica, None, task.exception())
+                        last_error = task.exception()
+            finally:
+                # 落败 / 未完成的端点：取消并关闭其流
+                for task, replica in tasks.items():
+                    task.cancel()
+                    replica.outstanding -= 1
+                for result in await asyncio.gather(*tasks, return_exceptions=True):
+                    if isinstance(result, tuple):
+                        await result[0].aclose()
+            self.stats["failovers"] += 1
+            print(f"  [LLM Pool] ⚠️ 端点流式调用失败 ({last_error})，尝试其他端点。")
+        raise last_error if last_error is not None else RuntimeError(f"{self.model_name}: 没有可用端点")
+
+    def summary(self) -> str:
+        s = self.stats
+        replicas = "，".join(f"{r.url} (请求 {r.stats['requests']}，失败 {r.stats['errors']}，胜出 {r.stats['wins']})"
+                            for r in self.replicas)
+        return (f"[LLM Pool:{self.model_name}] 请求 {s['requests']}，对冲 {s['hedged']} (对冲胜出 {s['hedge_wins']})，"
+                f"故障转移 {s['failovers']}；{replicas}")
+
 # --- Embedding 实现 ---
 
 class OpenAIEmbeddingsModel(AbstractEmbedding):
@@ -88,10 +457,17 @@ class OpenAIEmbeddingsModel(AbstractEmbedding):
     def __init__(self, config: Dict[str, Any]):
         # 实际项目中，这里会初始化 LangChain 的 OpenAIEmbeddings
         print(f"初始化 OpenAI Embedding 模型: {config['name']}")
+        self.model_name = config['name']
+        # 向量数组的存储精度 (float32 / float16)
+        self.vector_dtype = np.dtype(config.get('dtype', 'float32'))
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str], dtype: Any = None) -> np.ndarray:
+        """直接产出 (len(texts), 1536) 的连续数组，不经过 Python 列表。"""
         print(f"正在使用 OpenAI Embedding 模型对 {len(texts)} 个文本进行向量化...")
-        return [[0.1] * 1536] * len(texts)
+        return np.full((len(texts), 1536), 0.1, dtype=dtype or self.vector_dtype)
 
     def embed_query(self, text: str) -> List[float]:
         """实现查询嵌入。"""
@@ -104,11 +480,18 @@ class HuggingFaceEmbeddingsModel(AbstractEmbedding):
     def __init__(self, config: Dict[str, Any]):
         # 实际项目中，这里会初始化 LangChain 的 HuggingFaceEmbeddings
         print(f"初始化 Hugging Face Embedding 模型: {config['name']}")
+        self.model_name = config['name']
+        # 向量数组的存储精度 (float32 / float16)
+        self.vector_dtype = np.dtype(config.get('dtype', 'float32'))
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str], dtype: Any = None) -> np.ndarray:
+        """直接产出 (len(texts), 1024) 的连续数组，不经过 Python 列表。"""
         print(f"正在使用 Hugging Face Embedding 模型对 {len(texts)} 个文本进行向量化...")
-        # 模拟返回 1024 维度的向量列表 (使用不同的维度模拟不同的模型)
-        return [[0.2] * 1024] * len(texts)
+        # 模拟返回 1024 维度的向量 (使用不同的维度模拟不同的模型)
+        return np.full((len(texts), 1024), 0.2, dtype=dtype or self.vector_dtype)
 
     def embed_query(self, text: str) -> List[float]:
         """实现查询嵌入。"""
@@ -0,0 +1,144 @@
+from typing import Dict, Any, List, Tuple
+import asyncio
+import re
+import threading
+import numpy as np
+from .llm_abc import AbstractEmbedding
+
+# 预测结果：(意图标签, 置信度, 命中的阶段名)
+IntentPrediction = Tuple[str, float, str]
+
+
+class RuleIntentClassifier:
+    """
+    关键词 / 正则规则分类器。每条规则：{label, keywords: [...], patterns: [...], confidence}。
+    只有一个标签的规则命中时给出预测；多个标签同时命中视为歧义，交给后续阶段。
+    """
+    name = "rules"
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = [
+            (
+                rule["label"],
+                [keyword.lower() for keyword in rule.get("keywords", [])],
+                [re.compile(pattern, re.IGNORECASE) for pattern in rule.get("patterns", [])],
+                float(rule.get("confidence", 0.9)),
+            )
+            for rule in rules
+        ]
+
+    def predict(self, text: str) -> IntentPrediction | None:
+        lowered = text.lower()
+        matched: Dict[str, float] = {}
+        for label, keywords, patterns, confidence in self.rules:
+            if any(keyword in lowered for keyword in keywords) or any(pattern.search(text) for pattern in patterns):
+                matched[label] = max(matched.get(label, 0.0), confidence)
+        if len(matched) != 1:
+            return None
+        label, confidence = next(iter(matched.items()))
+        return label, confidence, self.name
+
+
+class CentroidIntentClassifier:
+    """
+    Embedding 最近质心分类器：每个意图的示例句向量化后取平均 (单位化) 作为质心，
+    查询按余弦相似度归入最近的质心。质心在首次使用时计算并缓存。
+    置信度不是原始余弦相似度 (句向量模型下无关句子的相似度也常在 0.8 以上)，
+    而是各质心相似度按 temperature 做 softmax 后第一名的概率：只有明显比其他意图更接近时才高。
+    第一名与第二名的差距小于 min_margin 时置信度直接记为 0。
+    """
+    name = "centroid"
+
+    def __init__(self, embedder: AbstractEmbedding, examples: Dict[str, List[str]], min_margin: float = 0.05,
+                 temperature: float = 0.05):
+        self.embedder = embedder
+        self.examples = {label: list(texts) for label, texts in examples.items() if texts}
+        self.min_margin = min_margin
+        self.temperature = temperature
+        self._labels: List[str] = []
+        self._centroids: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def _ensure_centroids(self) -> np.ndarray:
+        with self._lock:
+            if self._centroids is None:
+                labels = list(self.examples)
+                texts = [text for label in labels for text in self.examples[label]]
+                vectors = self._unit(self.embedder.embed_documents_array(texts, dtype=np.float32))
+                centroids, start = [], 0
+                for label in labels:
+                    count = len(self.examples[label])
+                    centroids.append(vectors[start:start + count].mean(axis=0))
+                    start += count
+                self._labels = labels
+                self._centroids = self._unit(np.asarray(centroids, dtype=np.float32))
+                print(f"  [Intent] 已根据 {len(texts)} 条示例计算 {len(labels)} 个意图质心。")
+            return self._centroids
+
+    def predict_vector(self, query_vector: List[float] | np.ndarray) -> IntentPrediction | None:
+        centroids = self._ensure_centroids()
+        if len(centroids) == 0:
+            return None
+        similarities = centroids @ self._unit(np.asarray(query_vector, dtype=np.float32).reshape(-1))
+        order = np.argsort(-similarities)
+        top = float(similarities[order[0]])
+        margin = top - float(similarities[order[1]]) if len(order) > 1 else top
+        if margin < self.min_margin:
+            return self._labels[order[0]], 0.0, self.name
+        # softmax 概率 (减去最大值保证数值稳定)；只有一个质心时相对置信度无从谈起，退化为相似度本身
+        if len(order) == 1:
+            return self._labels[order[0]], max(top, 0.0), self.name
+        weights = np.exp((similarities - top) / self.temperature)
+        return self._labels[order[0]], float(1.0 / weights.sum()), self.name
+
+
+class IntentPreClassifier:
+    """
+    路由前的本地意图预分类：依次执行规则阶段与质心阶段，返回第一个置信度达到阈值的预测；
+    都未达到时返回 None，由调用方回退到 LLM 意图识别。
+    """
+    def __init__(self, rules: RuleIntentClassifier | None = None, centroid: CentroidIntentClassifier | None = None,
+                 threshold: float = 0.8):
+        self.rules = rules
+        self.centroid = centroid
+        self.threshold = threshold
+        self.stats = {"rules": 0, "centroid": 0, "fallback": 0}
+
+    async def classify(self, text: str) -> IntentPrediction | None:
+        if self.rules is not None:
+            prediction = self.rules.predict(text)
+            if prediction is not None and prediction[1] >= self.threshold:
+                self.stats["rules"] += 1
+                return prediction
+        if self.centroid is not None:
+            query_vector = await self.centroid.embedder.aembed_query(text)
+            # 首次调用需要向量化全部示例，放到线程中执行
+            prediction = await asyncio.to_thread(self.centroid.predict_vector, query_vector)
+            if prediction is not None and prediction[1] >= self.threshold:
+                self.stats["centroid"] += 1
+                return prediction
+        self.stats["fallback"] += 1
+        return None
+
+
+def create_intent_pre_classifier(config: Dict[str, Any] | None, embedder: AbstractEmbedding | None,
+                                 threshold: float) -> IntentPreClassifier | None:
+    """根据 Agent 配置中的 pre_classifier 块创建预分类器；未启用时返回 None。"""
+    config = config or {}
+    if not config.get("enabled", False):
+        return None
+    rules = RuleIntentClassifier(config["rules"]) if config.get("rules") else None
+    centroid = None
+    centroid_config = config.get("centroid") or {}
+    if centroid_config.get("enabled", True) and centroid_config.get("examples"):
+        if embedder is None:
+            print("  [Intent] ⚠️ 未注入 Embedding 模型 (dependencies.embed_key)，跳过质心分类阶段。")
+        else:
+            centroid = CentroidIntentClassifier(embedder, centroid_config["examples"], centroid_config.get("min_margin", 0.05),
+                                                centroid_config.get("temperature", 0.05))
+    return IntentPreClassifier(rules, centroid, threshold)
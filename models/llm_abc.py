@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 import asyncio
+import numpy as np
 
 # --- LLM 和 Embedding 接口（保持不变）---
 class AbstractLLM(ABC):
@@ -9,6 +10,20 @@ class AbstractLLM(ABC):
         """统一的模型生成接口。"""
         pass
 
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成接口 (异步生成器)，按到达顺序产出文本片段，拼接后等于 generate 的结果。
+        默认实现等待 generate 完成后一次性产出；支持流式输出的实现应覆盖此方法。
+        """
+        yield await self.generate(prompt, **kwargs)
+
+    async def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        """
+        批量生成接口：返回与 prompts 一一对应的结果，单条失败时该位置为异常对象 (不影响同批其他条目)。
+        默认实现并发调用 generate；服务端支持一次提交多个 prompt 的实现应覆盖此方法 (见 BatchingLLM)。
+        """
+        return list(await asyncio.gather(*(self.generate(prompt, **kwargs) for prompt in prompts), return_exceptions=True))
+
 class AbstractEmbedding(ABC):
     @abstractmethod
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
@@ -20,6 +35,27 @@ class AbstractEmbedding(ABC):
         """统一的查询向量化接口，用于查询嵌入。"""
         pass
 
+    def embed_documents_array(self, texts: List[str], dtype: Any = None) -> np.ndarray:
+        """
+        批量向量化并返回连续存储的二维数组 (len(texts), dim)，默认 float32，可选 float16。
+        默认实现由 embed_documents 转换而来；能直接产出数组的实现应覆盖此方法，避免经过 Python 列表。
+        """
+        dtype = dtype or getattr(self, "vector_dtype", np.float32)
+        return np.ascontiguousarray(np.asarray(self.embed_documents(texts), dtype=dtype))
+
+    def embed_query_array(self, text: str, dtype: Any = None) -> np.ndarray:
+        """查询向量化，返回一维数组 (dim,)。"""
+        dtype = dtype or getattr(self, "vector_dtype", np.float32)
+        return np.asarray(self.embed_query(text), dtype=dtype)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步查询向量化。默认在线程中执行 embed_query，支持原生异步的实现应覆盖此方法。"""
+        return await asyncio.to_thread(self.embed_query, text)
+
+    def has_native_async(self) -> bool:
+        """子类是否覆盖了 aembed_query (即提供原生异步实现)。"""
+        return type(self).aembed_query is not AbstractEmbedding.aembed_query
+
 # --- Tools 接口（保持不变）---
 class AbstractTool(ABC):
     @abstractmethod
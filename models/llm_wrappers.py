@@ -0,0 +1,371 @@
+from typing import Dict, Any, Tuple, AsyncIterator, List
+from collections import OrderedDict, deque
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from .llm_abc import AbstractLLM
+from .concurrency import AdaptiveConcurrencyLimiter, DeadlineExceededError, remaining_time
+
+
+class LLMWrapper(AbstractLLM):
+    """
+    LLM 包装器基类：持有被包装的 AbstractLLM，未覆盖的属性 (model_name、temperature 等) 透传给内部实例。
+    LLMFactory 按配置把各类包装器叠加在原始模型外层。
+    """
+    def __init__(self, inner: AbstractLLM):
+        self.inner = inner
+
+    def __getattr__(self, name: str) -> Any:
+        # 只有在自身找不到属性时才会调用，避免递归访问 inner
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return await self.inner.generate(prompt, **kwargs)
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.inner.stream(prompt, **kwargs):
+            yield chunk
+
+
+class CachedLLM(LLMWrapper):
+    """
+    响应缓存 + 请求合并 (single-flight)：
+      - 同一事件循环中参数完全相同的并发请求共享一次底层调用 (coalesce)
+      - 确定性调用 (temperature 为 0，或调用方传入 cacheable=True) 的结果按 TTL 缓存，
+        条目数 (max_entries) 与响应总字节数 (max_bytes) 均有上限，超出时按 LRU 淘汰
+    cacheable 只由包装器消费，不会传给底层模型；cacheable=False 可强制跳过缓存。
+    流式调用 (stream) 命中缓存时一次性产出缓存的响应；未命中时透传底层流并在完整结束后写入缓存 (不参与请求合并)。
+    """
+    def __init__(self, inner: AbstractLLM, model_name: str, config: Dict[str, Any] | None = None):
+        super().__init__(inner)
+        config = config or {}
+        self.cache_model_name = model_name
+        self.ttl_seconds = config.get("ttl_seconds", 600)
+        self.max_entries = config.get("max_entries", 2048)
+        self.max_bytes = config.get("max_bytes", 16 << 20) # 默认 16 MiB
+        self.coalesce = config.get("coalesce", True)
+
+        self._cache: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict() # 键 -> (响应, 写入时间, 字节数)
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        # (事件循环 ID, 键) -> 进行中的底层调用
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evicted": 0}
+        print(f"  [LLM] 已启用响应缓存: {model_name} (TTL {self.ttl_seconds}s, 上限 {self.max_entries} 条, "
+              f"合并并发请求: {self.coalesce})")
+
+    def _key(self, prompt: str, kwargs: Dict[str, Any]) -> str:
+        # priority 只影响调度 (BatchingLLM)，不影响响应内容
+        kwargs = {name: value for name, value in kwargs.items() if name != "priority"}
+        payload = json.dumps([self.cache_model_name, prompt, kwargs], sort_keys=True, ensure_ascii=False, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _is_deterministic(self, kwargs: Dict[str, Any], cacheable: bool | None) -> bool:
+        if cacheable is not None:
+            return cacheable
+        return kwargs.get("temperature", getattr(self.inner, "temperature", None)) == 0
+
+    def _cache_get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if self.ttl_seconds is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._cache_bytes -= self._cache.pop(key)[2]
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def _cache_put(self, key: str, response: str):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                self._cache_bytes -= self._cache.pop(key)[2]
+            self._cache[key] = (response, time.time(), size)
+            self._cache_bytes += size
+            while len(self._cache) > self.max_entries or self._cache_bytes > self.max_bytes:
+                self._cache_bytes -= self._cache.popitem(last=False)[1][2]
+                self.stats["evicted"] += 1
+
+    async def _call(self, key: str, prompt: str, kwargs: Dict[str, Any], deterministic: bool) -> str:
+        response = await self.inner.generate(prompt, **kwargs)
+        if deterministic and isinstance(response, str):
+            self._cache_put(key, response)
+        return response
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        cacheable = kwargs.pop("cacheable", None)
+        deterministic = self._is_deterministic(kwargs, cacheable)
+        key = self._key(prompt, kwargs)
+
+        if deterministic:
+            cached = self._cache_get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+        self.stats["misses"] += 1
+
+        if not self.coalesce:
+            return await self._call(key, prompt, kwargs, deterministic)
+
+        flight_key = (id(asyncio.get_running_loop()), key)
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            # 底层调用放在独立任务中：某个等待方被取消不会影响其他等待方
+            task = asyncio.ensure_future(self._call(key, prompt, kwargs, deterministic))
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda done: self._finish(flight_key, done))
+        return await asyncio.shield(task)
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        cacheable = kwargs.pop("cacheable", None)
+        deterministic = self._is_deterministic(kwargs, cacheable)
+        key = self._key(prompt, kwargs)
+
+        if deterministic:
+            cached = self._cache_get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                yield cached
+                return
+        self.stats["misses"] += 1
+
+        chunks = []
+        async for chunk in self.inner.stream(prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        # 只缓存完整结束的流 (中途取消或出错时不会执行到这里)
+        if deterministic:
+            self._cache_put(key, "".join(chunks))
+
+    def _finish(self, flight_key: Tuple[int, str], task: asyncio.Task):
+        self._inflight.pop(flight_key, None)
+        # 所有等待方都已取消时，由这里取走异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+
+class _BatchScheduler:
+    """
+    单个事件循环内的批处理调度器 (由 BatchingLLM 按事件循环创建)。
+    每个优先级通道一个 FIFO 队列；调度任务在首个请求到达后最多再等待 max_wait 秒凑批，
+    按通道优先级取出参数相同的请求组成一批，在 max_inflight_batches 个并发批次额度内提交。
+    额度用尽时新请求继续排队，下游越忙批次越大。
+    """
+    def __init__(self, owner: "BatchingLLM"):
+        self.owner = owner
+        self.lanes: Dict[str, deque] = {lane: deque() for lane in owner.lanes}
+        self.has_items = asyncio.Event()
+        self.slots = asyncio.Semaphore(owner.max_inflight_batches)
+        # 事件循环只弱引用任务：执行中的批次必须由这里持有强引用，完成后移除
+        self._batch_tasks: set = set()
+        self.dispatcher = asyncio.ensure_future(self._dispatch_loop())
+
+    def submit(self, lane: str, item: Tuple[str, Dict[str, Any], str, asyncio.Future, float]):
+        self.lanes[lane].append(item)
+        self.has_items.set()
+
+    def _size(self) -> int:
+        return sum(len(queue) for queue in self.lanes.values())
+
+    def _take_batch(self) -> List[Tuple[str, Dict[str, Any], str, asyncio.Future, float]]:
+        """按通道优先级取出至多 max_batch_size 个请求；只有生成参数相同的请求才能合成一批。"""
+        batch, batch_key = [], None
+        for queue in self.lanes.values():
+            kept = deque()
+            while queue and len(batch) < self.owner.max_batch_size:
+                item = queue.popleft()
+                if item[3].done(): # 调用方已取消
+                    continue
+                if batch_key is None or item[2] == batch_key:
+                    batch_key = item[2]
+                    batch.append(item)
+                else:
+                    kept.append(item)
+            # 参数不同的请求放回原位，保持队列顺序
+            queue.extendleft(reversed(kept))
+        return batch
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._size() == 0:
+                self.has_items.clear()
+                await self.has_items.wait()
+                continue
+            # 凑批：批次未满时最多等待 max_wait_seconds
+            deadline = loop.time() + self.owner.max_wait_seconds
+            while self._size() < self.owner.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.has_items.clear()
+                try:
+                    await asyncio.wait_for(self.has_items.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            batch = self._take_batch()
+            if not batch:
+                self.slots.release()
+                continue
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, Dict[str, Any], str, asyncio.Future, float]]):
+        owner = self.owner
+        try:
+            now = time.perf_counter()
+            owner.stats["batches"] += 1
+            owner.stats["requests"] += len(batch)
+            owner.stats["max_batch"] = max(owner.stats["max_batch"], len(batch))
+            owner.stats["max_queue_wait_ms"] = max(owner.stats["max_queue_wait_ms"], (now - batch[0][4]) * 1000)
+            try:
+                results = await owner.inner.generate_batch([item[0] for item in batch], **batch[0][1])
+            except Exception as e:
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+                return
+            for item, result in zip(batch, results):
+                if item[3].done():
+                    continue
+                if isinstance(result, BaseException):
+                    item[3].set_exception(result)
+                else:
+                    item[3].set_result(result)
+        finally:
+            self.slots.release()
+
+
+class BatchingLLM(LLMWrapper):
+    """
+    微批处理调度：把短时间窗口内到达的 generate 请求合并为一次 generate_batch 提交。
+      - max_batch_size / max_wait_ms：批次大小上限与凑批等待上限 (限制排队带来的尾延迟)
+      - max_inflight_batches：同时提交的批次数上限 (下游过载保护)
+      - lanes：优先级通道，按配置顺序从高到低；调用方通过 priority="<通道名>" 指定，默认 default_lane
+    底层模型支持批量提交时 (如 HuggingFacePipelineModel 的 batching.api: completions) 每批一次请求，
+    否则由 generate_batch 的默认实现在批内并发调用。priority 只由包装器消费；流式调用不经过批处理。
+    """
+    def __init__(self, inner: AbstractLLM, model_name: str, config: Dict[str, Any] | None = None):
+        super().__init__(inner)
+        config = config or {}
+        self.batch_model_name = model_name
+        self.max_batch_size = config.get("max_batch_size", 8)
+        self.max_wait_seconds = config.get("max_wait_ms", 5) / 1000
+        self.max_inflight_batches = config.get("max_inflight_batches", 4)
+        self.lanes = list(config.get("lanes", ["interactive", "background"]))
+        self.default_lane = config.get("default_lane", self.lanes[0])
+        if self.default_lane not in self.lanes:
+            raise ValueError(f"BatchingLLM 配置错误：default_lane '{self.default_lane}' 不在 lanes {self.lanes} 中。")
+
+        # 事件循环 ID -> 调度器 (asyncio 原语不能跨事件循环使用)
+        self._schedulers: Dict[int, _BatchScheduler] = {}
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0, "max_queue_wait_ms": 0.0}
+        print(f"  [LLM] 已启用微批处理: {model_name} (批大小 {self.max_batch_size}, 等待 {config.get('max_wait_ms', 5)} ms, "
+              f"并发批次 {self.max_inflight_batches}, 通道 {self.lanes})")
+
+    def _scheduler(self) -> _BatchScheduler:
+        loop_id = id(asyncio.get_running_loop())
+        scheduler = self._schedulers.get(loop_id)
+        if scheduler is None or scheduler.dispatcher.done():
+            scheduler = _BatchScheduler(self)
+            self._schedulers[loop_id] = scheduler
+            # 事件循环关闭时调度任务被取消，随之移除调度器 (避免每个短生命周期的事件循环留下一个条目)
+            scheduler.dispatcher.add_done_callback(lambda _, scheduler=scheduler: self._drop_scheduler(loop_id, scheduler))
+        return scheduler
+
+    def _drop_scheduler(self, loop_id: int, scheduler: _BatchScheduler):
+        if self._schedulers.get(loop_id) is scheduler:
+            del self._schedulers[loop_id]
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        lane = kwargs.pop("priority", None) or self.default_lane
+        if lane not in self.lanes:
+            lane = self.default_lane
+        batch_key = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=repr)
+        future = asyncio.get_running_loop().create_future()
+        self._scheduler().submit(lane, (prompt, kwargs, batch_key, future, time.perf_counter()))
+        return await future
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        kwargs.pop("priority", None)
+        async for chunk in self.inner.stream(prompt, **kwargs):
+            yield chunk
+
+    def summary(self) -> str:
+        s = self.stats
+        average = s["requests"] / s["batches"] if s["batches"] else 0.0
+        return (f"[Batching:{self.batch_model_name}] 请求 {s['requests']}，批次 {s['batches']}，平均批大小 {average:.2f}，"
+                f"最大批 {s['max_batch']}，最长排队 {s['max_queue_wait_ms']:.1f} ms")
+
+
+class ConcurrencyLimitedLLM(LLMWrapper):
+    """
+    后端保护：每个模型后端一个 AdaptiveConcurrencyLimiter，限制执行中的请求数并按延迟自适应调整；
+    调用受当前请求截止时间 (deadline_scope) 约束，超时抛出 DeadlineExceededError 并计为过载信号。
+    流式调用以首个片段的延迟作为反馈 (总耗时取决于输出长度)，名额保持到流结束。
+    """
+    def __init__(self, inner: AbstractLLM, model_name: str, config: Dict[str, Any] | None = None):
+        super().__init__(inner)
+        self.limiter = AdaptiveConcurrencyLimiter(model_name, config)
+        print(f"  [LLM] 已启用自适应并发限制: {model_name} (初始上限 {int(self.limiter.limit)}, "
+              f"范围 [{self.limiter.min_limit}, {self.limiter.max_limit}], 排队上限 {self.limiter.max_queue})")
+
+    @staticmethod
+    async def _within_deadline(awaitable):
+        remaining = remaining_time()
+        if remaining is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("模型调用超过请求截止时间") from None
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        await self.limiter.acquire()
+        started = time.monotonic()
+        latency, dropped = None, False
+        try:
+            result = await self._within_deadline(self.inner.generate(prompt, **kwargs))
+            latency = time.monotonic() - started
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            dropped = True
+            raise
+        finally:
+            self.limiter.release(started, latency, dropped)
+
+    async def stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        await self.limiter.acquire()
+        started = time.monotonic()
+        first_chunk, dropped = None, False
+        chunks = self.inner.stream(prompt, **kwargs).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await self._within_deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception:
+            dropped = True
+            raise
+        finally:
+            self.limiter.release(started, first_chunk, dropped)
+            await chunks.aclose()
@@ -0,0 +1,77 @@
+from typing import Dict, Any, Awaitable, List
+from collections import OrderedDict
+import asyncio
+import time
+import uuid
+
+
+class SpeculativeTasks:
+    """
+    推测执行任务表：在路由结果出来之前先启动某个分支的前置步骤 (如 RAG 检索)，
+    用 speculation_id 随流程状态传递给分支节点。
+      - take():    分支节点取走任务并等待其结果 (命中，记为 used)
+      - discard(): 路由未选中该分支或结果不再需要时取消 / 丢弃 (记为 cancelled / discarded)
+    统计被浪费的执行时间 (wasted_seconds) 与命中时节省的等待时间 (saved_seconds)。
+    未被认领的任务超过 max_pending 时，最早的任务会被取消。
+    """
+    def __init__(self, name: str, max_pending: int = 256):
+        self.name = name
+        self.max_pending = max_pending
+        # speculation_id -> [任务, 启动时间, 完成时间 (未完成为 None)]
+        self._pending: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self.stats: Dict[str, Any] = {
+            "started": 0, "used": 0, "cancelled": 0, "discarded": 0,
+            "wasted_seconds": 0.0, "saved_seconds": 0.0,
+        }
+
+    def start(self, awaitable: Awaitable[Any]) -> str:
+        """在当前事件循环中启动推测任务，返回 speculation_id。"""
+        speculation_id = uuid.uuid4().hex
+        task = asyncio.ensure_future(awaitable)
+        entry = [task, time.perf_counter(), None]
+        task.add_done_callback(lambda done: self._on_done(entry, done))
+        self._pending[speculation_id] = entry
+        self.stats["started"] += 1
+        while len(self._pending) > self.max_pending:
+            self.discard(next(iter(self._pending)))
+        return speculation_id
+
+    @staticmethod
+    def _on_done(entry: List[Any], task: asyncio.Task):
+        entry[2] = time.perf_counter()
+        # 任务失败时由使用方决定是否重试，这里只负责取走异常，避免未处理异常警告
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _elapsed(entry: List[Any]) -> float:
+        """任务实际运行的时间 (已完成取完成时刻，否则取当前时刻)。"""
+        return (entry[2] or time.perf_counter()) - entry[1]
+
+    def take(self, speculation_id: str | None) -> asyncio.Task | None:
+        """认领推测任务；不存在 (已过期 / 已丢弃) 时返回 None，调用方按常规路径执行。"""
+        entry = self._pending.pop(speculation_id, None) if speculation_id else None
+        if entry is None:
+            return None
+        self.stats["used"] += 1
+        # 认领之前任务已运行的时间与路由阶段重叠，即节省下来的等待时间
+        self.stats["saved_seconds"] += self._elapsed(entry)
+        return entry[0]
+
+    def discard(self, speculation_id: str | None):
+        """路由未选中该分支：仍在运行的任务被取消，已完成的结果被丢弃，耗时计入浪费。"""
+        entry = self._pending.pop(speculation_id, None) if speculation_id else None
+        if entry is None:
+            return
+        task = entry[0]
+        self.stats["wasted_seconds"] += self._elapsed(entry)
+        if task.done():
+            self.stats["discarded"] += 1
+        else:
+            task.cancel()
+            self.stats["cancelled"] += 1
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"[Speculation:{self.name}] 启动 {s['started']}，命中 {s['used']}，取消 {s['cancelled']}，"
+                f"丢弃 {s['discarded']}，节省 {s['saved_seconds']:.3f}s，浪费 {s['wasted_seconds']:.3f}s")
@@ -0,0 +1,195 @@
+from typing import Dict, Any, List, Tuple, Callable
+from functools import lru_cache
+import re
+import unicodedata
+from langchain_core.documents import Document
+
+try:
+    import tiktoken  # 可选依赖：encoding 模式使用
+except ImportError:
+    tiktoken = None
+
+try:
+    from tokenizers import Tokenizer as HFTokenizer  # 可选依赖：huggingface 模式使用 (Rust 实现的快速分词器)
+except ImportError:
+    HFTokenizer = None
+
+# 估算模式：中日韩字符每字约 1 个 token，字母数字串约每 4 个字符 1 个 token，其余非空白字符各 1 个
+_ESTIMATE_PATTERN = re.compile(r"([㐀-䶿一-鿿豈-﫿぀-ヿ가-힯])|([0-9A-Za-zÀ-ɏ_]+)|\S")
+
+
+class TokenCounter:
+    """
+    快速 token 计数 (用于估算 prompt 长度，而非检索分词)：
+      - type: estimate (默认)：按字符类别估算，无额外依赖，对中英文混合文本误差约 10%~20%
+      - type: tiktoken：使用 tiktoken 的 encoding (如 cl100k_base)，需要 pip install tiktoken
+      - type: huggingface：使用模型自带的快速分词器 (tokenizers 库，name 为模型名或 tokenizer.json 路径)
+    依赖缺失或加载失败时回退到估算模式。计数结果按文本 LRU 缓存 (cache_size)，
+    知识库中的同一文本块在不同查询中反复出现时只计数一次。
+    """
+    def __init__(self, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.type = config.get("type", "estimate").lower()
+        self._encode: Callable[[str], List[int]] | None = None
+        self._decode: Callable[[List[int]], str] | None = None
+        if self.type == "tiktoken":
+            self._load_tiktoken(config.get("encoding", "cl100k_base"))
+        elif self.type == "huggingface":
+            self._load_huggingface(config.get("name"))
+        elif self.type != "estimate":
+            raise ValueError(f"不支持的 token 计数类型: {self.type}")
+        if self._encode is None:
+            self.type = "estimate"
+        self._cached_count = lru_cache(maxsize=config.get("cache_size", 8192))(self.count_uncached)
+
+    def _load_tiktoken(self, encoding_name: str):
+        if tiktoken is None:
+            print("  [Context] ⚠️ 未安装 tiktoken，token 计数回退到估算模式。")
+            return
+        try:
+            encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"  [Context] ⚠️ 加载 tiktoken encoding '{encoding_name}' 失败 ({e})，回退到估算模式。")
+            return
+        self._encode, self._decode = encoding.encode_ordinary, encoding.decode
+
+    def _load_huggingface(self, name: str | None):
+        if HFTokenizer is None or not name:
+            print("  [Context] ⚠️ 未安装 tokenizers 或未配置 name，token 计数回退到估算模式。")
+            return
+        try:
+            tokenizer = HFTokenizer.from_file(name) if name.endswith(".json") else HFTokenizer.from_pretrained(name)
+        except Exception as e:
+            print(f"  [Context] ⚠️ 加载分词器 '{name}' 失败 ({e})，回退到估算模式。")
+            return
+        self._encode = lambda text: tokenizer.encode(text, add_special_tokens=False).ids
+        self._decode = tokenizer.decode
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        count = 0
+        for match in _ESTIMATE_PATTERN.finditer(text):
+            word = match.group(2)
+            count += (len(word) + 3) // 4 if word else 1
+        return count
+
+    def count_uncached(self, text: str) -> int:
+        return len(self._encode(text)) if self._encode is not None else self._estimate(text)
+
+    def count(self, text: str) -> int:
+        return self._cached_count(text) if text else 0
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截取 text 的前缀，使其 token 数不超过 max_tokens。"""
+        if max_tokens <= 0:
+            return ""
+        if self._encode is not None:
+            ids = self._encode(text)
+            return text if len(ids) <= max_tokens else self._decode(ids[:max_tokens])
+        # 估算模式：按字符二分查找最长的合规前缀 (不写入计数缓存)
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._estimate(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def cache_info(self):
+        return self._cached_count.cache_info()
+
+
+class ContextPacker:
+    """
+    RAG 上下文打包 (检索结果 -> prompt 上下文)：
+      1. 按融合分数降序遍历候选文本块
+      2. 去重：与已选片段内容相同、或字符 shingle 被已选片段覆盖的比例 >= dedup_threshold 的块跳过
+         (重叠切块、同一段落被多个来源重复摄取等情况)
+      3. 贪心装箱：片段 (含编号前缀与分隔符) 放得下就选入；放不下时若剩余预算 >= min_truncate_tokens
+         则截断后选入 (truncate: true)，否则跳过，继续尝试后面更短的片段
+    片段以紧凑的 "[n] 内容" 形式拼接，不再使用装饰性的分隔标题。
+    """
+    def __init__(self, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.max_context_tokens = config.get("max_context_tokens", 1500)
+        self.dedup_threshold = config.get("dedup_threshold", 0.8)
+        self.shingle_size = config.get("shingle_size", 5)
+        self.truncate = config.get("truncate", True)
+        self.min_truncate_tokens = config.get("min_truncate_tokens", 64)
+        self.separator = config.get("separator", "\n\n")
+        self.counter = TokenCounter(config.get("tokenizer"))
+        self._separator_tokens = self.counter.count(self.separator)
+        self.stats = {"packs": 0, "candidates": 0, "selected": 0, "duplicates": 0, "truncated": 0,
+                      "over_budget": 0, "tokens": 0}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+    def _shingles(self, normalized: str) -> set:
+        size = self.shingle_size
+        if len(normalized) <= size:
+            return {normalized}
+        return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+    def _is_duplicate(self, shingles: set, selected: List[set]) -> bool:
+        # 覆盖率 = 与已选片段共有的 shingle / 本片段的 shingle：较短的块完整出现在已选块中时为 1
+        for other in selected:
+            if len(shingles & other) >= self.dedup_threshold * len(shingles):
+                return True
+        return False
+
+    def pack(self, scored_docs: List[Tuple[Document, float]], budget: int | None = None) -> Tuple[str, Dict[str, int]]:
+        """
+        把 [(Document, 分数)] 装入 budget 个 token (默认 max_context_tokens)。
+        返回 (拼接后的上下文, 本次统计)，统计中 tokens 为上下文实际占用的 token 数。
+        """
+        budget = self.max_context_tokens if budget is None else budget
+        stats = {"candidates": len(scored_docs), "selected": 0, "duplicates": 0, "truncated": 0, "over_budget": 0}
+        passages: List[str] = []
+        selected_shingles: List[set] = []
+        seen_texts = set()
+        used = 0
+
+        for doc, _ in sorted(scored_docs, key=lambda item: item[1], reverse=True):
+            content = doc.page_content.strip()
+            normalized = self._normalize(content)
+            if not normalized:
+                continue
+            shingles = self._shingles(normalized)
+            if normalized in seen_texts or self._is_duplicate(shingles, selected_shingles):
+                stats["duplicates"] += 1
+                continue
+
+            prefix = f"[{len(passages) + 1}] "
+            overhead = self.counter.count(prefix) + (self._separator_tokens if passages else 0)
+            remaining = budget - used - overhead
+            tokens = self.counter.count(content)
+            if tokens > remaining:
+                if not self.truncate or remaining < self.min_truncate_tokens:
+                    stats["over_budget"] += 1
+                    continue
+                content = self.counter.truncate(content, remaining)
+                tokens = self.counter.count_uncached(content)  # 截断结果只用一次，不写入缓存
+                stats["truncated"] += 1
+
+            passages.append(prefix + content)
+            selected_shingles.append(shingles)
+            seen_texts.add(normalized)
+            used += overhead + tokens
+            stats["selected"] += 1
+
+        self.stats["packs"] += 1
+        self.stats["tokens"] += used
+        for key, value in stats.items():
+            self.stats[key] += value
+        print(f"  [Context] 上下文打包：候选 {stats['candidates']}，入选 {stats['selected']}，去重 {stats['duplicates']}，"
+              f"截断 {stats['truncated']}，超出预算 {stats['over_budget']}；{used}/{budget} tokens。")
+        return self.separator.join(passages), dict(stats, tokens=used, budget=budget)
+
+    def summary(self) -> str:
+        s = self.stats
+        average = s["tokens"] / s["packs"] if s["packs"] else 0.0
+        return (f"[Context] 打包 {s['packs']} 次：候选 {s['candidates']}，入选 {s['selected']}，去重 {s['duplicates']}，"
+                f"截断 {s['truncated']}，超出预算 {s['over_budget']}；平均上下文 {average:.0f} tokens")
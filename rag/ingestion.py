@@ -0,0 +1,78 @@
+from typing import List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import time
+import numpy as np
+from models.llm_abc import AbstractEmbedding
+
+# 批次写入回调：(ids, vectors (n, dim) ndarray, texts, metadatas) -> None
+BatchSink = Callable[[List[str], np.ndarray, List[str], List[Dict[str, Any]]], None]
+
+
+class EmbeddingIngestionPipeline:
+    """
+    批量并发向量化流水线：
+      1. 将待写入文档切分为固定大小的批次
+      2. 在有界线程池中并发调用 embed_documents_array (失败按指数退避重试)
+      3. 每个批次完成后立即交给 sink 写入向量库，而不是等全部完成后一次性写入
+    在途批次数量受 max_concurrency 限制，内存占用与语料总量无关。
+    sink 始终在调用线程中串行执行，向量库写入无需额外加锁。
+    """
+    def __init__(self, embedder: AbstractEmbedding, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.embedder = embedder
+        self.batch_size = config.get("batch_size", 64)
+        self.max_concurrency = config.get("max_concurrency", 4)
+        self.max_retries = config.get("max_retries", 3)
+        self.retry_backoff = config.get("retry_backoff", 0.5) # 首次重试等待秒数，之后翻倍
+
+    def _embed_with_retry(self, texts: List[str]) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            try:
+                # 直接取连续的 float32/float16 数组，不经过 Python 列表
+                vectors = self.embedder.embed_documents_array(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Embedding 返回 {len(vectors)} 个向量，期望 {len(texts)} 个。")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"  [Ingest] ⚠️ 批次向量化失败 ({e})，{delay:.1f}s 后进行第 {attempt + 1} 次重试...")
+                time.sleep(delay)
+
+    def run(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], sink: BatchSink) -> int:
+        """执行流水线，返回写入的文档数。任一批次重试耗尽时抛出异常 (已完成的批次保持写入)。"""
+        batches = [
+            (ids[start:start + self.batch_size], texts[start:start + self.batch_size], metadatas[start:start + self.batch_size])
+            for start in range(0, len(ids), self.batch_size)
+        ]
+        if not batches:
+            return 0
+
+        print(f"  [Ingest] 🚚 开始批量向量化：{len(ids)} 个文档，{len(batches)} 个批次 "
+              f"(batch_size={self.batch_size}, 并发={self.max_concurrency})。")
+        started = time.perf_counter()
+        written = 0
+        next_batch = 0
+        in_flight: Dict[Future, int] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ingest") as pool:
+            try:
+                while next_batch < len(batches) or in_flight:
+                    # 保持最多 max_concurrency 个批次在途
+                    while next_batch < len(batches) and len(in_flight) < self.max_concurrency:
+                        in_flight[pool.submit(self._embed_with_retry, batches[next_batch][1])] = next_batch
+                        next_batch += 1
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_ids, batch_texts, batch_metadatas = batches[in_flight.pop(future)]
+                        sink(batch_ids, future.result(), batch_texts, batch_metadatas)
+                        written += len(batch_ids)
+                        print(f"  [Ingest] 批次完成 {written}/{len(ids)} ({time.perf_counter() - started:.2f}s)")
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        return written
@@ -0,0 +1,443 @@
+from typing import List, Dict, Any, Iterable, Tuple
+import json
+import math
+import os
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from rag.rag_module import RAGModule
+
+
+class LocalVectorIndex:
+    """
+    纯 NumPy 实现的本地向量索引，行号 (row) 即向量在矩阵中的位置：
+      - 向量存放在 vectors.bin (np.memmap，容量按倍数增长)，进程重启后直接映射，无需重新加载
+      - 精确检索：分块矩阵乘法 + argpartition 取 Top-K (小集合默认使用)
+      - 近似检索：存活向量数达到 ivf_threshold 后在 save() 时训练 IVF (k-means 粗聚类)，
+        查询只扫描最近的 nprobe 个簇；IVF 构建之后新写入 / 更新的行记为 pending，查询时精确扫描，
+        pending 超过 rebuild_ratio 时在下一次 save() 中重建
+    距离与 Chroma 保持一致：l2 为平方欧氏距离，cosine 为 1 - 余弦相似度，ip 为 1 - 内积。
+    行与文档 ID 的映射由调用方维护，加载后通过 attach() 告知存活的行。
+    read_only=True 时以只读方式映射 (多个进程共享同一份页缓存)，不允许写入。
+    """
+    VERSION = 1
+    METRICS = ("l2", "cosine", "ip")
+
+    def __init__(self, index_dir: str | None = None, metric: str = "l2", dtype: str = "float32",
+                 ivf_threshold: int = 50000, nlist: int = 0, nprobe: int = 16, rebuild_ratio: float = 0.2,
+                 kmeans_iters: int = 10, block_rows: int = 65536, seed: int = 0, read_only: bool = False):
+        if metric not in self.METRICS:
+            raise ValueError(f"不支持的距离度量: {metric}，可选值: {self.METRICS}")
+        self.index_dir = index_dir
+        self.metric = metric
+        self.dtype = np.dtype(dtype)
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist          # 0 表示自动 (≈ 4·√N)
+        self.nprobe = nprobe
+        self.rebuild_ratio = rebuild_ratio
+        self.kmeans_iters = kmeans_iters
+        self.block_rows = block_rows
+        self.seed = seed
+        self.read_only = read_only
+
+        self.dim: int | None = None
+        self._capacity = 0
+        self._size = 0              # 已使用的最大行号 + 1
+        self._vectors: np.ndarray | None = None
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        # IVF: (centroids, offsets, rows)，rows 按簇排序，第 c 个簇为 rows[offsets[c]:offsets[c + 1]]
+        self._ivf: Tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self._ivf_generation = 0
+        self._ivf_dirty = False     # 新构建的 IVF 尚未写盘
+        self._pending: set[int] = set()
+        self._lock = threading.RLock()
+
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+            self.load()
+
+    # --- 存储 ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _ivf_path(self, generation: int, part: str) -> str:
+        return self._path(f"ivf-{generation:06d}.{part}.npy")
+
+    def _grow(self, min_capacity: int):
+        """扩容向量矩阵 (文件模式下扩展 vectors.bin 并重新映射)。"""
+        capacity = max(min_capacity, self._capacity * 2, 1024)
+        if self.index_dir:
+            if self._vectors is not None:
+                self._vectors.flush()
+            with open(self._path("vectors.bin"), "ab") as f:
+                f.truncate(capacity * self.dim * self.dtype.itemsize)
+            self._vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        else:
+            vectors = np.zeros((capacity, self.dim), dtype=self.dtype)
+            if self._vectors is not None:
+                vectors[:self._capacity] = self._vectors[:self._capacity]
+            self._vectors = vectors
+        self._sq_norms = np.concatenate([self._sq_norms, np.zeros(capacity - self._capacity, dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._capacity = capacity
+
+    def load(self):
+        """加载 meta.json / vectors.bin / IVF 文件。向量无法由索引自行重建，格式或参数不一致时直接报错。"""
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != self.VERSION or meta.get("dtype") != self.dtype.name or meta.get("metric") != self.metric:
+            raise RuntimeError(
+                f"向量索引 {self.index_dir} 的格式或参数 (dtype={meta.get('dtype')}, metric={meta.get('metric')}) "
+                f"与当前配置不一致，请恢复原配置或更换 db_path 后重新摄取。")
+        self.dim = meta["dim"]
+        self._size = meta["size"]
+        if self.dim:
+            self._capacity = meta["capacity"]
+            self._vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r" if self.read_only else "r+",
+                                      shape=(self._capacity, self.dim))
+            self._sq_norms = np.zeros(self._capacity, dtype=np.float32)
+            self._alive = np.zeros(self._capacity, dtype=bool)
+            for start in range(0, self._size, self.block_rows):
+                block = np.asarray(self._vectors[start:start + self.block_rows], dtype=np.float32)
+                self._sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        generation = meta.get("ivf_generation", 0)
+        if generation:
+            self._ivf = tuple(np.load(self._ivf_path(generation, part), mmap_mode="r") for part in ("centroids", "offsets", "rows"))
+            self._ivf_generation = generation
+            self._pending = set(meta.get("pending", []))
+
+    def attach(self, rows: Iterable[int]):
+        """加载后标记存活的行 (行与文档的映射由调用方持久化)。"""
+        rows = np.fromiter(rows, dtype=np.int64)
+        if self._vectors is not None and len(rows):
+            self._alive[rows] = True
+
+    def _write_meta(self):
+        meta = {
+            "version": self.VERSION, "dim": self.dim, "dtype": self.dtype.name, "metric": self.metric,
+            "capacity": self._capacity, "size": self._size,
+            "ivf_generation": self._ivf_generation if self._ivf is not None else 0,
+            "pending": sorted(self._pending) if self._ivf is not None else [],
+        }
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"向量索引 {self.index_dir} 为只读，不能写入。")
+
+    def save(self):
+        """落盘：按需重建 / 丢弃 IVF，刷新 memmap 并原子更新 meta.json。"""
+        self._check_writable()
+        with self._lock:
+            alive_count = len(self)
+            if alive_count == 0 or alive_count < self.ivf_threshold:
+                self._ivf = None
+                self._pending.clear()
+            elif self._ivf is None or len(self._pending) > self.rebuild_ratio * alive_count:
+                self._build_ivf()
+            if not self.index_dir:
+                return
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._ivf is not None and self._ivf_dirty:
+                for part, array in zip(("centroids", "offsets", "rows"), self._ivf):
+                    np.save(self._ivf_path(self._ivf_generation, part), array)
+                self._ivf_dirty = False
+            self._write_meta()
+            # 清理不再引用的旧 IVF 文件
+            current = f"ivf-{self._ivf_generation:06d}." if self._ivf is not None else None
+            for name in os.listdir(self.index_dir):
+                if name.startswith("ivf-") and (current is None or not name.startswith(current)):
+                    os.remove(self._path(name))
+
+    def close(self):
+        with self._lock:
+            if isinstance(self._vectors, np.memmap) and not self.read_only:
+                self._vectors.flush()
+            self._vectors = None
+            self._ivf = None
+
+    # --- 写入 ---
+
+    def __len__(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors
+
+    def put(self, rows: List[int], vectors: np.ndarray):
+        """写入 (或覆盖) 指定行的向量。"""
+        self._check_writable()
+        vectors = self._prepare(vectors)
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致：索引为 {self.dim}，写入为 {vectors.shape[1]}。")
+            if len(rows) and rows.max() >= self._capacity:
+                self._grow(int(rows.max()) + 1)
+            self._vectors[rows] = vectors.astype(self.dtype, copy=False)
+            stored = np.asarray(self._vectors[rows], dtype=np.float32)
+            self._sq_norms[rows] = np.einsum("ij,ij->i", stored, stored)
+            self._alive[rows] = True
+            if len(rows):
+                self._size = max(self._size, int(rows.max()) + 1)
+            if self._ivf is not None:
+                self._pending.update(rows.tolist())
+
+    def remove(self, rows: List[int]):
+        self._check_writable()
+        with self._lock:
+            if self._vectors is not None and len(rows):
+                self._alive[np.asarray(rows, dtype=np.int64)] = False
+
+    def get(self, rows: List[int]) -> np.ndarray:
+        """按行读取已存储的向量 (float32 副本)。"""
+        with self._lock:
+            if self._vectors is None:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return np.asarray(self._vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    # --- 检索 ---
+
+    def _distances(self, block: np.ndarray, sq_norms: np.ndarray, query: np.ndarray, query_sq_norm: float) -> np.ndarray:
+        dots = block @ query
+        if self.metric == "l2":
+            return np.maximum(sq_norms - 2.0 * dots + query_sq_norm, 0.0)
+        return 1.0 - dots
+
+    def _top_k(self, rows: np.ndarray, distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(distances) > k:
+            keep = np.argpartition(distances, k - 1)[:k]
+            rows, distances = rows[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def _scan(self, snapshot, query: np.ndarray, k: int, rows: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """精确扫描：rows 为 None 时扫描全部行，否则只扫描给定的候选行；按块计算并合并 Top-K。"""
+        vectors, sq_norms, alive, size = snapshot
+        query_sq_norm = float(query @ query)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        total = size if rows is None else len(rows)
+        for start in range(0, total, self.block_rows):
+            if rows is None:
+                block_rows = np.arange(start, min(start + self.block_rows, size), dtype=np.int64)
+                block = vectors[start:start + len(block_rows)]
+            else:
+                block_rows = rows[start:start + self.block_rows]
+                block = vectors[block_rows]
+            distances = self._distances(np.asarray(block, dtype=np.float32), sq_norms[block_rows], query, query_sq_norm)
+            live = alive[block_rows]
+            block_rows, distances = block_rows[live], distances[live]
+            best_rows, best_distances = self._top_k(
+                np.concatenate([best_rows, block_rows]), np.concatenate([best_distances, distances]), k)
+        return best_rows, best_distances
+
+    def search(self, query_vector: List[float] | np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (rows, distances)，按距离升序。IVF 可用时只扫描最近的 nprobe 个簇与 pending 行。"""
+        query = self._prepare(query_vector).reshape(-1)
+        with self._lock:
+            if self._vectors is None or k <= 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            snapshot = (self._vectors, self._sq_norms, self._alive, self._size)
+            ivf = self._ivf
+            pending = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending)) if ivf is not None else None
+        if ivf is None:
+            return self._scan(snapshot, query, k)
+
+        centroids, offsets, ivf_rows = ivf
+        centroid_distances = np.einsum("ij,ij->i", centroids, centroids) - 2.0 * (centroids @ query)
+        nprobe = min(self.nprobe, len(centroids))
+        probes = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([ivf_rows[offsets[c]:offsets[c + 1]] for c in probes] + [pending])
+        return self._scan(snapshot, query, k, np.unique(candidates))
+
+    # --- IVF ---
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """按平方欧氏距离把向量分配到最近的簇 (分块计算，内存占用与簇数 × 块大小成正比)。"""
+        centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.block_rows):
+            block = np.asarray(vectors[start:start + self.block_rows], dtype=np.float32)
+            labels[start:start + len(block)] = np.argmin(centroid_sq_norms - 2.0 * (block @ centroids.T), axis=1)
+        return labels
+
+    def _build_ivf(self):
+        """在存活向量上训练 k-means 粗聚类，并按簇重排行号。"""
+        rows = np.flatnonzero(self._alive[:self._size])
+        nlist = min(self.nlist or max(1, int(4 * math.sqrt(len(rows)))), len(rows))
+        rng = np.random.default_rng(self.seed)
+        # 训练样本：每簇最多 32 个样本
+        sample_rows = np.sort(rng.choice(rows, size=min(len(rows), nlist * 32), replace=False))
+        sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = self._assign(sample, centroids)
+            # 按簇排序后分段求和 (比 np.add.at 快一个数量级)，空簇保留原中心
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            non_empty = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[non_empty]
+            centroids[non_empty] = np.add.reduceat(sample[order], starts, axis=0) / counts[non_empty, None]
+
+        labels = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), self.block_rows):
+            block_rows = rows[start:start + self.block_rows]
+            labels[start:start + len(block_rows)] = self._assign(self._vectors[block_rows], centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(nlist + 1)).astype(np.int64)
+        self._ivf = (centroids, offsets, rows[order])
+        self._ivf_generation += 1
+        self._ivf_dirty = True
+        self._pending.clear()
+        print(f"  [ANN] ✅ IVF 索引已构建：{len(rows)} 个向量，{nlist} 个簇 (nprobe={self.nprobe})。")
+
+
+class LocalANNRAGModule(RAGModule):
+    """
+    本地向量检索后端 (type: "local_ann")：与 RAGModule 接口一致，密集检索改用 LocalVectorIndex，
+    不经过 Chroma 客户端。文档正文、元数据与行号映射保存在 SQLite 文档库中，
+    向量与 IVF 索引以 mmap 文件持久化在 db_path/local_ann/<collection_name>/ 下。
+    稀疏索引、增量摄取、融合与异步检索沿用 RAGModule 的实现。
+    """
+
+    def _open_dense_store(self):
+        ann_config = self.config.get("ann") or {}
+        store_dir = os.path.join(self.db_path, "local_ann", self.collection_name) if self.db_path else None
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+        self._store_lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(store_dir, "docstore.sqlite") if store_dir else ":memory:", check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "doc_id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, content TEXT NOT NULL, "
+                "metadata TEXT NOT NULL, content_hash TEXT NOT NULL)"
+            )
+
+        self.vector_index = LocalVectorIndex(
+            store_dir,
+            metric=ann_config.get("metric", "l2"),
+            dtype=ann_config.get("dtype", "float32"),
+            ivf_threshold=ann_config.get("ivf_threshold", 50000),
+            nlist=ann_config.get("nlist", 0),
+            nprobe=ann_config.get("nprobe", 16),
+            rebuild_ratio=ann_config.get("rebuild_ratio", 0.2),
+        )
+        # 行号 -> 文档 ID (检索结果映射)，以及删除后可复用的空闲行
+        self._row_ids: Dict[int, str] = dict((row, doc_id) for doc_id, row in self._conn.execute("SELECT doc_id, row FROM docs"))
+        self.vector_index.attach(self._row_ids)
+        self._next_row = max(self._row_ids, default=-1) + 1
+        self._free_rows = sorted(set(range(self._next_row)) - set(self._row_ids), reverse=True)
+
+        mode = f"持久化模式: {store_dir}" if store_dir else "内存模式"
+        print(f"  [RAG] 本地向量索引已创建 ({mode}, metric={self.vector_index.metric})。集合名称: {self.collection_name}")
+
+    # 共享的 sqlite3 连接不是线程安全的：检索工作线程中的读取与写入一样持有 _store_lock
+
+    def _dense_count(self) -> int:
+        with self._store_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _dense_ids(self) -> List[str]:
+        with self._store_lock:
+            return [doc_id for (doc_id,) in self._conn.execute("SELECT doc_id FROM docs ORDER BY row")]
+
+    def _iter_dense_documents(self) -> Iterable[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        with self._store_lock:
+            cursor = self._conn.execute("SELECT doc_id, content, metadata FROM docs ORDER BY row")
+        while True:
+            with self._store_lock:  # 每批单独加锁，不在 yield 期间持锁
+                rows = cursor.fetchmany(self.write_batch_size)
+            if not rows:
+                break
+            yield [r[0] for r in rows], [r[1] for r in rows], [json.loads(r[2]) for r in rows]
+
+    def _select_by_ids(self, columns: str, ids: List[str]) -> List[tuple]:
+        rows: List[tuple] = []
+        with self._store_lock:
+            for batch in self._batches(ids):
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._conn.execute(f"SELECT {columns} FROM docs WHERE doc_id IN ({placeholders})", batch))
+        return rows
+
+    def _get_content_hashes(self, ids: List[str]) -> Dict[str, str]:
+        return dict(self._select_by_ids("doc_id, content_hash", ids))
+
+    def _dense_upsert(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        with self._store_lock:
+            existing = dict(self._select_by_ids("doc_id, row", ids))
+            rows = []
+            for doc_id in ids:
+                if doc_id not in existing:
+                    existing[doc_id] = self._free_rows.pop() if self._free_rows else self._next_row
+                    self._next_row = max(self._next_row, existing[doc_id] + 1)
+                rows.append(existing[doc_id])
+            self.vector_index.put(rows, vectors)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO docs (doc_id, row, content, metadata, content_hash) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (doc_id, row, text, json.dumps(metadata, ensure_ascii=False), metadata.get("content_hash", ""))
+                        for doc_id, row, text, metadata in zip(ids, rows, texts, metadatas)
+                    ],
+                )
+            self._row_ids.update(zip(rows, ids))
+
+    def _dense_delete(self, ids: List[str]):
+        with self._store_lock:
+            rows = [row for _, row in self._select_by_ids("doc_id, row", ids)]
+            self.vector_index.remove(rows)
+            with self._conn:
+                for batch in self._batches(ids):
+                    self._conn.execute(f"DELETE FROM docs WHERE doc_id IN ({','.join('?' * len(batch))})", batch)
+            for row in rows:
+                self._row_ids.pop(row, None)
+            self._free_rows = sorted(set(self._free_rows) | set(rows), reverse=True)
+
+    def _dense_vectors(self, ids: List[str]) -> np.ndarray:
+        rows = dict(self._select_by_ids("doc_id, row", ids))
+        return self.vector_index.get([rows[doc_id] for doc_id in ids])
+
+    def _dense_commit(self):
+        self.vector_index.save()
+
+    def _dense_search_by_vector(self, query_vector: List[float] | np.ndarray, k: int) -> List[Tuple[str, float]]:
+        rows, distances = self.vector_index.search(query_vector, k)
+        hits = []
+        for row, distance in zip(rows.tolist(), distances):
+            # 单次 get：检索线程与并发删除之间不存在"先检查后读取"的窗口，已删除的行直接跳过
+            doc_id = self._row_ids.get(row)
+            if doc_id is not None:
+                hits.append((doc_id, 1.0 / (1.0 + float(distance))))
+        return hits
+
+    def _fetch_documents(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        return {
+            doc_id: Document(page_content=text, metadata=json.loads(metadata))
+            for doc_id, text, metadata in self._select_by_ids("doc_id, content, metadata", ids)
+        }
+
+    def close(self):
+        super().close()
+        self.vector_index.close()
+        self._conn.close()
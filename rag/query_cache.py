@@ -0,0 +1,153 @@
+from typing import Dict, Any, List, Tuple
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+
+# 归一化时去掉的句末标点 (中英文)
+_TRAILING_PUNCTUATION = "?？!！。.,，;；~～ "
+
+
+class SemanticQueryCache:
+    """
+    查询结果缓存 (放在 RAGAgent 的检索 + LLM 总结之前)：
+      - 精确匹配：查询归一化 (NFKC、小写、合并空白、去掉句末标点) 后取 sha256 作为键
+      - 近似匹配：查询向量与已缓存查询的余弦相似度 >= similarity_threshold 时命中
+      - TTL 过期 (ttl_seconds) + LRU 淘汰 (max_entries)
+      - 失效：每个条目记录写入时 RAGModule 的数据版本，版本变化 (摄取 / 删除) 后整体清空
+    缓存向量保存在预分配的 (max_entries, dim) 矩阵中，近似匹配是一次矩阵-向量乘法。
+    """
+    def __init__(self, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.similarity_threshold = config.get("similarity_threshold", 0.95)
+        self.ttl_seconds = config.get("ttl_seconds", 3600)
+        self.max_entries = config.get("max_entries", 1024)
+        # semantic: false 时只做精确匹配，不计算查询向量
+        self.semantic = config.get("semantic", True)
+
+        self._lock = threading.Lock()
+        # 键 -> (结果, 写入时间, 向量槽位 或 -1)，按最近使用排序
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._vectors: np.ndarray | None = None
+        self._slot_keys: List[str | None] = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._version: Any = None
+        self.stats = {"exact_hits": 0, "exact_misses": 0, "semantic_hits": 0, "semantic_misses": 0,
+                      "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        text = unicodedata.normalize("NFKC", query).lower()
+        text = re.sub(r"\s+", " ", text).strip()
+        return text.rstrip(_TRAILING_PUNCTUATION)
+
+    @classmethod
+    def make_key(cls, query: str) -> str:
+        return hashlib.sha256(cls.normalize(query).encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- 内部维护 (调用方持有锁) ---
+
+    def _sync_version(self, version: Any):
+        """数据版本变化时清空缓存：摄取或删除之后，旧答案可能已经过时。"""
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+                print(f"  [QueryCache] ♻️ 知识库已更新 (版本 {self._version} -> {version})，清空 {len(self._entries)} 条缓存结果。")
+                self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _drop(self, key: str):
+        _, _, slot = self._entries.pop(key)
+        if slot >= 0:
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    # --- 公共接口 ---
+
+    def get_exact(self, query: str, version: Any = None) -> Any | None:
+        """按归一化查询精确匹配，未命中 (或已过期) 返回 None。"""
+        key = self.make_key(query)
+        now = time.time()
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["exact_misses"] += 1
+                return None
+            if self._expired(entry[1], now):
+                self._drop(key)
+                self.stats["expired"] += 1
+                self.stats["exact_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry[0]
+
+    def get_similar(self, query_vector: List[float] | np.ndarray, version: Any = None) -> Tuple[Any, float] | None:
+        """按查询向量做近似匹配，返回 (结果, 相似度)；没有相似度达到阈值的条目时返回 None。"""
+        vector = self._unit(query_vector)
+        now = time.time()
+        with self._lock:
+            self._sync_version(version)
+            occupied = [slot for slot, key in enumerate(self._slot_keys) if key is not None]
+            if self._vectors is None or not occupied or vector.shape[0] != self._vectors.shape[1]:
+                self.stats["semantic_misses"] += 1
+                return None
+            similarities = self._vectors[occupied] @ vector
+            for position in np.argsort(-similarities):
+                similarity = float(similarities[position])
+                if similarity < self.similarity_threshold:
+                    break
+                key = self._slot_keys[occupied[position]]
+                result, created, _ = self._entries[key]
+                if self._expired(created, now):
+                    self._drop(key)
+                    self.stats["expired"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.stats["semantic_hits"] += 1
+                return result, similarity
+            self.stats["semantic_misses"] += 1
+            return None
+
+    def put(self, query: str, result: Any, version: Any = None, query_vector: List[float] | np.ndarray | None = None):
+        """写入结果；提供查询向量时同时参与近似匹配。超过 max_entries 时淘汰最久未使用的条目。"""
+        key = self.make_key(query)
+        with self._lock:
+            self._sync_version(version)
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+            slot = -1
+            if query_vector is not None and self.semantic:
+                vector = self._unit(query_vector)
+                if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                    # 首次写入时按维度分配矩阵；Embedding 维度变化时旧条目不可比较，一并清空
+                    if self._vectors is not None:
+                        self._clear()
+                    self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+            self._entries[key] = (result, time.time(), slot)
+
+    @staticmethod
+    def _unit(query_vector: List[float] | np.ndarray) -> np.ndarray:
+        vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
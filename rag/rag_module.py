@@ -1,21 +1,91 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import heapq
+import os
+import threading
+import numpy as np
 from models.llm_abc import AbstractEmbedding 
 import chromadb
 # --- 导入 LangChain 相关组件 ---
-from langchain_community.vectorstores import Chroma
-# 修正：EnsembleRetriever 已移至 langchain.retrievers
-from langchain.retrievers import EnsembleRetriever 
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
+from rag.sparse_index import SparseIndex
+from rag.tokenization import create_tokenizer, TokenStreamCache
+from rag.ingestion import EmbeddingIngestionPipeline
+
+# 全局缓存：按 db_path 复用 Chroma 客户端 (空字符串表示内存模式)
+_CHROMA_CLIENTS: Dict[str, Any] = {}
+_CHROMA_CLIENTS_LOCK = threading.Lock()
+
+def _get_chroma_client(db_path: str | None):
+    """获取 (或创建) 指定路径的 Chroma 客户端；未配置路径时使用内存客户端。"""
+    client_key = os.path.abspath(db_path) if db_path else ""
+    with _CHROMA_CLIENTS_LOCK:
+        if client_key not in _CHROMA_CLIENTS:
+            if client_key:
+                os.makedirs(client_key, exist_ok=True)
+                _CHROMA_CLIENTS[client_key] = chromadb.PersistentClient(path=client_key)
+            else:
+                _CHROMA_CLIENTS[client_key] = chromadb.Client()
+        return _CHROMA_CLIENTS[client_key]
+
+class FusionEngine:
+    """
+    混合检索融合阶段：将各检索腿 (sparse / dense) 的 [(doc_id, score)] 融合为最终排序。
+      - rrf:      加权倒数排名融合，score = Σ w_leg / (c + rank)
+      - weighted: 加权分数融合，各腿分数先除以本腿最高分，再按权重求和
+      - convex:   凸组合，各腿分数 min-max 归一化后按归一化权重 (和为 1) 组合
+    融合只在 doc_id 上进行，最终用堆取出 Top-K，正文只为 Top-K 读取。
+    """
+    METHODS = ("rrf", "weighted", "convex")
+
+    def __init__(self, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.method = config.get("method", "rrf").lower()
+        if self.method not in self.METHODS:
+            raise ValueError(f"不支持的融合方法: {self.method}，可选值: {self.METHODS}")
+        self.weights: Dict[str, float] = {"sparse": 0.5, "dense": 0.5}
+        self.weights.update(config.get("weights") or {})
+        self.rrf_c = config.get("rrf_c", 100) # RRF 算法的常数因子
+
+    def fuse(self, legs: Dict[str, List[Tuple[str, float]]], top_k: int) -> List[Tuple[str, float]]:
+        """legs: {腿名称: 按得分降序的 [(doc_id, score)]}，返回融合后的 Top-K [(doc_id, fused_score)]。"""
+        fused: Dict[str, float] = {}
+        if self.method == "rrf":
+            for leg, hits in legs.items():
+                weight = self.weights.get(leg, 0.0)
+                for rank, (doc_id, _) in enumerate(hits, start=1):
+                    fused[doc_id] = fused.get(doc_id, 0.0) + weight / (self.rrf_c + rank)
+        elif self.method == "weighted":
+            for leg, hits in legs.items():
+                weight = self.weights.get(leg, 0.0)
+                max_score = max((score for _, score in hits), default=0.0)
+                for doc_id, score in hits:
+                    normalized = score / max_score if max_score > 0 else 0.0
+                    fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+        else:
+            total_weight = sum(self.weights.get(leg, 0.0) for leg in legs) or 1.0
+            for leg, hits in legs.items():
+                alpha = self.weights.get(leg, 0.0) / total_weight
+                scores = [score for _, score in hits]
+                low, high = min(scores, default=0.0), max(scores, default=0.0)
+                for doc_id, score in hits:
+                    normalized = (score - low) / (high - low) if high > low else 1.0
+                    fused[doc_id] = fused.get(doc_id, 0.0) + alpha * normalized
+        return heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
 
-# 全局变量用于存储内存中的 Chroma 客户端
-_CHROMA_CLIENT = None
 
 class RAGModule:
     """
     RAG 核心模块：负责索引创建、数据摄取和混合搜索逻辑。
     它依赖于一个 AbstractEmbedding 实例进行向量化。
+    密集向量存储默认使用 Chroma；子类可覆盖 _open_dense_store / _dense_* 系列方法替换为其他后端，
+    稀疏索引、增量摄取与融合逻辑保持共用。
     """
+    # 只读后端 (如快照) 不允许 upsert / delete
+    read_only = False
+
     def __init__(self, embedding_model: AbstractEmbedding, config: Dict[str, Any]):
         """
         初始化 RAG 模块，注入 Embedding 模型。
@@ -25,80 +95,321 @@ class RAGModule:
         self.collection_name = config.get("collection_name", "rag_collection")
         self.search_k = config.get("search_k", 5) # 检索文档数量
 
-        # 1. 初始化 Chroma 客户端 (内存模式，或持久化模式)
-        global _CHROMA_CLIENT
-        if _CHROMA_CLIENT is None:
-            # 实际项目中，这里可以配置为 chromadb.PersistentClient 或远程客户端
-            _CHROMA_CLIENT = chromadb.Client() 
-        self.client = _CHROMA_CLIENT
+        # 融合阶段：方法 / 权重可配置，各检索腿的候选数量可单独调节 (召回 vs 延迟)
+        fusion_config = config.get("fusion") or {}
+        self.fusion = FusionEngine(fusion_config)
+        self.sparse_k = fusion_config.get("sparse_k", self.search_k)
+        self.dense_k = fusion_config.get("dense_k", self.search_k)
+        # 最近一次检索的各腿候选数量，以及累计统计
+        self.last_search_stats: Dict[str, int] = {}
+        self.search_stats: Dict[str, int] = {"searches": 0, "sparse_candidates": 0, "dense_candidates": 0, "fused_candidates": 0}
+        self._stats_lock = threading.Lock()
+        # 数据版本：每次 upsert 实际写入或删除文档后加一，供上层结果缓存判断是否失效
+        self.version = 0
+        # 单次读写 Chroma 的最大文档数 (避免超出 SQLite 变量上限)
+        self.write_batch_size = config.get("write_batch_size", 512)
+
+        # 1. 初始化密集向量存储：配置了 db_path 时使用持久化模式，否则使用内存模式
+        self.db_path = config.get("db_path") if config.get("persistent", True) else None
+        self._open_dense_store()
+
+        # 批量并发向量化流水线 (ingestion 配置：batch_size / max_concurrency / max_retries / retry_backoff)
+        self.ingestion = EmbeddingIngestionPipeline(self.embedder, config.get("ingestion"))
+
+        # 异步检索使用的有界线程池：同步的稀疏检索 / 向量检索在这里执行，不阻塞事件循环
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=config.get("search_workers", 4), thread_name_prefix=f"rag-{self.collection_name}")
+
+        print(f"  [RAG] {self.__class__.__name__} 已初始化，使用 Embedding 模型: {self.embedder.__class__.__name__}")
+
+        # 2. 稀疏索引：原生 BM25 倒排索引，持久化在 db_path/sparse/<集合名> 下 (mmap 加载)
+        #    分词器由 tokenizer 配置决定；文档 token 流在摄取时计算一次并缓存在索引目录中
+        sparse_config = config.get("sparse") or {}
+        sparse_dir = os.path.join(self.db_path, "sparse", self.collection_name) if self.db_path else None
+        self.tokenizer = create_tokenizer(config.get("tokenizer"))
+        if sparse_dir:
+            os.makedirs(sparse_dir, exist_ok=True)
+        self.token_cache = TokenStreamCache(
+            os.path.join(sparse_dir, "token_cache.sqlite") if sparse_dir and not self.read_only else ":memory:")
+        self.sparse_index = SparseIndex(
+            sparse_dir,
+            tokenizer=self.tokenizer.tokenize,
+            tokenizer_signature=self.tokenizer.signature,
+            k1=sparse_config.get("k1", 1.5),
+            b=sparse_config.get("b", 0.75),
+            max_segments=sparse_config.get("max_segments", 8),
+            read_only=self.read_only,
+        )
+        print(f"  [RAG] 稀疏检索分词器: {self.tokenizer.signature}")
+
+        # 持久化集合中已有数据时，直接组装检索器，无需重新摄取
+        stored_count = self._dense_count()
+        if stored_count > 0:
+            print(f"  [RAG] 发现已持久化的 {stored_count} 个文档，直接加载索引。")
+            if len(self.sparse_index) != stored_count and not self.read_only:
+                # 稀疏索引缺失或与集合不一致 (例如从旧版本升级)，从集合一次性重建
+                self._rebuild_sparse_index()
 
-        self.vectorstore: Chroma | None = None
-        self.retriever: EnsembleRetriever | None = None
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """文档内容哈希，用于判断文档是否发生变化。"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-        print(f"  [RAG] RAGModule 已初始化，使用 Embedding 模型: {self.embedder.__class__.__name__}")
-        print(f"  [RAG] ChromaDB 客户端已创建 (内存模式)。集合名称: {self.collection_name}")
+    @classmethod
+    def make_doc_id(cls, text: str) -> str:
+        """未显式提供 ID 时，根据内容生成稳定的文档 ID。"""
+        return f"doc-{cls.content_hash(text)[:32]}"
 
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"RAG 模块 '{self.collection_name}' 为只读 ({self.__class__.__name__})，不能写入文档。")
 
-    def ingest_data(self, documents: List[str]):
+    def _batches(self, items: List[Any]) -> Iterable[List[Any]]:
+        for start in range(0, len(items), self.write_batch_size):
+            yield items[start:start + self.write_batch_size]
+
+    # --- 密集向量存储 (Chroma) ---
+
+    def _open_dense_store(self):
+        """创建 Chroma 客户端与集合 (向量由注入的 Embedding 模型计算，不使用 Chroma 内置的向量化函数)。"""
+        self.client = _get_chroma_client(self.db_path)
+        self.collection = self.client.get_or_create_collection(name=self.collection_name, embedding_function=None)
+        mode = f"持久化模式: {self.db_path}" if self.db_path else "内存模式"
+        print(f"  [RAG] ChromaDB 客户端已创建 ({mode})。集合名称: {self.collection_name}")
+
+    def _dense_count(self) -> int:
+        return self.collection.count()
+
+    def _dense_ids(self) -> List[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def _iter_dense_documents(self) -> Iterable[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """分页遍历已存储的文档，产出 (ids, texts, metadatas)。"""
+        offset = 0
+        while True:
+            stored = self.collection.get(include=["documents", "metadatas"], limit=self.write_batch_size, offset=offset)
+            if not stored["ids"]:
+                break
+            yield stored["ids"], stored["documents"], [metadata or {} for metadata in stored["metadatas"]]
+            offset += len(stored["ids"])
+
+    def _dense_delete(self, ids: List[str]):
+        for batch in self._batches(ids):
+            self.collection.delete(ids=batch)
+
+    def _dense_vectors(self, ids: List[str]) -> np.ndarray:
+        """按 ID 顺序读取已存储的向量 (导出快照时使用)。"""
+        stored = self.collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        return np.asarray([by_id[doc_id] for doc_id in ids], dtype=np.float32)
+
+    def _dense_commit(self):
+        """一次 upsert / delete 结束后调用，供需要显式落盘的后端使用 (Chroma 每次写入即持久化)。"""
+
+    def _get_content_hashes(self, ids: List[str]) -> Dict[str, str]:
+        """查询已存储文档的内容哈希 {doc_id: content_hash}，不存在的 ID 不会出现在结果中。"""
+        hashes: Dict[str, str] = {}
+        for batch in self._batches(ids):
+            existing = self.collection.get(ids=batch, include=["metadatas"])
+            for doc_id, metadata in zip(existing["ids"], existing["metadatas"]):
+                hashes[doc_id] = (metadata or {}).get("content_hash", "")
+        return hashes
+
+    def upsert_documents(self, documents: List[str], ids: List[str] | None = None,
+                         metadatas: List[Dict[str, Any]] | None = None) -> Dict[str, int]:
         """
-        数据摄取和索引创建过程。
-        将文本数据转换为 LangChain Document 结构，并导入 ChromaDB。
+        增量写入文档：按文档 ID 与内容哈希比对，只对新增或内容变化的文档做向量化和写入。
+        ids 未提供时根据内容生成稳定 ID。返回 {"added": n, "updated": n, "skipped": n}。
         """
-        if self.vectorstore is not None:
-             # 如果已经初始化过，为了演示效果，可以先清空集合
-             self.client.delete_collection(name=self.collection_name)
-             self.vectorstore = None
-             
-        print(f"\n  [RAG] 开始摄取 {len(documents)} 份文档，并创建索引...")
-        
-        # 1. 将字符串列表转换为 LangChain Document 列表
-        lc_documents = [Document(page_content=doc) for doc in documents]
-
-        # 2. **密集索引 (Dense Index):** 使用注入的 AbstractEmbedding 实例创建 Chroma
-        
-        # *** 兼容处理：为了让 Chroma 正常工作，EmbeddingFactory 需返回一个 LangChain 兼容的实例 ***
-        # 我们假设 self.embedder 是 LangChain Embeddings 的一个兼容子集。
-        
-        self.vectorstore = Chroma(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding_function=self.embedder # <--- 假定它兼容 LangChain Embeddings 接口
-        )
-        self.vectorstore.add_documents(lc_documents)
-        print(f"  [RAG] ✅ 密集向量索引已创建 ({len(lc_documents)} 个文档)。")
-
-        # 3. **稀疏索引 (Sparse Index):** 使用 BM25 创建稀疏索引
-        bm25_retriever = BM25Retriever.from_documents(lc_documents)
-        bm25_retriever.k = self.search_k 
-        print("  [RAG] ✅ 稀疏 BM25 索引已创建。")
-
-        # 4. **组合检索器 (Hybrid Search):** 使用 EnsembleRetriever 合并检索器
-        self.retriever = EnsembleRetriever(
-            retrievers=[bm25_retriever, self.vectorstore.as_retriever(k=self.search_k)],
-            weights=[0.5, 0.5], # 稀疏搜索和密集搜索各占 50% 权重
-            c=100 # RRF 算法的常数因子
-        )
-        print("  [RAG] ✅ 混合搜索 (EnsembleRetriever/RRF) 组装完成。")
+        self._check_writable()
+        if ids is None:
+            ids = [self.make_doc_id(doc) for doc in documents]
+        if len(ids) != len(documents) or (metadatas is not None and len(metadatas) != len(documents)):
+            raise ValueError("upsert_documents: documents、ids、metadatas 的长度必须一致。")
 
+        # 同一批次内重复的 ID 以最后一次出现为准
+        latest: Dict[str, int] = {doc_id: i for i, doc_id in enumerate(ids)}
+        existing_hashes = self._get_content_hashes(list(latest))
 
-    def hybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        changed_ids, changed_texts, changed_metadatas = [], [], []
+        added = updated = 0
+        for doc_id, i in latest.items():
+            text = documents[i]
+            digest = self.content_hash(text)
+            if existing_hashes.get(doc_id) == digest:
+                continue
+            if doc_id in existing_hashes:
+                updated += 1
+            else:
+                added += 1
+            metadata = dict(metadatas[i]) if metadatas is not None and metadatas[i] else {}
+            metadata.update({"doc_id": doc_id, "content_hash": digest})
+            changed_ids.append(doc_id)
+            changed_texts.append(text)
+            changed_metadatas.append(metadata)
+
+        skipped = len(latest) - len(changed_ids)
+        print(f"\n  [RAG] 增量摄取 {len(documents)} 份文档：新增 {added}，更新 {updated}，跳过未变化 {skipped}。")
+
+        if changed_ids:
+            # 批次向量化完成后立即写入密集索引与稀疏索引，两者按批次保持一致
+            try:
+                self.ingestion.run(changed_ids, changed_texts, changed_metadatas, self._write_batch)
+            finally:
+                self._dense_commit()
+                self.sparse_index.save()
+                self.version += 1
+            print(f"  [RAG] ✅ 密集向量索引已更新 ({len(changed_ids)} 个文档)。")
+            print(f"  [RAG] ✅ 稀疏 BM25 索引已增量更新 (共 {len(self.sparse_index)} 个文档)。")
+
+        return {"added": added, "updated": updated, "skipped": skipped}
+
+    def _dense_upsert(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        """写入密集索引 (Chroma 集合直接接收 ndarray)。"""
+        self.collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
+    def _write_batch(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        """摄取流水线的批次写入回调：写入密集索引，并对该批次分词 (命中缓存则复用) 写入稀疏索引。"""
+        self._dense_upsert(ids, vectors, texts, metadatas)
+        hashes = [metadata["content_hash"] for metadata in metadatas]
+        self.sparse_index.add_tokens(ids, self.token_cache.tokenize_many(self.tokenizer, texts, hashes))
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """按文档 ID 删除文档，返回实际删除的数量。"""
+        self._check_writable()
+        existing_ids = list(self._get_content_hashes(list(dict.fromkeys(ids))))
+        if existing_ids:
+            self._dense_delete(existing_ids)
+            self._dense_commit()
+            self.version += 1
+        print(f"  [RAG] 🗑️ 已删除 {len(existing_ids)} 个文档。")
+        if existing_ids:
+            self.sparse_index.remove(existing_ids)
+            self.sparse_index.save()
+        return len(existing_ids)
+
+    def ingest_data(self, documents: List[str], ids: List[str] | None = None, replace: bool = False) -> Dict[str, int]:
         """
-        实现混合搜索逻辑 (Dense + Sparse)，使用 EnsembleRetriever。
+        数据摄取入口 (兼容旧接口)，内部使用增量 upsert，未变化的文档不会重新向量化。
+        replace=True 时额外删除集合中不在本次文档集合内的旧文档。
         """
-        if self.retriever is None:
-            # 尝试在搜索前先进行数据摄取（如果可能，但为了演示清晰，最好在 main.py 中明确调用）
-            # raise RuntimeError("RAG 模块未进行数据摄取/初始化，请先调用 ingest_data()。")
-            pass # 允许继续，但如果未初始化 retriever 会报错
+        if ids is None:
+            ids = [self.make_doc_id(doc) for doc in documents]
+        stats = self.upsert_documents(documents, ids=ids)
+        if replace:
+            keep = set(ids)
+            stale_ids = [doc_id for doc_id in self._dense_ids() if doc_id not in keep]
+            stats["deleted"] = self.delete_documents(stale_ids) if stale_ids else 0
+        return stats
 
-        print(f"\n  [RAG] 正在执行混合搜索 (查询: '{query}') ...")
-        
-        # 调用 EnsembleRetriever 进行混合搜索和 RRF 重排序
-        retrieved_docs: List[Document] = self.retriever.get_relevant_documents(query)
+    def _rebuild_sparse_index(self):
+        """从密集存储全量重建稀疏索引 (仅在索引缺失或分词规则变化时使用，token 流优先取自缓存)。"""
+        self.sparse_index.clear()
+        for ids, texts, metadatas in self._iter_dense_documents():
+            hashes = [metadata.get("content_hash") or self.content_hash(text) for text, metadata in zip(texts, metadatas)]
+            self.sparse_index.add_tokens(ids, self.token_cache.tokenize_many(self.tokenizer, texts, hashes))
+        self.sparse_index.save()
+        print(f"  [RAG] ✅ 稀疏 BM25 索引已从集合重建 ({len(self.sparse_index)} 个文档)。")
+
+    # --- 检索 ---
 
+    def _sparse_search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """稀疏检索腿：BM25 Top-K [(doc_id, score)]。"""
+        return self.sparse_index.search(query, k)
+
+    def _dense_search_by_vector(self, query_vector: List[float] | np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """密集检索腿：按查询向量近邻检索，距离转换为越大越相似的分数 [(doc_id, score)]。"""
+        result = self.collection.query(query_embeddings=[query_vector], n_results=k, include=["distances"])
+        return [(doc_id, 1.0 / (1.0 + distance)) for doc_id, distance in zip(result["ids"][0], result["distances"][0])]
+
+    def _fetch_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """按 ID 读取文档正文与元数据。"""
+        if not ids:
+            return {}
+        stored = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: Document(page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+
+    def _fuse(self, sparse_hits: List[Tuple[str, float]], dense_hits: List[Tuple[str, float]], top_k: int) -> List[Tuple[Document, float]]:
+        """融合两路候选，只为 Top-K 读取正文，并记录各腿候选数量。"""
+        fused = self.fusion.fuse({"sparse": sparse_hits, "dense": dense_hits}, top_k)
+        documents = self._fetch_documents([doc_id for doc_id, _ in fused])
+
+        stats = {
+            "sparse_candidates": len(sparse_hits),
+            "dense_candidates": len(dense_hits),
+            "fused_candidates": len({doc_id for doc_id, _ in sparse_hits} | {doc_id for doc_id, _ in dense_hits}),
+        }
+        with self._stats_lock:
+            self.last_search_stats = dict(stats, returned=len(fused))
+            self.search_stats["searches"] += 1
+            for key, value in stats.items():
+                self.search_stats[key] += value
+        print(f"  [RAG] 融合 ({self.fusion.method})：稀疏候选 {stats['sparse_candidates']}，密集候选 {stats['dense_candidates']}，"
+              f"去重后 {stats['fused_candidates']}，返回 {len(fused)}。")
+        return [(documents[doc_id], score) for doc_id, score in fused if doc_id in documents]
+
+    @staticmethod
+    def _format_results(scored_docs: List[Tuple[Document, float]]) -> List[str]:
         results = [
             f"--- 检索结果 {i+1} ---\n{doc.page_content}" 
-            for i, doc in enumerate(retrieved_docs[:top_k])
+            for i, (doc, _) in enumerate(scored_docs)
         ]
-        
-        print(f"  [RAG] ✅ 混合搜索完成，返回 {len(retrieved_docs[:top_k])} 个结果。")
-        return results
\ No newline at end of file
+        print(f"  [RAG] ✅ 混合搜索完成，返回 {len(results)} 个结果。")
+        return results
+
+    def hybrid_search_with_scores(self, query: str, top_k: int = 5) -> List[Tuple[Document, float]]:
+        """同步混合搜索，返回 [(Document, 融合分数)]，按分数降序。"""
+        if len(self.sparse_index) == 0:
+            print("  [RAG] ⚠️ 索引为空，请先调用 upsert_documents() / ingest_data() 摄取数据。")
+            return []
+
+        print(f"\n  [RAG] 正在执行混合搜索 (查询: '{query}') ...")
+        sparse_hits = self._sparse_search(query, self.sparse_k)
+        dense_hits = self._dense_search_by_vector(self.embedder.embed_query_array(query), self.dense_k)
+        return self._fuse(sparse_hits, dense_hits, top_k)
+
+    async def ahybrid_search_with_scores(self, query: str, top_k: int = 5) -> List[Tuple[Document, float]]:
+        """
+        异步混合搜索：稀疏与密集两路并发执行，完成后再融合，不阻塞事件循环。
+        Embedding 模型提供原生 aembed_query 时直接 await，其余同步步骤在有界线程池中执行。
+        """
+        if len(self.sparse_index) == 0:
+            print("  [RAG] ⚠️ 索引为空，请先调用 upsert_documents() / ingest_data() 摄取数据。")
+            return []
+
+        print(f"\n  [RAG] 正在执行异步混合搜索 (查询: '{query}') ...")
+        loop = asyncio.get_running_loop()
+
+        async def dense_leg() -> List[Tuple[str, float]]:
+            if self.embedder.has_native_async():
+                query_vector = await self.embedder.aembed_query(query)
+            else:
+                query_vector = await loop.run_in_executor(self._search_executor, self.embedder.embed_query_array, query)
+            return await loop.run_in_executor(
+                self._search_executor, self._dense_search_by_vector, query_vector, self.dense_k)
+
+        sparse_hits, dense_hits = await asyncio.gather(
+            loop.run_in_executor(self._search_executor, self._sparse_search, query, self.sparse_k),
+            dense_leg(),
+        )
+        return await loop.run_in_executor(self._search_executor, self._fuse, sparse_hits, dense_hits, top_k)
+
+    def hybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        """
+        实现混合搜索逻辑 (Dense + Sparse)，融合方式由 fusion 配置决定。
+        同步版本，会阻塞调用线程；在协程中请使用 ahybrid_search。
+        """
+        return self._format_results(self.hybrid_search_with_scores(query, top_k))
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        """hybrid_search 的异步版本 (两路并发)。"""
+        return self._format_results(await self.ahybrid_search_with_scores(query, top_k))
+
+    def close(self):
+        """释放检索线程池、稀疏索引 mmap 与 token 缓存连接。"""
+        self._search_executor.shutdown(wait=False)
+        self.sparse_index.close()
+        self.token_cache.close()
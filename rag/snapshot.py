@@ -0,0 +1,268 @@
+from typing import List, Dict, Any, Iterable, Tuple
+import argparse
+import json
+import mmap
+import os
+import shutil
+import time
+import numpy as np
+from models.llm_abc import AbstractEmbedding
+from langchain_core.documents import Document
+from rag.rag_module import RAGModule
+from rag.local_ann import LocalVectorIndex
+from rag.sparse_index import SparseIndex
+
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# 快照目录结构：
+#   manifest.json                 提交点 (最后写入)：版本、文档数、Embedding 模型、分词器与索引参数
+#   vectors/                      LocalVectorIndex 格式 (vectors.bin + 可选 IVF 文件)，行号即文档序号
+#   docs/ids.json                 行号 -> 文档 ID
+#   docs/{texts,metadata}.bin     UTF-8 正文 / JSON 元数据依次拼接，{texts,metadata}.offsets.npy 为各行起止偏移
+#   sparse/<collection_name>/     SparseIndex 格式 (单一分段)
+
+
+class _DocStoreWriter:
+    """顺序写入平铺文档库：正文与元数据各写一个拼接文件，偏移量最后统一写出。"""
+    def __init__(self, docs_dir: str):
+        os.makedirs(docs_dir, exist_ok=True)
+        self.docs_dir = docs_dir
+        self.ids: List[str] = []
+        self._files = {name: open(os.path.join(docs_dir, f"{name}.bin"), "wb") for name in ("texts", "metadata")}
+        self._offsets = {name: [0] for name in self._files}
+
+    def _append(self, name: str, payload: bytes):
+        self._files[name].write(payload)
+        self._offsets[name].append(self._offsets[name][-1] + len(payload))
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            self.ids.append(doc_id)
+            self._append("texts", text.encode("utf-8"))
+            self._append("metadata", json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+
+    def close(self):
+        for name, f in self._files.items():
+            f.close()
+            np.save(os.path.join(self.docs_dir, f"{name}.offsets.npy"), np.asarray(self._offsets[name], dtype=np.int64))
+        with open(os.path.join(self.docs_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+
+
+class _DocStoreReader:
+    """只读文档库：拼接文件与偏移量均通过 mmap 映射，按行切片解码，不把正文读入进程内存。"""
+    def __init__(self, docs_dir: str):
+        with open(os.path.join(docs_dir, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self.rows: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._files, self._blobs, self._offsets = [], {}, {}
+        for name in ("texts", "metadata"):
+            self._offsets[name] = np.load(os.path.join(docs_dir, f"{name}.offsets.npy"), mmap_mode="r")
+            f = open(os.path.join(docs_dir, f"{name}.bin"), "rb")
+            self._files.append(f)
+            # 空文件无法 mmap
+            self._blobs[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(f.name) else b""
+
+    def _read(self, name: str, row: int) -> str:
+        offsets = self._offsets[name]
+        return self._blobs[name][int(offsets[row]):int(offsets[row + 1])].decode("utf-8")
+
+    def text(self, row: int) -> str:
+        return self._read("texts", row)
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._read("metadata", row))
+
+    def close(self):
+        for blob in self._blobs.values():
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+        for f in self._files:
+            f.close()
+        self._blobs, self._files = {}, []
+
+
+def load_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"快照 {snapshot_dir} 不存在或尚未构建完成 (缺少 {MANIFEST_NAME})。")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise RuntimeError(f"快照 {snapshot_dir} 的格式版本 {manifest.get('version')} 与当前版本 {SNAPSHOT_VERSION} 不一致。")
+    return manifest
+
+
+def build_snapshot(source: RAGModule, snapshot_dir: str) -> Dict[str, Any]:
+    """
+    离线构建：把已摄取的 RAG 模块 (任意后端) 导出为只读快照，不重新向量化。
+    先写入临时目录，manifest 最后写入，再整体替换 snapshot_dir；
+    正在服务的进程仍持有旧文件的映射，不受替换影响，重启后加载新快照。
+    返回 manifest。
+    """
+    started = time.perf_counter()
+    snapshot_dir = os.path.abspath(snapshot_dir)
+    staging_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    ann_config = source.config.get("ann") or {}
+    vector_index = LocalVectorIndex(
+        os.path.join(staging_dir, "vectors"),
+        metric=ann_config.get("metric", "l2"),
+        dtype=ann_config.get("dtype", "float32"),
+        ivf_threshold=ann_config.get("ivf_threshold", 50000),
+        nlist=ann_config.get("nlist", 0),
+        nprobe=ann_config.get("nprobe", 16),
+    )
+    sparse_config = source.config.get("sparse") or {}
+    sparse_index = SparseIndex(
+        os.path.join(staging_dir, "sparse", source.collection_name),
+        tokenizer=source.tokenizer.tokenize,
+        tokenizer_signature=source.tokenizer.signature,
+        k1=source.sparse_index.k1,
+        b=source.sparse_index.b,
+    )
+    docs = _DocStoreWriter(os.path.join(staging_dir, "docs"))
+    try:
+        for ids, texts, metadatas in source._iter_dense_documents():
+            rows = list(range(len(docs.ids), len(docs.ids) + len(ids)))
+            vector_index.put(rows, source._dense_vectors(ids))
+            docs.add(ids, texts, metadatas)
+            hashes = [metadata.get("content_hash") or source.content_hash(text) for text, metadata in zip(texts, metadatas)]
+            sparse_index.add_tokens(ids, source.token_cache.tokenize_many(source.tokenizer, texts, hashes))
+    finally:
+        docs.close()
+    # 单一分段，服务端无需合并
+    sparse_index.max_segments = 0
+    sparse_index.save()
+    sparse_index.close()
+    vector_index.save()
+    vector_index.close()
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "collection_name": source.collection_name,
+        "num_docs": len(docs.ids),
+        "dim": vector_index.dim,
+        "embedding_model": getattr(source.embedder, "model_name", source.embedder.__class__.__name__),
+        "ann": {"metric": vector_index.metric, "dtype": vector_index.dtype.name, "nprobe": vector_index.nprobe},
+        "tokenizer": source.config.get("tokenizer"),
+        "tokenizer_signature": source.tokenizer.signature,
+        "sparse": dict(sparse_config, k1=source.sparse_index.k1, b=source.sparse_index.b),
+    }
+    with open(os.path.join(staging_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    retired_dir = f"{snapshot_dir}.old-{os.getpid()}"
+    if os.path.exists(snapshot_dir):
+        os.replace(snapshot_dir, retired_dir)
+    os.replace(staging_dir, snapshot_dir)
+    shutil.rmtree(retired_dir, ignore_errors=True)
+    print(f"  [Snapshot] ✅ 已构建快照 {snapshot_dir}：{manifest['num_docs']} 个文档 "
+          f"(dim={manifest['dim']})，耗时 {time.perf_counter() - started:.2f}s。")
+    return manifest
+
+
+class SnapshotRAGModule(RAGModule):
+    """
+    只读快照后端 (type: "snapshot")：从 build_snapshot 生成的目录加载，向量、文档正文与倒排表
+    全部以只读 mmap 映射，多个服务进程共享同一份页缓存，启动时无需摄取或重建索引。
+    集合名、分词器与稀疏参数以快照 manifest 为准，配置中只需提供 snapshot_dir 与 Embedding 依赖。
+    """
+    read_only = True
+
+    def __init__(self, embedding_model: AbstractEmbedding, config: Dict[str, Any]):
+        self.snapshot_dir = config["snapshot_dir"]
+        self.manifest = load_manifest(self.snapshot_dir)
+        model_name = getattr(embedding_model, "model_name", None)
+        if model_name and model_name != self.manifest["embedding_model"]:
+            raise ValueError(f"快照由 Embedding 模型 '{self.manifest['embedding_model']}' 构建，"
+                             f"当前注入的是 '{model_name}'，查询向量与索引不兼容。")
+        # 稀疏索引位于 snapshot_dir/sparse/<collection_name>，与 RAGModule 的 db_path 布局一致
+        config = dict(
+            config,
+            db_path=self.snapshot_dir,
+            persistent=True,
+            collection_name=self.manifest["collection_name"],
+            tokenizer=self.manifest["tokenizer"],
+            sparse=self.manifest["sparse"],
+        )
+        super().__init__(embedding_model, config)
+
+    def _open_dense_store(self):
+        ann_config = self.manifest["ann"]
+        self.vector_index = LocalVectorIndex(
+            os.path.join(self.snapshot_dir, "vectors"),
+            metric=ann_config["metric"],
+            dtype=ann_config["dtype"],
+            nprobe=(self.config.get("ann") or {}).get("nprobe", ann_config["nprobe"]),
+            read_only=True,
+        )
+        self.docstore = _DocStoreReader(os.path.join(self.snapshot_dir, "docs"))
+        self.vector_index.attach(range(len(self.docstore.ids)))
+        print(f"  [RAG] 已映射只读快照 {self.snapshot_dir} ({self.manifest['num_docs']} 个文档，"
+              f"构建于 {self.manifest['created_at']})。")
+
+    def _dense_count(self) -> int:
+        return len(self.docstore.ids)
+
+    def _dense_ids(self) -> List[str]:
+        return list(self.docstore.ids)
+
+    def _iter_dense_documents(self) -> Iterable[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        for start in range(0, len(self.docstore.ids), self.write_batch_size):
+            rows = range(start, min(start + self.write_batch_size, len(self.docstore.ids)))
+            yield ([self.docstore.ids[row] for row in rows], [self.docstore.text(row) for row in rows],
+                   [self.docstore.metadata(row) for row in rows])
+
+    def _get_content_hashes(self, ids: List[str]) -> Dict[str, str]:
+        rows = self.docstore.rows
+        return {doc_id: self.docstore.metadata(rows[doc_id]).get("content_hash", "") for doc_id in ids if doc_id in rows}
+
+    def _dense_vectors(self, ids: List[str]) -> np.ndarray:
+        return self.vector_index.get([self.docstore.rows[doc_id] for doc_id in ids])
+
+    def _dense_search_by_vector(self, query_vector: List[float] | np.ndarray, k: int) -> List[Tuple[str, float]]:
+        rows, distances = self.vector_index.search(query_vector, k)
+        return [(self.docstore.ids[row], 1.0 / (1.0 + float(distance))) for row, distance in zip(rows.tolist(), distances)]
+
+    def _fetch_documents(self, ids: List[str]) -> Dict[str, Document]:
+        rows = self.docstore.rows
+        return {
+            doc_id: Document(page_content=self.docstore.text(rows[doc_id]), metadata=self.docstore.metadata(rows[doc_id]))
+            for doc_id in ids if doc_id in rows
+        }
+
+    def close(self):
+        super().close()
+        self.vector_index.close()
+        self.docstore.close()
+
+
+def main():
+    """离线构建入口：python -m rag.snapshot --source primary_vector_store --output ./vector_storage/snapshots/kb"""
+    from config.config import load_config
+    from factory.embedding_factory import EmbeddingFactory
+    from factory.rag_factory import RAGFactory
+
+    parser = argparse.ArgumentParser(description="将已摄取的 RAG 模块导出为只读快照")
+    parser.add_argument("--source", default="primary_vector_store", help="config.yaml 中 rag 部分的键名 (可写后端)")
+    parser.add_argument("--output", required=True, help="快照输出目录")
+    parser.add_argument("--documents", help="可选：先增量摄取该文本文件 (每行一个文档)，再导出")
+    args = parser.parse_args()
+
+    full_config = load_config()
+    embed_factory = EmbeddingFactory(full_config)
+    source = RAGFactory(full_config, embed_factory).get_instance(args.source)
+    if args.documents:
+        with open(args.documents, "r", encoding="utf-8") as f:
+            source.ingest_data([line.strip() for line in f if line.strip()])
+    build_snapshot(source, args.output)
+    source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+from typing import List, Dict, Any, Callable, Tuple, Iterable
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import sys
+import threading
+
+# 倒排表中文档编号与词频均以 int32 存储
+_INT_TYPECODE = "i"
+_EXHAUSTED = sys.maxsize
+
+
+def default_tokenize(text: str) -> List[str]:
+    """默认分词：按空白切分 (与 LangChain BM25Retriever 的默认行为一致)。"""
+    return text.split()
+
+
+class _PostingCursor:
+    """
+    单个查询词的倒排表游标，按文档编号升序遍历。
+    倒排表由多个分段 (磁盘段 + 内存增量段) 首尾拼接而成，各段的文档编号严格递增。
+    """
+    __slots__ = ("parts", "part", "pos", "doc", "weight", "upper_bound")
+
+    def __init__(self, parts: List[Tuple[Any, Any]], weight: float, upper_bound: float):
+        self.parts = parts
+        self.part = 0
+        self.pos = 0
+        self.doc = _EXHAUSTED
+        self.weight = weight
+        self.upper_bound = upper_bound
+        self._settle()
+
+    def _settle(self):
+        while self.part < len(self.parts) and self.pos >= len(self.parts[self.part][0]):
+            self.part += 1
+            self.pos = 0
+        self.doc = self.parts[self.part][0][self.pos] if self.part < len(self.parts) else _EXHAUSTED
+
+    def tf(self) -> int:
+        return self.parts[self.part][1][self.pos]
+
+    def next(self):
+        self.pos += 1
+        self._settle()
+
+    def seek(self, target: int):
+        """跳到第一个文档编号 >= target 的位置 (段内二分查找)。"""
+        while self.part < len(self.parts) and self.parts[self.part][0][-1] < target:
+            self.part += 1
+            self.pos = 0
+        if self.part < len(self.parts):
+            self.pos = bisect_left(self.parts[self.part][0], target, self.pos)
+        self._settle()
+
+
+class _Segment:
+    """磁盘上的不可变倒排段：词典常驻内存，倒排表通过 mmap 只读映射，按需分页加载。"""
+
+    def __init__(self, index_dir: str, name: str):
+        self.name = name
+        with open(os.path.join(index_dir, f"{name}.lex.json"), "r", encoding="utf-8") as f:
+            # term -> [offset, count, max_tf]
+            self.lexicon: Dict[str, List[int]] = json.load(f)
+        self._files = []
+        self._mmaps = []
+        self.docs = self._map(os.path.join(index_dir, f"{name}.docs.i32"))
+        self.tfs = self._map(os.path.join(index_dir, f"{name}.tfs.i32"))
+
+    def _map(self, path: str):
+        if os.path.getsize(path) == 0:
+            return array(_INT_TYPECODE)
+        f = open(path, "rb")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append(f)
+        self._mmaps.append(mm)
+        return memoryview(mm).cast(_INT_TYPECODE)
+
+    def postings(self, term: str) -> Tuple[Any, Any, int, int] | None:
+        """返回 (docs, tfs, count, max_tf) 视图 (零拷贝切片)，词不存在时返回 None。"""
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return None
+        offset, count, max_tf = entry
+        return self.docs[offset:offset + count], self.tfs[offset:offset + count], count, max_tf
+
+    def close(self):
+        for view in (self.docs, self.tfs):
+            if isinstance(view, memoryview):
+                view.release()
+        for mm in self._mmaps:
+            mm.close()
+        for f in self._files:
+            f.close()
+        self._mmaps, self._files = [], []
+
+
+class SparseIndex:
+    """
+    原生 BM25 稀疏索引：
+      - 倒排索引 (词 -> 文档编号 + 词频)，支持增量新增 / 删除 (删除采用墓碑标记，合并时物理清除)
+      - 持久化为若干不可变分段，倒排表通过 mmap 加载，进程启动时无需重新分词
+      - Top-K 检索使用 MaxScore 剪枝，只对有可能进入 Top-K 的文档打分
+    与 Lucene 一致，被删除文档在合并之前仍计入文档频率 (df)。
+    read_only=True 时只加载不写入 (多个进程共享同一份只读快照)，磁盘索引不一致时报错而不是丢弃。
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, index_dir: str | None = None, tokenizer: Callable[[str], List[str]] = default_tokenize,
+                 k1: float = 1.5, b: float = 0.75, max_segments: int = 8, tokenizer_signature: str = "whitespace",
+                 read_only: bool = False):
+        self.index_dir = index_dir
+        self.read_only = read_only
+        self.tokenize = tokenizer
+        # 分词规则标识：与磁盘索引记录的不一致时，旧索引作废
+        self.tokenizer_signature = tokenizer_signature
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._reset()
+        if index_dir and os.path.exists(os.path.join(index_dir, "meta.json")):
+            self.load()
+
+    def clear(self):
+        """清空索引 (内存与磁盘文件)。"""
+        if self.read_only:
+            raise RuntimeError(f"稀疏索引 {self.index_dir} 为只读，不能清空。")
+        with self._lock:
+            self.close()
+            self._reset()
+            if self.index_dir and os.path.isdir(self.index_dir):
+                for name in os.listdir(self.index_dir):
+                    if name.startswith("seg-") or name.split(".")[0] in ("meta", "doc_ids", "doc_lens"):
+                        os.remove(os.path.join(self.index_dir, name))
+
+    def _reset(self):
+        # 文档表：内部编号 -> 外部文档 ID / 文档长度
+        self._doc_ids: List[str] = []
+        self._doc_lens = array(_INT_TYPECODE)
+        self._id_to_idx: Dict[str, int] = {}
+        self._deleted: set[int] = set()
+        self._live_length = 0
+        # 已持久化的分段 + 内存增量段
+        self._segments: List[_Segment] = []
+        self._delta: Dict[str, Tuple[array, array]] = {}
+        self._delta_max_tf: Dict[str, int] = {}
+        # 已写入磁盘的文档数 (文档表为追加写)
+        self._persisted_docs = 0
+        self._next_segment = 0
+
+    def __len__(self) -> int:
+        return len(self._id_to_idx)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._id_to_idx
+
+    def ids(self) -> List[str]:
+        """返回所有未删除文档的 ID。"""
+        with self._lock:
+            return list(self._id_to_idx)
+
+    # --- 增量更新 ---
+
+    def add(self, ids: List[str], texts: List[str]):
+        """新增或替换文档 (已存在的 ID 先删除再以新编号写入)。"""
+        self.add_tokens(ids, [self.tokenize(text) for text in texts])
+
+    def add_tokens(self, ids: List[str], token_streams: Iterable[List[str]]):
+        """以预先分好词的 token 流新增或替换文档。"""
+        with self._lock:
+            for doc_id, tokens in zip(ids, token_streams):
+                if doc_id in self._id_to_idx:
+                    self._remove_one(doc_id)
+                idx = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                self._doc_lens.append(len(tokens))
+                self._id_to_idx[doc_id] = idx
+                self._live_length += len(tokens)
+                for term, tf in Counter(tokens).items():
+                    postings = self._delta.get(term)
+                    if postings is None:
+                        postings = self._delta[term] = (array(_INT_TYPECODE), array(_INT_TYPECODE))
+                    postings[0].append(idx)
+                    postings[1].append(tf)
+                    if tf > self._delta_max_tf.get(term, 0):
+                        self._delta_max_tf[term] = tf
+
+    def remove(self, ids: List[str]) -> int:
+        """删除文档 (墓碑标记)，返回实际删除的数量。"""
+        with self._lock:
+            return sum(self._remove_one(doc_id) for doc_id in ids if doc_id in self._id_to_idx)
+
+    def _remove_one(self, doc_id: str) -> int:
+        idx = self._id_to_idx.pop(doc_id)
+        self._deleted.add(idx)
+        self._live_length -= self._doc_lens[idx]
+        return 1
+
+    # --- 检索 ---
+
+    def _term_postings(self, term: str) -> Tuple[List[Tuple[Any, Any]], int, int]:
+        """汇总某个词在所有分段中的倒排表，返回 (parts, df, max_tf)。"""
+        parts, df, max_tf = [], 0, 0
+        for segment in self._segments:
+            found = segment.postings(term)
+            if found:
+                parts.append((found[0], found[1]))
+                df += found[2]
+                max_tf = max(max_tf, found[3])
+        delta = self._delta.get(term)
+        if delta:
+            parts.append(delta)
+            df += len(delta[0])
+            max_tf = max(max_tf, self._delta_max_tf[term])
+        return parts, df, max_tf
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """BM25 Top-K 检索 (MaxScore 剪枝)，返回按得分降序排列的 [(doc_id, score)]。"""
+        return self.search_tokens(self.tokenize(query), k)
+
+    def search_tokens(self, query_tokens: List[str], k: int = 5) -> List[Tuple[str, float]]:
+        with self._lock:
+            num_docs = len(self._id_to_idx)
+            if num_docs == 0 or k <= 0:
+                return []
+            avgdl = self._live_length / num_docs or 1.0
+            k1, b = self.k1, self.b
+
+            cursors: List[_PostingCursor] = []
+            for term, qtf in Counter(query_tokens).items():
+                parts, df, max_tf = self._term_postings(term)
+                if df == 0:
+                    continue
+                idf = math.log(1.0 + (max(num_docs, df) - df + 0.5) / (df + 0.5))
+                weight = qtf * idf
+                # 词频饱和项在 tf 最大、文档最短时取上界
+                upper_bound = weight * max_tf * (k1 + 1) / (max_tf + k1 * (1 - b))
+                cursors.append(_PostingCursor(parts, weight, upper_bound))
+            if not cursors:
+                return []
+
+            # MaxScore：按上界升序排列，前缀和 <= 当前阈值的词为"非必要词"，只在候选文档上补分
+            cursors.sort(key=lambda c: c.upper_bound)
+            prefix_bounds = list(itertools.accumulate(c.upper_bound for c in cursors))
+            doc_lens, deleted = self._doc_lens, self._deleted
+            heap: List[Tuple[float, int]] = []
+            threshold = 0.0
+            first_essential = 0
+
+            def term_score(cursor: _PostingCursor, doc: int) -> float:
+                tf = cursor.tf()
+                return cursor.weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_lens[doc] / avgdl))
+
+            while first_essential < len(cursors):
+                essential = cursors[first_essential:]
+                candidate = min(c.doc for c in essential)
+                if candidate == _EXHAUSTED:
+                    break
+                if candidate in deleted:
+                    for c in essential:
+                        if c.doc == candidate:
+                            c.next()
+                    continue
+
+                score = 0.0
+                for c in essential:
+                    if c.doc == candidate:
+                        score += term_score(c, candidate)
+                        c.next()
+                for j in range(first_essential - 1, -1, -1):
+                    if score + prefix_bounds[j] <= threshold:
+                        break
+                    c = cursors[j]
+                    c.seek(candidate)
+                    if c.doc == candidate:
+                        score += term_score(c, candidate)
+
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, candidate))
+                elif score > threshold:
+                    heapq.heapreplace(heap, (score, candidate))
+                else:
+                    continue
+                if len(heap) == k:
+                    threshold = heap[0][0]
+                    while first_essential < len(cursors) and prefix_bounds[first_essential] <= threshold:
+                        first_essential += 1
+
+            return [(self._doc_ids[doc], score) for score, doc in sorted(heap, reverse=True)]
+
+    # --- 持久化 ---
+
+    def save(self):
+        """
+        将内存增量段写成新的磁盘分段，并追加文档表。
+        分段过多或删除比例过高时触发全量合并 (重新编号并物理清除已删除文档)。
+        """
+        if not self.index_dir:
+            return
+        if self.read_only:
+            raise RuntimeError(f"稀疏索引 {self.index_dir} 为只读，不能写入。")
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            total_docs = len(self._doc_ids)
+            if len(self._segments) + 1 > self.max_segments or len(self._deleted) > 0.2 * max(total_docs, 1):
+                self._compact()
+                return
+
+            segment_names = [segment.name for segment in self._segments]
+            if self._delta:
+                name = self._write_segment(self._next_segment, self._delta, self._delta_max_tf)
+                self._next_segment += 1
+                segment_names.append(name)
+
+            with open(os.path.join(self.index_dir, "doc_ids.jsonl"), "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(doc_id, ensure_ascii=False) + "\n" for doc_id in self._doc_ids[self._persisted_docs:])
+            with open(os.path.join(self.index_dir, "doc_lens.i32"), "ab") as f:
+                self._doc_lens[self._persisted_docs:].tofile(f)
+            self._write_meta(segment_names, total_docs)
+            self._persisted_docs = total_docs
+
+            if self._delta:
+                self._segments.append(_Segment(self.index_dir, segment_names[-1]))
+                self._delta, self._delta_max_tf = {}, {}
+
+    def _compact(self):
+        """全量合并：所有分段 + 增量段合并为一个分段，删除墓碑文档并重新编号。"""
+        remap: Dict[int, int] = {}
+        doc_ids, doc_lens = [], array(_INT_TYPECODE)
+        for idx, doc_id in enumerate(self._doc_ids):
+            if idx not in self._deleted:
+                remap[idx] = len(doc_ids)
+                doc_ids.append(doc_id)
+                doc_lens.append(self._doc_lens[idx])
+
+        merged: Dict[str, Tuple[array, array]] = {}
+        merged_max_tf: Dict[str, int] = {}
+        terms = set(self._delta)
+        for segment in self._segments:
+            terms.update(segment.lexicon)
+        for term in terms:
+            parts, _, _ = self._term_postings(term)
+            docs, tfs = array(_INT_TYPECODE), array(_INT_TYPECODE)
+            for part_docs, part_tfs in parts:
+                for doc, tf in zip(part_docs, part_tfs):
+                    if doc in remap:
+                        docs.append(remap[doc])
+                        tfs.append(tf)
+                # 及时释放 mmap 切片视图，否则旧分段无法关闭
+                for view in (part_docs, part_tfs):
+                    if isinstance(view, memoryview):
+                        view.release()
+            del parts
+            if docs:
+                merged[term] = (docs, tfs)
+                merged_max_tf[term] = max(tfs)
+
+        old_segments = self._segments
+        name = self._write_segment(self._next_segment, merged, merged_max_tf)
+        self._next_segment += 1
+        with open(os.path.join(self.index_dir, "doc_ids.jsonl.tmp"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(doc_id, ensure_ascii=False) + "\n" for doc_id in doc_ids)
+        with open(os.path.join(self.index_dir, "doc_lens.i32.tmp"), "wb") as f:
+            doc_lens.tofile(f)
+
+        for segment in old_segments:
+            segment.close()
+        os.replace(os.path.join(self.index_dir, "doc_ids.jsonl.tmp"), os.path.join(self.index_dir, "doc_ids.jsonl"))
+        os.replace(os.path.join(self.index_dir, "doc_lens.i32.tmp"), os.path.join(self.index_dir, "doc_lens.i32"))
+        self._deleted = set()
+        self._write_meta([name], len(doc_ids))
+        for segment in old_segments:
+            for suffix in (".lex.json", ".docs.i32", ".tfs.i32"):
+                path = os.path.join(self.index_dir, segment.name + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self._doc_ids, self._doc_lens = doc_ids, doc_lens
+        self._id_to_idx = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self._persisted_docs = len(doc_ids)
+        self._delta, self._delta_max_tf = {}, {}
+        self._segments = [_Segment(self.index_dir, name)]
+        print(f"  [Sparse] 🔧 稀疏索引已合并为单一分段 ({len(doc_ids)} 个文档, {len(merged)} 个词)。")
+
+    def _write_segment(self, number: int, postings: Dict[str, Tuple[array, array]], max_tfs: Dict[str, int]) -> str:
+        name = f"seg-{number:06d}"
+        lexicon: Dict[str, List[int]] = {}
+        offset = 0
+        with open(os.path.join(self.index_dir, f"{name}.docs.i32"), "wb") as docs_file, \
+             open(os.path.join(self.index_dir, f"{name}.tfs.i32"), "wb") as tfs_file:
+            for term in sorted(postings):
+                docs, tfs = postings[term]
+                docs.tofile(docs_file)
+                tfs.tofile(tfs_file)
+                lexicon[term] = [offset, len(docs), max_tfs[term]]
+                offset += len(docs)
+        with open(os.path.join(self.index_dir, f"{name}.lex.json"), "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+        return name
+
+    def _write_meta(self, segment_names: List[str], num_docs: int):
+        meta = {
+            "version": self.FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "tokenizer": self.tokenizer_signature,
+            "segments": segment_names,
+            "next_segment": self._next_segment,
+            "num_docs": num_docs,
+            "deleted": sorted(self._deleted),
+        }
+        tmp_path = os.path.join(self.index_dir, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # 元数据最后原子替换，作为持久化的提交点
+        os.replace(tmp_path, os.path.join(self.index_dir, "meta.json"))
+
+    def load(self):
+        """从 index_dir 加载索引：文档表读入内存，倒排表 mmap 只读映射。"""
+        with self._lock:
+            self.close()
+            self._reset()
+            with open(os.path.join(self.index_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != self.FORMAT_VERSION or meta.get("tokenizer", "whitespace") != self.tokenizer_signature:
+                if self.read_only:
+                    raise RuntimeError(f"只读稀疏索引 {self.index_dir} 的版本或分词规则 ({meta.get('tokenizer')}) 与当前配置不一致。")
+                print(f"  [Sparse] ⚠️ 磁盘索引的版本或分词规则 ({meta.get('tokenizer')}) 与当前配置不一致，已丢弃，需要重建。")
+                self.clear()
+                return
+            num_docs = meta["num_docs"]
+
+            ids_path = os.path.join(self.index_dir, "doc_ids.jsonl")
+            lens_path = os.path.join(self.index_dir, "doc_lens.i32")
+            with open(ids_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            self._doc_ids = [json.loads(line) for line in lines[:num_docs]]
+            with open(lens_path, "rb") as f:
+                self._doc_lens.fromfile(f, num_docs)
+            # 上次写入在提交元数据前中断时，截掉文档表中未提交的尾部 (只读模式下只忽略尾部)
+            if not self.read_only:
+                if len(lines) > num_docs:
+                    with open(ids_path, "w", encoding="utf-8") as f:
+                        f.writelines(lines[:num_docs])
+                if os.path.getsize(lens_path) > num_docs * self._doc_lens.itemsize:
+                    with open(lens_path, "r+b") as f:
+                        f.truncate(num_docs * self._doc_lens.itemsize)
+
+            self._deleted = set(meta.get("deleted", []))
+            for idx, doc_id in enumerate(self._doc_ids):
+                if idx not in self._deleted:
+                    self._id_to_idx[doc_id] = idx
+                    self._live_length += self._doc_lens[idx]
+            self._persisted_docs = num_docs
+            self._next_segment = meta.get("next_segment", len(meta["segments"]))
+            self._segments = [_Segment(self.index_dir, name) for name in meta["segments"]]
+            print(f"  [Sparse] ✅ 已加载稀疏索引: {len(self)} 个文档, {len(self._segments)} 个分段 (mmap)。")
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+
@@ -0,0 +1,187 @@
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Type, Iterable
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+
+try:
+    import jieba  # 可选依赖：dictionary 模式下优先使用
+except ImportError:
+    jieba = None
+
+# 连续的中日韩字符 / 连续的字母数字，其余字符 (空白、标点) 视为分隔符
+_CJK_RUN = r"[㐀-䶿一-鿿豈-﫿]+"
+_WORD_RUN = r"[0-9A-Za-zÀ-ɏ_]+"
+_RUN_PATTERN = re.compile(f"({_CJK_RUN})|({_WORD_RUN})")
+
+
+class AbstractTokenizer(ABC):
+    """稀疏检索分词器接口。signature 用于标识分词规则，作为 token 流缓存的键的一部分。"""
+
+    @abstractmethod
+    def tokenize(self, text: str) -> List[str]:
+        """将文本切分为 token 列表。"""
+        pass
+
+    @property
+    @abstractmethod
+    def signature(self) -> str:
+        """分词配置的唯一标识，配置变化时必须随之变化。"""
+        pass
+
+
+class WhitespaceTokenizer(AbstractTokenizer):
+    """按空白切分 (与 LangChain BM25Retriever 默认行为一致)，不适合中文。"""
+    def __init__(self, config: Dict[str, Any]):
+        self.lowercase = config.get("lowercase", False)
+
+    def tokenize(self, text: str) -> List[str]:
+        return (text.lower() if self.lowercase else text).split()
+
+    @property
+    def signature(self) -> str:
+        return f"whitespace:lower={self.lowercase}"
+
+
+class CharNGramTokenizer(AbstractTokenizer):
+    """
+    字符 n-gram 分词：中文连续片段切分为 n-gram (默认 1~2 字)，
+    字母数字片段按整词输出 (转小写)。无需词典，召回稳定。
+    """
+    def __init__(self, config: Dict[str, Any]):
+        min_n, max_n = config.get("ngram_range", [1, 2])
+        if not 1 <= min_n <= max_n:
+            raise ValueError(f"ngram_range 配置无效: {[min_n, max_n]}")
+        self.min_n, self.max_n = min_n, max_n
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens: List[str] = []
+        for cjk_run, word_run in _RUN_PATTERN.findall(text):
+            if word_run:
+                tokens.append(word_run.lower())
+                continue
+            for n in range(self.min_n, self.max_n + 1):
+                tokens.extend(cjk_run[i:i + n] for i in range(len(cjk_run) - n + 1))
+        return tokens
+
+    @property
+    def signature(self) -> str:
+        return f"ngram:{self.min_n}-{self.max_n}"
+
+
+class DictionaryTokenizer(AbstractTokenizer):
+    """
+    词典分词：已安装 jieba 时使用其搜索引擎模式 (可加载 user_dict)，
+    否则使用内置的正向最大匹配 (词典来自 user_dict 文件与 user_words 配置)，未登录字按单字输出。
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.user_dict = config.get("user_dict")
+        self.words = set(config.get("user_words", []))
+        if self.user_dict:
+            with open(self.user_dict, "r", encoding="utf-8") as f:
+                # 兼容 jieba 词典格式: "词 [词频] [词性]"
+                self.words.update(line.split()[0] for line in f if line.strip())
+        self.max_word_len = max((len(w) for w in self.words), default=1)
+        self.use_jieba = jieba is not None and config.get("use_jieba", True)
+        if self.use_jieba:
+            for word in self.words:
+                jieba.add_word(word)
+
+    def _max_match(self, run: str) -> Iterable[str]:
+        i = 0
+        while i < len(run):
+            for size in range(min(self.max_word_len, len(run) - i), 0, -1):
+                if size == 1 or run[i:i + size] in self.words:
+                    yield run[i:i + size]
+                    i += size
+                    break
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens: List[str] = []
+        for cjk_run, word_run in _RUN_PATTERN.findall(text):
+            if word_run:
+                tokens.append(word_run.lower())
+            elif self.use_jieba:
+                tokens.extend(jieba.lcut_for_search(cjk_run))
+            else:
+                tokens.extend(self._max_match(cjk_run))
+        return tokens
+
+    @property
+    def signature(self) -> str:
+        engine = "jieba" if self.use_jieba else "maxmatch"
+        words_digest = hashlib.sha1("\n".join(sorted(self.words)).encode("utf-8")).hexdigest()[:12]
+        return f"dictionary:{engine}:{words_digest}"
+
+
+# --- 分词器注册表 ---
+TOKENIZER_MAP: Dict[str, Type[AbstractTokenizer]] = {
+    "whitespace": WhitespaceTokenizer,
+    "ngram": CharNGramTokenizer,
+    "dictionary": DictionaryTokenizer,
+}
+
+
+def create_tokenizer(config: Dict[str, Any] | None) -> AbstractTokenizer:
+    """根据 rag 配置中的 tokenizer 块创建分词器，未配置时使用空白分词。"""
+    config = config or {}
+    tokenizer_type = config.get("type", "whitespace").lower()
+    TokenizerClass = TOKENIZER_MAP.get(tokenizer_type)
+    if not TokenizerClass:
+        raise ValueError(f"不支持的分词器类型: {tokenizer_type}")
+    return TokenizerClass(config)
+
+
+class TokenStreamCache:
+    """
+    文档 token 流缓存 (SQLite)：键为 (分词器签名, 内容哈希)。
+    摄取时每份文档只分词一次，重建索引或重复摄取相同内容时直接复用。
+    """
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_streams ("
+                "signature TEXT NOT NULL, content_hash TEXT NOT NULL, tokens TEXT NOT NULL, "
+                "PRIMARY KEY (signature, content_hash))"
+            )
+
+    def get_many(self, signature: str, content_hashes: List[str]) -> Dict[str, List[str]]:
+        found: Dict[str, List[str]] = {}
+        unique = list(dict.fromkeys(content_hashes))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, tokens FROM token_streams WHERE signature = ? AND content_hash IN ({placeholders})",
+                    [signature, *batch],
+                )
+                found.update((digest, json.loads(tokens)) for digest, tokens in rows)
+        return found
+
+    def put_many(self, signature: str, streams: Dict[str, List[str]]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO token_streams (signature, content_hash, tokens) VALUES (?, ?, ?)",
+                [(signature, digest, json.dumps(tokens, ensure_ascii=False)) for digest, tokens in streams.items()],
+            )
+
+    def tokenize_many(self, tokenizer: AbstractTokenizer, texts: List[str], content_hashes: List[str]) -> List[List[str]]:
+        """批量获取 token 流：命中缓存的直接返回，未命中的分词后写回缓存。"""
+        cached = self.get_many(tokenizer.signature, content_hashes)
+        missing: Dict[str, List[str]] = {}
+        for text, digest in zip(texts, content_hashes):
+            if digest not in cached and digest not in missing:
+                missing[digest] = tokenizer.tokenize(text)
+        if missing:
+            self.put_many(tokenizer.signature, missing)
+            cached.update(missing)
+        return [cached[digest] for digest in content_hashes]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
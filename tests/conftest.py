@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入项目根目录下的包 (config / factory / models / rag / app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Dict, Any
+
+from factory.agent_factory import AgentFactory, LazyComponent
+from factory.embedding_factory import EmbeddingFactory
+from factory.llm_factory import LLMFactory, ComponentRegistry
+from factory.rag_factory import RAGFactory
+from factory.tools_factory import ToolsFactory
+from models.agents_implementations import _executor_node
+
+
+def lazy_config() -> Dict[str, Any]:
+    return {
+        "assembly": {"lazy": True},
+        "llm": {"prod_model": {"name": "gpt-test", "provider": "openai", "temperature": 0.0}},
+        "tools": {
+            "math_solver": {"type": "calculator"},
+            "web_search": {"type": "search"},
+        },
+        "rag": {},
+        "agents": {
+            "router": {
+                "type": "router",
+                "name": "LazyRouter",
+                "dependencies": {"llm_key": "prod_model", "tools_keys": ["web_search"],
+                                 "executor_keys": ["rag_executor", "calc_executor"]},
+                "tool_prefetch": {"web_search": {"enabled": True, "timeout_seconds": 1.0}},
+                # 推测检索不应为尚未创建的 RAG Agent 触发创建
+                "speculation": {"enabled": True},
+            },
+            # rag 配置块为空：只要 RAG 分支从未被选中，RAGModule 就不会被创建
+            "rag_executor": {"type": "rag", "dependencies": {"llm_key": "prod_model", "rag_key": "missing_store"},
+                             "consumes_tools": ["web_search"]},
+            "calc_executor": {"type": "calculator", "dependencies": {"llm_key": "prod_model", "tools_keys": ["math_solver"]}},
+        },
+    }
+
+
+def build_factory(config: Dict[str, Any]) -> AgentFactory:
+    registry = ComponentRegistry()
+    llm_factory = LLMFactory(config, registry)
+    embed_factory = EmbeddingFactory(config, registry)
+    tools_factory = ToolsFactory(config, registry)
+    rag_factory = RAGFactory(config, embed_factory, registry)
+    return AgentFactory(config, llm_factory, tools_factory, rag_factory, registry)
+
+
+def test_lazy_router_assembly_does_not_build_executors():
+    router = build_factory(lazy_config()).get_instance("router")
+    flow = router.get_agent_flow()
+    rag_executor, calc_executor = router.executor_agents["rag_executor"], router.executor_agents["calc_executor"]
+    assert isinstance(rag_executor, LazyComponent) and isinstance(calc_executor, LazyComponent)
+    assert not rag_executor.is_resolved and not calc_executor.is_resolved
+    # consumes_tools 取自执行 Agent 的配置块：web_search 有消费方，预取策略保留
+    assert list(router.tool_prefetch) == ["web_search"]
+
+    final_state = asyncio.run(flow.ainvoke({"input": "帮我计算 12 乘以 5 加上 3", "output": "", "decision": ""}))
+    assert final_state["decision"] == "CALCULATOR"
+    assert "计算结果: 63" in final_state["output"]
+    # 只有被路由选中的执行 Agent 被创建
+    assert calc_executor.is_resolved and not rag_executor.is_resolved
+
+
+def test_declared_attributes_yield_to_the_real_instance_once_resolved():
+    class Agent:
+        consumes_tools = ["from_instance"]
+
+    proxy = LazyComponent("agents.test", Agent, {"consumes_tools": ["from_config"]})
+    assert proxy.consumes_tools == ["from_config"] and not proxy.is_resolved
+    assert proxy.__class__ is LazyComponent
+    proxy.other = 1  # 写属性会触发解析
+    assert proxy.is_resolved and proxy.consumes_tools == ["from_instance"]
+
+
+def test_executor_node_builds_a_lazy_agent_off_the_event_loop():
+    resolved_on = []
+
+    class Agent:
+        async def process(self, state):
+            return {**state, "output": "done"}
+
+    def build():
+        resolved_on.append(threading.get_ident())
+        return Agent()
+
+    proxy = LazyComponent("agents.slow", build)
+    node = _executor_node(proxy)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        first = await node({"input": "q"})
+        second = await node({"input": "q"})
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(run())
+    assert first["output"] == second["output"] == "done"
+    # 只创建一次，且不在事件循环线程中执行
+    assert len(resolved_on) == 1 and resolved_on[0] != loop_thread
@@ -0,0 +1,106 @@
+import asyncio
+from typing import Dict, Any, List
+
+from models.agents_implementations import RAGAgent, CalculatorAgent, RouterAgent
+from models.llm_abc import AbstractLLM, AbstractTool
+
+
+class RouteLLM(AbstractLLM):
+    """按关键词返回意图的路由模型。"""
+    async def generate(self, prompt: str, **kwargs) -> str:
+        user_input = prompt.split("原始输入：", 1)[1].split("，判断用户意图", 1)[0]
+        if "计算" in user_input:
+            return "CALCULATOR"
+        if "是什么" in user_input:
+            return "RAG"
+        return "DEFAULT"
+
+
+class EchoLLM(AbstractLLM):
+    """回显 prompt 的总结模型，记录每次调用的 prompt 与参数。"""
+    def __init__(self):
+        self.calls: List[Dict[str, Any]] = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.calls.append({"method": "generate", "prompt": prompt, **kwargs})
+        return f"回答<{prompt}>"
+
+    async def stream(self, prompt: str, **kwargs):
+        self.calls.append({"method": "stream", "prompt": prompt, **kwargs})
+        for piece in ("回答", "<", prompt, ">"):
+            yield piece
+
+
+class FakeRAGModule:
+    version = 0
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        return [f"关于 {query} 的文档"]
+
+
+class MathTool(AbstractTool):
+    async def run(self, input_text: str) -> str:
+        return "计算结果: 63"
+
+
+def build_flow(rag_config: Dict[str, Any] | None = None):
+    summary_llm = EchoLLM()
+    rag = RAGAgent(summary_llm, {}, FakeRAGModule(), {"result_cache": {"enabled": True, "semantic": False}, **(rag_config or {})})
+    calc = CalculatorAgent(summary_llm, {"math_solver": MathTool()}, {})
+    router = RouterAgent(RouteLLM(), {}, {"name": "TestRouter"}, {"rag_executor": rag, "calc_executor": calc})
+    return router.get_agent_flow(), summary_llm
+
+
+def initial_state(query: str, **extra) -> Dict[str, Any]:
+    return {"input": query, "query": query, "output": "", "decision": "", **extra}
+
+
+def test_executors_receive_user_input_and_cache_is_keyed_per_query():
+    flow, summary_llm = build_flow()
+
+    async def run():
+        first = await flow.ainvoke(initial_state("混合搜索是什么？"))
+        second = await flow.ainvoke(initial_state("LLM工厂是什么？"))
+        repeat = await flow.ainvoke(initial_state("混合搜索是什么？"))
+        return first, second, repeat
+
+    first, second, repeat = asyncio.run(run())
+    assert "混合搜索是什么？" in first["output"]
+    assert "LLM工厂是什么？" in second["output"]
+    assert first["output"] != second["output"]
+    # 相同的查询命中结果缓存，总结模型只被调用两次
+    assert repeat["output"] == first["output"]
+    assert len(summary_llm.calls) == 2
+    assert all("混合搜索是什么？" in call["prompt"] or "LLM工厂是什么？" in call["prompt"] for call in summary_llm.calls)
+
+
+def test_calculator_receives_user_input():
+    flow, summary_llm = build_flow()
+    final_state = asyncio.run(flow.ainvoke(initial_state("帮我计算 12 乘以 5 加上 3")))
+    assert "帮我计算 12 乘以 5 加上 3" in summary_llm.calls[0]["prompt"]
+    assert "计算查询 '帮我计算 12 乘以...'" in final_state["output"]
+
+
+def test_astream_emits_token_events_when_stream_flag_is_set():
+    flow, summary_llm = build_flow()
+
+    async def run():
+        events = []
+        async for mode, chunk in flow.astream(initial_state("混合搜索是什么？", stream=True), stream_mode=["updates", "custom"]):
+            events.append((mode, chunk))
+        return events
+
+    events = asyncio.run(run())
+    tokens = [chunk for mode, chunk in events if mode == "custom" and chunk.get("type") == "token"]
+    assert tokens and all(token["node"] == "RAG" for token in tokens)
+    assert "".join(token["content"] for token in tokens).startswith("回答<请基于以下上下文，回答用户的问题：混合搜索是什么？")
+    assert [list(chunk) for mode, chunk in events if mode == "updates"] == [["route"], ["RAG"]]
+    # 文本片段在 RAG 节点完成之前到达
+    assert events.index(("updates", {"RAG": events[-1][1]["RAG"]})) > events.index(("custom", tokens[0]))
+    assert summary_llm.calls[0]["method"] == "stream"
+
+
+def test_ainvoke_without_stream_flag_uses_generate():
+    flow, summary_llm = build_flow()
+    asyncio.run(flow.ainvoke(initial_state("混合搜索是什么？")))
+    assert summary_llm.calls[0]["method"] == "generate"
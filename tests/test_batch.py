@@ -0,0 +1,98 @@
+import asyncio
+import json
+from typing import Dict, Any, List
+
+from app.batch import run_batch, run_batch_to_file, iter_jsonl_queries
+from models.agents_implementations import RAGAgent, CalculatorAgent, RouterAgent
+from models.llm_abc import AbstractLLM, AbstractTool
+from models.llm_wrappers import BatchingLLM, _BatchScheduler
+
+
+class DelayFlow:
+    """按输入中的延迟 (秒) 完成的流程；输入为 "fail" 时抛出异常。"""
+    async def ainvoke(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        if state["input"] == "fail":
+            raise ValueError("boom")
+        await asyncio.sleep(float(state["input"]))
+        return {**state, "decision": "END", "output": f"done {state['input']}"}
+
+
+def collect(queries: List[Any], **kwargs) -> List[Dict[str, Any]]:
+    async def run():
+        return [result async for result in run_batch(DelayFlow(), queries, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_ordered_results_follow_input_order():
+    results = collect(["0.05", "0.01", "0.03"], concurrency=3, ordered=True)
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert [result["output"] for result in results] == ["done 0.05", "done 0.01", "done 0.03"]
+
+
+def test_completion_order_yields_fastest_first():
+    results = collect(["0.05", "0.01", "0.03"], concurrency=3, ordered=False)
+    assert [result["index"] for result in results] == [1, 2, 0]
+
+
+def test_timeout_and_error_are_reported_per_query():
+    results = collect([{"id": "slow", "input": "1.0"}, "fail", "0"], concurrency=3, timeout=0.05)
+    assert [result["status"] for result in results] == ["timeout", "error", "ok"]
+    assert results[0]["id"] == "slow" and "0.05" in results[0]["error"]
+    assert results[1]["error"] == "ValueError: boom"
+
+
+def test_run_batch_to_file_writes_jsonl(tmp_path):
+    source = tmp_path / "queries.jsonl"
+    source.write_text('{"id": "a", "query": "0"}\n\n"0.01"\n', encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+    stats = asyncio.run(run_batch_to_file(DelayFlow(), iter_jsonl_queries(str(source)), str(output), concurrency=2))
+    lines = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert stats["total"] == 2 and stats["ok"] == 2
+    assert [line["id"] for line in lines] == ["a", 1]
+
+
+class RouteLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return "RAG" if "是什么" in prompt.split("，判断用户意图", 1)[0] else "CALCULATOR"
+
+
+class EchoLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return f"回答<{prompt}>"
+
+
+class FakeRAGModule:
+    version = 0
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        return [f"关于 {query} 的文档"]
+
+
+class MathTool(AbstractTool):
+    async def run(self, input_text: str) -> str:
+        return "计算结果: 63"
+
+
+def test_batch_queries_reach_batching_llm_on_background_lane(monkeypatch):
+    lanes: List[str] = []
+    original_submit = _BatchScheduler.submit
+
+    def recording_submit(self, lane, item):
+        lanes.append(lane)
+        original_submit(self, lane, item)
+
+    monkeypatch.setattr(_BatchScheduler, "submit", recording_submit)
+    summary_llm = BatchingLLM(EchoLLM(), "echo", {"max_wait_ms": 1})
+    rag = RAGAgent(summary_llm, {}, FakeRAGModule(), {})
+    calc = CalculatorAgent(summary_llm, {"math_solver": MathTool()}, {})
+    flow = RouterAgent(RouteLLM(), {}, {"name": "TestRouter"}, {"rag_executor": rag, "calc_executor": calc}).get_agent_flow()
+
+    async def run():
+        queries = ["混合搜索是什么？", "帮我计算 12 乘以 5", {"input": "LLM工厂是什么？", "priority": "interactive"}]
+        return [result async for result in run_batch(flow, queries, concurrency=3)]
+
+    results = asyncio.run(run())
+    assert [result["status"] for result in results] == ["ok", "ok", "ok"]
+    assert "请基于以下上下文，回答用户的问题：混合搜索是什么？" in results[0]["output"]
+    assert "计算查询 '帮我计算 12 乘以...'" in results[1]["output"]
+    assert sorted(lanes) == ["background", "background", "interactive"]
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Dict, Any
+
+from app.bootstrap import AgentSystem
+from models.implementations import transport_manager
+
+
+def system_config() -> Dict[str, Any]:
+    return {
+        "llm": {
+            "summary_model": {"name": "stub", "provider": "huggingface", "pipeline_url": "http://127.0.0.1:9/v1"},
+        },
+        "tools": {"math_solver": {"type": "calculator"}},
+        "agents": {
+            "calc": {"type": "calculator", "dependencies": {"llm_key": "summary_model", "tools_keys": ["math_solver"]}},
+        },
+    }
+
+
+def test_aclose_drops_models_bound_to_closed_connection_pools():
+    system = AgentSystem(system_config(), "calc")
+    old_llm = system.router_agent.llm
+    old_pool = transport_manager.http_client("http://127.0.0.1:9/v1")
+
+    asyncio.run(system.aclose())
+    assert old_pool.is_closed
+
+    # 关闭后重新组装：注册表不再返回绑定旧连接池的模型实例
+    new_llm = system.llm_factory.get_instance("summary_model")
+    assert new_llm is not old_llm
+    assert not transport_manager.http_client("http://127.0.0.1:9/v1").is_closed
+    asyncio.run(transport_manager.aclose())
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from models.llm_abc import AbstractLLM
+from models.llm_wrappers import CachedLLM
+
+
+class RecordingLLM(AbstractLLM):
+    """记录每次底层调用的参数；gate 未放行前调用一直挂起。"""
+    def __init__(self, temperature: float = 0.0):
+        self.temperature = temperature
+        self.calls: List[Dict[str, Any]] = []
+        self.gate: asyncio.Event | None = None
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.calls.append({"prompt": prompt, **kwargs})
+        if self.gate is not None:
+            await self.gate.wait()
+        return f"<{prompt}>"
+
+    async def stream(self, prompt: str, **kwargs):
+        self.calls.append({"prompt": prompt, **kwargs})
+        for chunk in ("<", prompt, ">"):
+            yield chunk
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("models.llm_wrappers.time.time", lambda: now[0])
+    return now
+
+
+def test_concurrent_identical_prompts_share_one_inner_call():
+    inner = RecordingLLM(temperature=0.7)  # 非确定性调用不缓存，但并发请求仍然合并
+    llm = CachedLLM(inner, "fake")
+
+    async def run():
+        inner.gate = asyncio.Event()
+        waiters = [asyncio.ensure_future(llm.generate("same")) for _ in range(5)]
+        other = asyncio.ensure_future(llm.generate("other"))
+        await asyncio.sleep(0)
+        inner.gate.set()
+        return await asyncio.gather(*waiters), await other
+
+    results, other = asyncio.run(run())
+    assert results == ["<same>"] * 5 and other == "<other>"
+    assert [call["prompt"] for call in inner.calls] == ["same", "other"]
+    assert llm.stats["coalesced"] == 4 and llm._inflight == {}
+    # 调用结束后不再合并，非确定性调用也不读缓存
+    asyncio.run(llm.generate("same"))
+    assert len(inner.calls) == 3
+
+
+def test_cacheable_flag_is_consumed_by_the_wrapper():
+    inner = RecordingLLM(temperature=0.7)
+    llm = CachedLLM(inner, "fake")
+
+    async def run():
+        assert await llm.generate("p", cacheable=True, max_tokens=5) == "<p>"
+        assert await llm.generate("p", cacheable=True, max_tokens=5) == "<p>"
+        await llm.generate("p", cacheable=True, max_tokens=6)  # 参数不同，键不同
+
+    asyncio.run(run())
+    assert inner.calls == [{"prompt": "p", "max_tokens": 5}, {"prompt": "p", "max_tokens": 6}]
+    assert llm.stats["hits"] == 1
+
+    deterministic = CachedLLM(RecordingLLM(temperature=0.0), "fake")
+    asyncio.run(deterministic.generate("p", cacheable=False))
+    asyncio.run(deterministic.generate("p", cacheable=False))
+    assert len(deterministic.inner.calls) == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    llm = CachedLLM(RecordingLLM(), "fake", {"ttl_seconds": 60})
+    asyncio.run(llm.generate("p"))
+    clock[0] += 60
+    asyncio.run(llm.generate("p"))
+    assert len(llm.inner.calls) == 1
+    clock[0] += 1
+    asyncio.run(llm.generate("p"))
+    assert len(llm.inner.calls) == 2 and llm._cache_bytes == len("<p>")
+
+
+def test_lru_eviction_by_entry_count_and_bytes():
+    llm = CachedLLM(RecordingLLM(), "fake", {"max_entries": 2})
+
+    async def run(*prompts):
+        for prompt in prompts:
+            await llm.generate(prompt)
+
+    asyncio.run(run("a", "b", "a", "c"))  # a 最近使用，c 写入时淘汰 b
+    assert [response for response, _, _ in llm._cache.values()] == ["<a>", "<c>"]
+    assert llm.stats["evicted"] == 1
+
+    by_bytes = CachedLLM(RecordingLLM(), "fake", {"max_bytes": 10})
+    asyncio.run(by_bytes.generate("1234"))    # 6 字节
+    asyncio.run(by_bytes.generate("56"))      # 4 字节，合计 10
+    asyncio.run(by_bytes.generate("7"))       # 3 字节，淘汰最久未使用的 1234
+    asyncio.run(by_bytes.generate("x" * 20))  # 超过 max_bytes 的响应不缓存
+    assert [response for response, _, _ in by_bytes._cache.values()] == ["<56>", "<7>"]
+    assert by_bytes._cache_bytes == 7
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    inner = RecordingLLM()
+    llm = CachedLLM(inner, "fake")
+
+    async def run():
+        inner.gate = asyncio.Event()
+        first = asyncio.ensure_future(llm.generate("p"))
+        second = asyncio.ensure_future(llm.generate("p"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        inner.gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "<p>"
+    assert len(inner.calls) == 1
+    # 共享调用完整结束并写入了缓存
+    assert asyncio.run(llm.generate("p")) == "<p>" and llm.stats["hits"] == 1
+
+
+def test_stream_caches_only_completed_streams():
+    inner = RecordingLLM()
+    llm = CachedLLM(inner, "fake")
+
+    async def consume(limit=None):
+        chunks = []
+        stream = llm.stream("p", cacheable=True)
+        async for chunk in stream:
+            chunks.append(chunk)
+            if limit is not None and len(chunks) == limit:
+                await stream.aclose()
+                break
+        return chunks
+
+    assert asyncio.run(consume(limit=1)) == ["<"]  # 中途关闭的流不写入缓存
+    assert llm._cache == {}
+    assert asyncio.run(consume()) == ["<", "p", ">"]
+    assert asyncio.run(consume()) == ["<p>"]  # 命中缓存时一次性产出
+    assert len(inner.calls) == 2 and all("cacheable" not in call for call in inner.calls)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from models.concurrency import (AdaptiveConcurrencyLimiter, DeadlineExceededError, LoadShedError,
+                                deadline_scope, remaining_time)
+from models.llm_abc import AbstractLLM
+from models.llm_wrappers import ConcurrencyLimitedLLM
+
+
+def test_excess_requests_queue_in_fifo_order_and_shed_when_queue_is_full():
+    limiter = AdaptiveConcurrencyLimiter("backend", {"initial_limit": 1, "max_queue": 2})
+    order = []
+
+    async def run():
+        await limiter.acquire()
+        waiters = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+        for index, waiter in enumerate(waiters):
+            waiter.add_done_callback(lambda _, index=index: order.append(index))
+        await asyncio.sleep(0)
+        with pytest.raises(LoadShedError):
+            await limiter.acquire()
+        for _ in waiters:
+            limiter.release(time.monotonic(), None)
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+
+    asyncio.run(run())
+    assert order == [0, 1]
+    assert limiter.inflight == 1
+    assert (limiter.stats["queued"], limiter.stats["shed_queue_full"]) == (2, 1)
+
+
+def test_limit_grows_additively_near_saturation_and_backs_off_multiplicatively():
+    limiter = AdaptiveConcurrencyLimiter("backend", {"initial_limit": 4, "latency_floor_ms": 0})
+
+    async def call(latency, dropped=False):
+        await limiter.acquire()
+        started = time.monotonic()
+        limiter.inflight = 4  # 模拟饱和
+        limiter.release(started, latency, dropped)
+        limiter.inflight = 0
+
+    asyncio.run(call(0.1))
+    assert limiter.limit == pytest.approx(4.25)
+    asyncio.run(call(0.5))  # 超过基线 * 2
+    assert limiter.limit == pytest.approx(4.25 * 0.9)
+    asyncio.run(call(None, dropped=True))
+    assert limiter.limit == pytest.approx(4.25 * 0.81)
+    assert limiter.stats["drops"] == 1
+
+
+def test_overload_signals_from_one_window_shrink_the_limit_once():
+    limiter = AdaptiveConcurrencyLimiter("backend", {"initial_limit": 10, "min_limit": 2})
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.inflight += 1
+        limiter.release(started, None, dropped=True)
+    assert limiter.limit == pytest.approx(9.0)
+    for _ in range(50):
+        limiter.inflight += 1
+        limiter.release(time.monotonic(), None, dropped=True)
+    assert limiter.limit == 2
+
+
+def test_deadline_shedding_and_queue_timeout():
+    limiter = AdaptiveConcurrencyLimiter("backend", {"initial_limit": 1, "max_limit": 1})
+
+    async def run():
+        with deadline_scope(0):
+            with pytest.raises(DeadlineExceededError):
+                await limiter.acquire()
+        await limiter.acquire()
+        limiter.release(time.monotonic() - 1, 1.0)  # 典型延迟约 1 秒
+        with deadline_scope(0.5):
+            with pytest.raises(LoadShedError):
+                await limiter.acquire()
+        limiter._expected = None
+        await limiter.acquire()
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceededError):
+                await limiter.acquire()  # 排队等待超过截止时间
+        assert not limiter._waiters
+        limiter.release(time.monotonic(), None)
+        assert limiter.inflight == 0
+
+    asyncio.run(run())
+    assert (limiter.stats["shed_deadline"], limiter.stats["deadline_exceeded"]) == (2, 1)
+
+
+def test_nested_deadline_cannot_extend_the_outer_one():
+    assert remaining_time() is None
+    with deadline_scope(1.0):
+        with deadline_scope(60):
+            assert remaining_time() <= 1.0
+        with deadline_scope(None):
+            assert remaining_time() <= 1.0
+    assert remaining_time() is None
+
+
+class SleepyLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(1)
+        return prompt
+
+
+def test_limited_llm_enforces_the_request_deadline_and_counts_a_drop():
+    llm = ConcurrencyLimitedLLM(SleepyLLM(), "sleepy", {"initial_limit": 4})
+
+    async def run():
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceededError):
+                await llm.generate("hi")
+
+    asyncio.run(run())
+    assert llm.limiter.inflight == 0
+    assert llm.limiter.stats["drops"] == 1 and llm.limiter.limit == pytest.approx(3.6)
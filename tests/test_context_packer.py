@@ -0,0 +1,58 @@
+from langchain_core.documents import Document
+
+from rag.context_packer import ContextPacker, TokenCounter
+
+
+def doc(text):
+    return Document(page_content=text)
+
+
+def test_estimate_counter_and_truncate():
+    counter = TokenCounter()
+    assert counter.type == "estimate"
+    assert counter.count("混合搜索") == 4
+    assert counter.count("hello world") == 4  # 每个单词 (len + 3) // 4
+    assert counter.count("") == 0
+    prefix = counter.truncate("混合搜索 hybrid search", 5)
+    assert prefix.startswith("混合搜索") and counter.count(prefix) <= 5
+    assert counter.truncate("abc", 0) == ""
+
+
+def test_pack_orders_by_score_and_stays_within_budget():
+    packer = ContextPacker({"max_context_tokens": 40, "min_truncate_tokens": 8})
+    docs = [(doc("低分片段 " * 3), 0.1), (doc("高分片段 " * 3), 0.9), (doc("中分片段 " * 20), 0.5)]
+    context, stats = packer.pack(docs)
+    passages = context.split("\n\n")
+    assert passages[0].startswith("[1] 高分片段")
+    assert passages[1].startswith("[2] 中分片段")  # 截断后放入剩余预算
+    assert stats["truncated"] == 1 and stats["tokens"] <= 40
+    assert packer.counter.count(context) <= 40
+
+
+def test_exact_and_overlapping_duplicates_are_skipped():
+    packer = ContextPacker({"max_context_tokens": 500})
+    base = "LLM 工厂根据配置创建模型实例，并按作用域在流程图之间共享。"
+    docs = [
+        (doc(base), 0.9),
+        (doc("  " + base.upper() + "  "), 0.8),          # 归一化后相同
+        (doc(base[:-6]), 0.7),                           # 被已选片段完整覆盖的重叠切块
+        (doc("混合搜索融合稀疏与密集检索的结果。"), 0.6),
+    ]
+    context, stats = packer.pack(docs)
+    assert stats["duplicates"] == 2 and stats["selected"] == 2
+    assert "[2] 混合搜索" in context
+
+
+def test_passages_that_do_not_fit_are_skipped_for_shorter_ones():
+    packer = ContextPacker({"max_context_tokens": 30, "min_truncate_tokens": 64})
+    docs = [(doc("长" * 100), 0.9), (doc("短片段"), 0.5)]
+    context, stats = packer.pack(docs)
+    assert context == "[1] 短片段"
+    assert stats["over_budget"] == 1 and stats["truncated"] == 0
+
+    no_truncate = ContextPacker({"max_context_tokens": 30, "truncate": False, "min_truncate_tokens": 1})
+    assert no_truncate.pack([(doc("长" * 100), 0.9)])[0] == ""
+
+    # 显式传入的预算优先于配置
+    assert packer.pack([(doc("短片段"), 0.5)], budget=3)[1]["over_budget"] == 1
+    assert packer.stats["packs"] == 2
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from models.embedding_cache import CachedEmbedding
+from models.implementations import HuggingFaceEmbeddingsModel, OpenAIEmbeddingsModel
+from models.llm_abc import AbstractEmbedding
+
+
+class ListEmbedding(AbstractEmbedding):
+    """只实现列表接口，数组接口走 AbstractEmbedding 的默认实现。"""
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, 2.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 2.0]
+
+
+def assert_vector_array(array, shape, dtype):
+    assert isinstance(array, np.ndarray)
+    assert array.shape == shape and array.dtype == np.dtype(dtype)
+    assert array.flags["C_CONTIGUOUS"]
+
+
+@pytest.mark.parametrize("dtype", [None, np.float16])
+def test_default_array_interface_converts_lists(dtype):
+    embedder = ListEmbedding()
+    expected = dtype or np.float32
+    assert_vector_array(embedder.embed_documents_array(["a", "bb"], dtype=dtype), (2, 3), expected)
+    assert_vector_array(embedder.embed_query_array("abc", dtype=dtype), (3,), expected)
+
+
+@pytest.mark.parametrize("model_class, dim", [(OpenAIEmbeddingsModel, 1536), (HuggingFaceEmbeddingsModel, 1024)])
+def test_embedding_models_honour_configured_dtype(model_class, dim):
+    model = model_class({"name": "fake", "dtype": "float16"})
+    assert_vector_array(model.embed_documents_array(["a", "b"]), (2, dim), np.float16)
+    assert_vector_array(model.embed_documents_array(["a"], dtype=np.float32), (1, dim), np.float32)
+    assert_vector_array(model.embed_query_array("q"), (dim,), np.float16)
+
+
+def test_cached_embedding_returns_contiguous_arrays_in_the_inner_dtype():
+    inner = HuggingFaceEmbeddingsModel({"name": "fake", "dtype": "float16"})
+    cache = CachedEmbedding(inner, "fake")
+    first = cache.embed_documents_array(["a", "b"])
+    again = cache.embed_documents_array(["b", "c", "a"])  # 部分命中缓存
+    assert_vector_array(first, (2, 1024), np.float16)
+    assert_vector_array(again, (3, 1024), np.float16)
+    assert_vector_array(cache.embed_query_array("q", dtype=np.float32), (1024,), np.float32)
@@ -0,0 +1,79 @@
+import numpy as np
+
+from models.embedding_cache import CachedEmbedding
+from models.llm_abc import AbstractEmbedding
+
+
+class CountingEmbedding(AbstractEmbedding):
+    """按文本长度生成确定性向量，并记录每次被向量化的文本。"""
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls = []
+
+    def _vector(self, text: str):
+        return [float(len(text) + i) for i in range(self.dim)]
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return self._vector(text)
+
+
+def test_in_place_changes_to_returned_query_vector_do_not_corrupt_cache():
+    cache = CachedEmbedding(CountingEmbedding(), "fake")
+    first = cache.embed_query_array("hello")
+    expected = first.copy()
+    first /= np.linalg.norm(first)  # 调用方就地归一化
+    second = cache.embed_query_array("hello")
+    assert np.array_equal(second, expected)
+    assert second is not first
+    assert cache.inner.calls == ["hello"]
+
+
+def test_memory_tier_is_a_bounded_lru():
+    cache = CachedEmbedding(CountingEmbedding(), "fake", {"max_entries": 2})
+    cache.embed_documents(["a", "bb"])
+    cache.embed_documents(["a"])  # a 成为最近使用
+    cache.embed_documents(["ccc"])  # 淘汰 bb
+    assert list(cache._memory) == [cache._key("a"), cache._key("ccc")]
+    cache.embed_documents(["bb"])
+    assert cache.inner.calls == ["a", "bb", "ccc", "bb"]
+
+
+def test_batch_dedup_and_query_document_separation():
+    cache = CachedEmbedding(CountingEmbedding(), "fake")
+    vectors = cache.embed_documents_array(["x", "yy", "x"])
+    assert vectors.shape == (3, 4) and np.array_equal(vectors[0], vectors[2])
+    cache.embed_query("x")  # 查询与文档分开缓存
+    assert cache.inner.calls == ["x", "yy", "x"]
+    assert cache.stats["misses"] == 3
+
+
+def test_disk_tier_survives_restart_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr("models.embedding_cache.time.time", lambda: float(next(clock)))
+    path = str(tmp_path / "embeddings.sqlite")
+    entry_bytes = 4 * 4  # 4 维 float32
+    cache = CachedEmbedding(CountingEmbedding(), "fake", {"path": path, "max_bytes": entry_bytes * 5})
+    for text in ["a", "bb", "ccc", "dddd", "eeeee"]:
+        cache.embed_documents([text])
+    cache.close()
+
+    reopened = CachedEmbedding(CountingEmbedding(), "fake", {"path": path, "max_bytes": entry_bytes * 5})
+    reopened.embed_documents(["a"])  # 磁盘命中并刷新 a 的访问时间
+    assert reopened.stats["disk_hits"] == 1 and reopened.inner.calls == []
+    reopened.embed_documents(["ffffff"])  # 超出上限：降到 90% 以下，只淘汰最久未访问的 bb 与 ccc
+    assert reopened.stats["evicted"] == 2
+    stored = {key for (key,) in reopened._conn.execute("SELECT key FROM embeddings")}
+    assert stored == {reopened._key(text) for text in ["a", "dddd", "eeeee", "ffffff"]}
+    assert reopened._disk_bytes == entry_bytes * 4
+    reopened.close()
+
+    # 其他模型名的缓存互不干扰
+    other = CachedEmbedding(CountingEmbedding(), "other-model", {"path": path})
+    other.embed_documents(["a"])
+    assert other.inner.calls == ["a"]
+    other.close()
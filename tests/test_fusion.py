@@ -0,0 +1,48 @@
+import pytest
+
+from rag.rag_module import FusionEngine
+
+LEGS = {
+    "sparse": [("a", 12.0), ("b", 6.0), ("c", 3.0)],
+    "dense": [("c", 0.9), ("d", 0.6), ("a", 0.3)],
+}
+
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    engine = FusionEngine({"method": "rrf", "rrf_c": 60, "weights": {"sparse": 1.0, "dense": 2.0}})
+    fused = dict(engine.fuse(LEGS, top_k=10))
+    assert fused["a"] == pytest.approx(1 / 61 + 2 / 63)
+    assert fused["c"] == pytest.approx(1 / 63 + 2 / 61)
+    assert fused["d"] == pytest.approx(2 / 62)
+    assert [doc_id for doc_id, _ in engine.fuse(LEGS, top_k=2)] == ["c", "a"]
+
+
+def test_weighted_divides_each_leg_by_its_top_score():
+    engine = FusionEngine({"method": "weighted"})
+    fused = dict(engine.fuse(LEGS, top_k=10))
+    assert fused["a"] == pytest.approx(0.5 * 1.0 + 0.5 * 0.3 / 0.9)
+    assert fused["b"] == pytest.approx(0.5 * 0.5)
+    assert fused["d"] == pytest.approx(0.5 * 0.6 / 0.9)
+
+
+def test_convex_min_max_normalizes_and_rescales_weights():
+    engine = FusionEngine({"method": "convex", "weights": {"sparse": 3.0, "dense": 1.0}})
+    fused = dict(engine.fuse(LEGS, top_k=10))
+    assert fused["a"] == pytest.approx(0.75 * 1.0 + 0.25 * 0.0)
+    assert fused["c"] == pytest.approx(0.75 * 0.0 + 0.25 * 1.0)
+    assert fused["b"] == pytest.approx(0.75 * (6 - 3) / (12 - 3))
+    # 只有一个候选的腿视为满分；空腿仍占有自己的权重份额
+    assert dict(engine.fuse({"sparse": [("x", 5.0)], "dense": []}, top_k=1)) == {"x": pytest.approx(0.75)}
+
+
+def test_top_k_and_empty_legs():
+    engine = FusionEngine()
+    assert len(engine.fuse(LEGS, top_k=3)) == 3
+    assert engine.fuse({"sparse": [], "dense": []}, top_k=5) == []
+    # 未配置权重的腿不参与打分
+    assert dict(engine.fuse({"web": [("z", 1.0)]}, top_k=1)) == {"z": 0.0}
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        FusionEngine({"method": "borda"})
@@ -0,0 +1,88 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from models.llm_abc import AbstractEmbedding
+from rag.ingestion import EmbeddingIngestionPipeline
+
+
+class ScriptedEmbedding(AbstractEmbedding):
+    """按文本控制行为：fail:<n> 前 n 次失败，bad 总是失败，slow 延迟返回；同时记录并发峰值。"""
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.attempts = {}
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            text = texts[0]
+            self.attempts[text] = self.attempts.get(text, 0) + 1
+            threading.Event().wait(0.2 if text.startswith("slow") else self.delay)
+            if text == "bad" or (text.startswith("fail:") and self.attempts[text] <= int(text.split(":")[1])):
+                raise RuntimeError("embedding 服务暂时不可用")
+            return [[float(len(text))] * 4 for _ in texts]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def embed_query(self, text):
+        return [0.0] * 4
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr("rag.ingestion.time", SimpleNamespace(sleep=recorded.append, perf_counter=time.perf_counter))
+    return recorded
+
+
+def run_pipeline(embedder, texts, **config):
+    pipeline = EmbeddingIngestionPipeline(embedder, {"batch_size": 1, **config})
+    written = []
+
+    def sink(ids, vectors, batch_texts, metadatas):
+        assert isinstance(vectors, np.ndarray) and vectors.shape == (len(ids), 4)
+        written.append(ids[0])
+
+    ids = [f"id-{text}" for text in texts]
+    count = pipeline.run(ids, texts, [{} for _ in texts], sink)
+    return count, written
+
+
+def test_failed_batches_are_retried_with_exponential_backoff(sleeps):
+    embedder = ScriptedEmbedding()
+    count, written = run_pipeline(embedder, ["fail:2"], max_retries=3, retry_backoff=0.5)
+    assert count == 1 and written == ["id-fail:2"]
+    assert embedder.attempts["fail:2"] == 3 and sleeps == [0.5, 1.0]
+
+
+def test_in_flight_batches_are_bounded_by_max_concurrency(sleeps):
+    embedder = ScriptedEmbedding(delay=0.02)
+    count, written = run_pipeline(embedder, [f"t{i}" for i in range(12)], max_concurrency=3)
+    assert count == 12 and sorted(written) == sorted(f"id-t{i}" for i in range(12))
+    assert embedder.peak == 3
+
+
+def test_sink_receives_batches_in_completion_order(sleeps):
+    count, written = run_pipeline(ScriptedEmbedding(), ["slow", "fast"], max_concurrency=2)
+    assert written == ["id-fast", "id-slow"]
+
+
+def test_written_batches_persist_when_a_later_batch_exhausts_retries(sleeps):
+    embedder = ScriptedEmbedding()
+    written = []
+    pipeline = EmbeddingIngestionPipeline(embedder, {"batch_size": 1, "max_concurrency": 1, "max_retries": 2})
+    with pytest.raises(RuntimeError):
+        pipeline.run(["a", "b", "c", "d"], ["x", "y", "bad", "z"], [{}] * 4,
+                     lambda ids, vectors, texts, metadatas: written.append(ids[0]))
+    assert written == ["a", "b"]
+    assert embedder.attempts["bad"] == 3 and "z" not in embedder.attempts
+    assert sleeps == [0.5, 1.0]
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from models.agents_implementations import RouterAgent
+from models.intent_classifier import (CentroidIntentClassifier, IntentPreClassifier, RuleIntentClassifier,
+                                      create_intent_pre_classifier)
+from models.llm_abc import AbstractEmbedding, AbstractLLM
+
+RULES = [
+    {"label": "CALCULATOR", "keywords": ["计算"], "patterns": [r"\d+\s*[-+*/]\s*\d+"], "confidence": 0.95},
+    {"label": "RAG", "keywords": ["是什么"], "confidence": 0.85},
+]
+
+
+class TableEmbedding(AbstractEmbedding):
+    """按文本查表返回固定向量的测试用 Embedding。"""
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.table[text]
+
+
+def cone_vector(axis_weights):
+    """句向量通常集中在一个锥体内：所有向量共享第 4 维的公共分量，意图只体现在前 3 维上。"""
+    vector = np.array([*axis_weights, 1.0], dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def centroid_classifier(queries):
+    table = {"calc": cone_vector([0.5, 0, 0]), "rag": cone_vector([0, 0.5, 0]), "chat": cone_vector([0, 0, 0.5]), **queries}
+    return CentroidIntentClassifier(TableEmbedding(table), {"CALCULATOR": ["calc"], "RAG": ["rag"], "DEFAULT": ["chat"]})
+
+
+def test_ambiguous_rule_match_falls_through():
+    rules = RuleIntentClassifier(RULES)
+    assert rules.predict("计算 3 + 5") == ("CALCULATOR", 0.95, "rules")
+    assert rules.predict("计算器是什么") is None  # 两个标签同时命中
+    pre_classifier = IntentPreClassifier(rules, None, threshold=0.8)
+    assert asyncio.run(pre_classifier.classify("计算器是什么")) is None
+    assert pre_classifier.stats == {"rules": 0, "centroid": 0, "fallback": 1}
+
+
+def test_centroid_confidence_is_calibrated_against_the_other_intents():
+    # 与 CALCULATOR 质心的余弦约 0.95，但与其他质心也有约 0.88：softmax 后置信度不足，回退到 LLM
+    unsure = cone_vector([0.15, 0, 0])
+    confident = cone_vector([0.5, 0, 0])
+    classifier = centroid_classifier({"unsure": unsure, "confident": confident})
+    label, confidence, _ = classifier.predict_vector(unsure)
+    assert label == "CALCULATOR" and np.dot(unsure, cone_vector([0.5, 0, 0])) > 0.9 and confidence < 0.8
+    label, confidence, stage = classifier.predict_vector(confident)
+    assert (label, stage) == ("CALCULATOR", "centroid") and confidence > 0.95
+
+    pre_classifier = IntentPreClassifier(None, classifier, threshold=0.8)
+    assert asyncio.run(pre_classifier.classify("unsure")) is None
+    assert asyncio.run(pre_classifier.classify("confident"))[0] == "CALCULATOR"
+    assert pre_classifier.stats == {"rules": 0, "centroid": 1, "fallback": 1}
+
+
+def test_centroid_margin_below_min_margin_has_zero_confidence():
+    tie = cone_vector([0.5, 0.5, 0])
+    classifier = centroid_classifier({"tie": tie})
+    assert classifier.predict_vector(tie)[1] == 0.0
+
+
+class RecordingLLM(AbstractLLM):
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.prompts.append(prompt)
+        return "RAG"
+
+
+class Executor:
+    name = "executor"
+    consumes_tools = []
+
+
+@pytest.mark.parametrize("text, expected_calls", [("计算 3 + 5", 0), ("计算器是什么", 1)])
+def test_router_skips_the_llm_on_a_confident_prediction(text, expected_calls):
+    llm = RecordingLLM()
+    config = {"pre_classifier": {"enabled": True, "rules": RULES}}
+    router = RouterAgent(llm, {}, config, {"rag_executor": Executor(), "calc_executor": Executor()})
+    decision = asyncio.run(router._classify(text, f"原始输入：{text}"))
+    assert decision == ("CALCULATOR" if expected_calls == 0 else "RAG")
+    assert len(llm.prompts) == expected_calls
+    assert router.pre_classifier.stats["fallback"] == expected_calls
+
+
+def test_pre_classifier_is_disabled_by_default():
+    assert create_intent_pre_classifier(None, None, 0.8) is None
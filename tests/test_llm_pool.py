@@ -0,0 +1,126 @@
+import asyncio
+from typing import List
+
+import pytest
+
+import models.implementations as implementations
+from models.implementations import HuggingFacePoolModel, transport_manager
+from models.llm_abc import AbstractLLM
+
+
+class ReplicaModel(AbstractLLM):
+    """模拟单个端点：首个片段前等待 delay 秒，fail=True 时抛出异常。"""
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.name} down")
+        return f"{self.name}:{prompt}"
+
+    async def stream(self, prompt: str, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.name} down")
+        for piece in (self.name, ":", prompt):
+            yield piece
+
+
+@pytest.fixture(autouse=True)
+def first_least_loaded(monkeypatch):
+    # 负载相同的端点按配置顺序选择，便于断言哪个端点是主请求
+    monkeypatch.setattr(implementations.random, "choice", lambda seq: seq[0])
+
+
+def make_pool(*models: ReplicaModel, **hedging) -> HuggingFacePoolModel:
+    config = {"name": "pool", "endpoints": [f"http://replica-{i}/v1" for i in range(len(models))],
+              "hedging": {"initial_delay_ms": 50, "max_hedge_ratio": 1.0, **hedging},
+              "failover": {"max_failures": 2, "cooldown_seconds": 60}}
+    pool = HuggingFacePoolModel(config)
+    for replica, model in zip(pool.replicas, models):
+        replica.model = model
+    asyncio.run(transport_manager.aclose())
+    return pool
+
+
+def outstanding(pool: HuggingFacePoolModel) -> List[int]:
+    return [replica.outstanding for replica in pool.replicas]
+
+
+def test_generate_hedges_slow_primary():
+    slow, fast = ReplicaModel("slow", delay=5.0), ReplicaModel("fast", delay=0.01)
+    pool = make_pool(slow, fast)
+
+    async def run():
+        return await asyncio.wait_for(pool.generate("q"), 1.0)
+
+    assert asyncio.run(run()) == "fast:q"
+    assert pool.stats["hedged"] == 1 and pool.stats["hedge_wins"] == 1
+    assert outstanding(pool) == [0, 0]
+
+
+def test_generate_without_hedging_waits_for_primary():
+    primary, other = ReplicaModel("a", delay=0.1), ReplicaModel("b")
+    pool = make_pool(primary, other, enabled=False)
+    assert asyncio.run(pool.generate("q")) == "a:q"
+    assert other.calls == 0 and pool.stats["hedged"] == 0
+
+
+def test_generate_fails_over_and_ejects_failing_replica():
+    broken, healthy = ReplicaModel("broken", fail=True), ReplicaModel("healthy")
+    pool = make_pool(broken, healthy, enabled=False)
+
+    async def run():
+        return [await pool.generate(str(i)) for i in range(4)]
+
+    assert asyncio.run(run()) == ["healthy:0", "healthy:1", "healthy:2", "healthy:3"]
+    # 连续失败 max_failures (2) 次后熔断，之后的请求不再先发往故障端点
+    assert broken.calls == 2
+    assert pool.stats["failovers"] == 2
+    assert not pool.replicas[0].healthy(implementations.time.monotonic())
+    assert outstanding(pool) == [0, 0]
+
+
+def test_generate_raises_when_all_replicas_fail():
+    pool = make_pool(ReplicaModel("a", fail=True), ReplicaModel("b", fail=True), enabled=False)
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.generate("q"))
+    assert outstanding(pool) == [0, 0]
+
+
+def test_stream_hedges_on_first_chunk():
+    slow, fast = ReplicaModel("slow", delay=5.0), ReplicaModel("fast", delay=0.01)
+    pool = make_pool(slow, fast)
+
+    async def run():
+        return [chunk async for chunk in pool.stream("q")]
+
+    assert asyncio.run(asyncio.wait_for(run(), 1.0)) == ["fast", ":", "q"]
+    assert pool.stats["hedge_wins"] == 1
+    assert outstanding(pool) == [0, 0]
+
+
+def test_stream_cancelled_during_hedge_delay_releases_replicas():
+    slow, other = ReplicaModel("slow", delay=5.0), ReplicaModel("other", delay=5.0)
+    pool = make_pool(slow, other, initial_delay_ms=1000)
+
+    async def run():
+        async def consume():
+            return [chunk async for chunk in pool.stream("q")]
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        assert outstanding(pool) == [1, 0]
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 被取消的主请求任务不应继续在后台执行
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+    assert outstanding(pool) == [0, 0]
@@ -0,0 +1,43 @@
+import asyncio
+import gc
+from typing import List
+
+from models.llm_abc import AbstractLLM
+from models.llm_wrappers import BatchingLLM
+
+
+class SlowEchoLLM(AbstractLLM):
+    def __init__(self):
+        self.batches: List[List[str]] = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(0.01)
+        gc.collect()  # 执行中的批次任务若没有强引用，会在这里被回收
+        return f"<{prompt}>"
+
+    async def generate_batch(self, prompts: List[str], **kwargs) -> List[str]:
+        self.batches.append(list(prompts))
+        return await super().generate_batch(prompts, **kwargs)
+
+
+def test_batching_llm_groups_requests_and_returns_results_in_order():
+    inner = SlowEchoLLM()
+    llm = BatchingLLM(inner, "echo", {"max_batch_size": 4, "max_wait_ms": 20})
+
+    async def run():
+        return await asyncio.gather(*(llm.generate(str(i)) for i in range(10)))
+
+    assert asyncio.run(run()) == [f"<{i}>" for i in range(10)]
+    assert max(len(batch) for batch in inner.batches) == 4
+    assert llm.stats["requests"] == 10
+
+
+def test_batching_llm_drops_scheduler_when_event_loop_closes():
+    llm = BatchingLLM(SlowEchoLLM(), "echo", {"max_wait_ms": 1})
+    for _ in range(3):
+        async def run():
+            results = await asyncio.gather(*(llm.generate(str(i)) for i in range(6)))
+            assert len(llm._schedulers) == 1
+            return results
+        assert asyncio.run(run()) == [f"<{i}>" for i in range(6)]
+    assert llm._schedulers == {}
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from rag.local_ann import LocalANNRAGModule
+from models.llm_abc import AbstractEmbedding
+
+
+class HashEmbedding(AbstractEmbedding):
+    """按字符统计生成确定性向量的测试用 Embedding。"""
+    def _vector(self, text):
+        vector = [0.0] * 8
+        for char in text:
+            vector[ord(char) % 8] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class LockCheckingConnection:
+    """包装 sqlite3 连接，记录未持有 _store_lock 时发生的查询。"""
+    def __init__(self, conn, lock):
+        self._conn, self._lock, self.unlocked = conn, lock, []
+
+    def execute(self, sql, *args):
+        if not self._lock._is_owned():
+            self.unlocked.append((threading.current_thread().name, sql.split(" FROM")[0]))
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def make_module():
+    module = LocalANNRAGModule(HashEmbedding(), {"collection_name": "lock_test", "persistent": False})
+    module.ingest_data(["alpha beta", "gamma delta", "beta gamma epsilon"], ids=["a", "b", "c"])
+    return module
+
+
+def test_search_worker_reads_hold_the_store_lock():
+    module = make_module()
+    try:
+        conn = LockCheckingConnection(module._conn, module._store_lock)
+        module._conn = conn
+        results = asyncio.run(module.ahybrid_search_with_scores("beta gamma", top_k=2))
+        module._get_content_hashes(["a", "b"])
+        module._dense_count()
+        module._dense_ids()
+        list(module._iter_dense_documents())
+        assert len(results) == 2
+        assert conn.unlocked == []
+    finally:
+        module._conn = conn._conn
+        module.close()
+
+
+def test_dense_search_skips_rows_deleted_during_the_lookup():
+    module = make_module()
+
+    class RacingRows(dict):
+        """模拟并发删除：成员检查时行还在，读取时已被删除。"""
+        def __contains__(self, row):
+            return True
+
+    try:
+        rows = {doc_id: row for row, doc_id in module._row_ids.items()}
+        # 向量索引返回的结果中仍包含随后被删除的行
+        module.vector_index.search = lambda vector, k: (np.array([rows["a"], rows["b"], rows["c"]]), np.zeros(3))
+        module._row_ids = RacingRows((row, doc_id) for row, doc_id in module._row_ids.items() if doc_id != "b")
+        hits = module._dense_search_by_vector([1.0] * 8, 3)
+        assert [doc_id for doc_id, _ in hits] == ["a", "c"]
+    finally:
+        module.close()
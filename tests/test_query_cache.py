@@ -0,0 +1,71 @@
+import pytest
+
+from rag.query_cache import SemanticQueryCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("rag.query_cache.time.time", lambda: now[0])
+    return now
+
+
+def test_exact_match_uses_normalized_query():
+    cache = SemanticQueryCache()
+    cache.put("什么是 混合搜索？", "answer", version=1)
+    assert cache.get_exact("  什么是   混合搜索?", version=1) == "answer"
+    assert cache.get_exact("ＬＬＭ工厂是什么", version=1) is None
+    assert cache.stats["exact_hits"] == 1 and cache.stats["exact_misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticQueryCache({"ttl_seconds": 60})
+    cache.put("q", "answer", query_vector=[1.0, 0.0])
+    clock[0] += 60
+    assert cache.get_exact("q") == "answer"
+    clock[0] += 1
+    assert cache.get_similar([1.0, 0.0]) is None
+    assert cache.get_exact("q") is None
+    assert cache.stats["expired"] == 1 and len(cache) == 0
+
+
+def test_lru_eviction_frees_the_vector_slot():
+    cache = SemanticQueryCache({"max_entries": 2})
+    cache.put("a", "A", query_vector=[1.0, 0.0, 0.0])
+    cache.put("b", "B", query_vector=[0.0, 1.0, 0.0])
+    assert cache.get_exact("a") == "A"  # a 成为最近使用
+    cache.put("c", "C", query_vector=[0.0, 0.0, 1.0])  # 淘汰 b，复用它的槽位
+    assert cache.get_exact("b") is None
+    assert cache.get_similar([0.0, 1.0, 0.0]) is None
+    assert cache.get_similar([0.0, 0.1, 1.0]) == ("C", pytest.approx(0.995, abs=1e-3))
+    assert sorted(key for key in cache._slot_keys if key) == sorted([cache.make_key("a"), cache.make_key("c")])
+
+
+def test_semantic_match_respects_threshold():
+    cache = SemanticQueryCache({"similarity_threshold": 0.9})
+    cache.put("q", "answer", query_vector=[1.0, 0.0])
+    assert cache.get_similar([0.8, 0.6]) is None  # cos = 0.8
+    result, similarity = cache.get_similar([0.95, 0.1])
+    assert result == "answer" and similarity >= 0.9
+
+    exact_only = SemanticQueryCache({"semantic": False})
+    exact_only.put("q", "answer", query_vector=[1.0, 0.0])
+    assert exact_only.get_similar([1.0, 0.0]) is None
+
+
+def test_version_change_invalidates_all_entries():
+    cache = SemanticQueryCache()
+    cache.put("q1", "old", version=1, query_vector=[1.0, 0.0])
+    cache.put("q2", "old", version=1)
+    assert cache.get_exact("q1", version=1) == "old"
+    assert cache.get_exact("q1", version=2) is None
+    assert cache.get_similar([1.0, 0.0], version=2) is None
+    assert len(cache) == 0 and cache.stats["invalidations"] == 1
+
+
+def test_embedding_dimension_change_clears_vectors():
+    cache = SemanticQueryCache()
+    cache.put("q1", "A", query_vector=[1.0, 0.0])
+    cache.put("q2", "B", query_vector=[1.0, 0.0, 0.0])
+    assert cache.get_exact("q1") is None
+    assert cache.get_similar([1.0, 0.0, 0.0]) == ("B", pytest.approx(1.0))
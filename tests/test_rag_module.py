@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from models.llm_abc import AbstractEmbedding
+from rag.rag_module import RAGModule
+
+
+class CountingEmbedding(AbstractEmbedding):
+    """按字符统计生成确定性向量，并记录被向量化的文档。"""
+    def __init__(self):
+        self.embedded = []
+
+    def _vector(self, text):
+        vector = [0.0] * 8
+        for char in text:
+            vector[ord(char) % 8] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+DOCS = {"a": "alpha beta", "b": "gamma delta", "c": "beta gamma epsilon"}
+
+
+def open_module(path, embedder=None, name="incremental"):
+    return RAGModule(embedder or CountingEmbedding(), {"db_path": str(path), "collection_name": name})
+
+
+def stored_ids(module):
+    return sorted(module.collection.get(include=[])["ids"])
+
+
+def test_upsert_only_embeds_new_or_changed_documents(tmp_path):
+    module = open_module(tmp_path)
+    assert module.upsert_documents(list(DOCS.values()), ids=list(DOCS)) == {"added": 3, "updated": 0, "skipped": 0}
+    assert module.version == 1
+
+    module.embedder.embedded.clear()
+    assert module.upsert_documents(list(DOCS.values()), ids=list(DOCS)) == {"added": 0, "updated": 0, "skipped": 3}
+    assert module.embedder.embedded == []
+    assert module.version == 1  # 没有实际写入，版本不变
+
+    stats = module.upsert_documents(["gamma delta zeta", "omega"], ids=["b", "d"])
+    assert stats == {"added": 1, "updated": 1, "skipped": 0}
+    assert module.embedder.embedded == ["gamma delta zeta", "omega"]
+    assert module.version == 2
+    assert module.hybrid_search("zeta", top_k=1)[0].endswith("gamma delta zeta")
+    module.close()
+
+
+def test_persistent_collection_reloads_without_re_ingesting(tmp_path):
+    module = open_module(tmp_path)
+    module.ingest_data(list(DOCS.values()), ids=list(DOCS))
+    module.close()
+
+    embedder = CountingEmbedding()
+    reopened = open_module(tmp_path, embedder)
+    assert reopened.collection.count() == 3
+    assert len(reopened.sparse_index) == 3
+    assert reopened.hybrid_search("epsilon", top_k=1) and embedder.embedded == []
+    reopened.close()
+
+
+def test_replace_deletes_stale_ids(tmp_path):
+    module = open_module(tmp_path)
+    module.ingest_data(list(DOCS.values()), ids=list(DOCS))
+    stats = module.ingest_data([DOCS["a"], DOCS["c"]], ids=["a", "c"], replace=True)
+    assert stats == {"added": 0, "updated": 0, "skipped": 2, "deleted": 1}
+    assert stored_ids(module) == ["a", "c"]
+    assert "b" not in module.sparse_index
+    assert module.delete_documents(["missing"]) == 0
+    # 只有实际写入 (首次摄取、删除 b) 才递增版本
+    assert module.version == 2
+    module.close()
+
+
+def test_async_search_runs_both_legs_concurrently_off_the_event_loop(tmp_path):
+    module = open_module(tmp_path, name="async_legs")
+    module.ingest_data(list(DOCS.values()), ids=list(DOCS))
+    # 两路都到达屏障才能继续：串行执行时会超时
+    barrier = threading.Barrier(2, timeout=5)
+    leg_threads = {}
+    sparse_search, dense_search = module._sparse_search, module._dense_search_by_vector
+
+    def sparse_leg(query, k):
+        leg_threads["sparse"] = threading.get_ident()
+        barrier.wait()
+        return sparse_search(query, k)
+
+    def dense_leg(vector, k):
+        leg_threads["dense"] = threading.get_ident()
+        barrier.wait()
+        return dense_search(vector, k)
+
+    module._sparse_search, module._dense_search_by_vector = sparse_leg, dense_leg
+
+    async def run():
+        return threading.get_ident(), await module.ahybrid_search("beta gamma", top_k=2)
+
+    loop_thread, results = asyncio.run(run())
+    assert len(results) == 2
+    assert loop_thread not in leg_threads.values() and leg_threads["sparse"] != leg_threads["dense"]
+    module.close()
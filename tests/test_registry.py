@@ -0,0 +1,95 @@
+import gc
+import threading
+import time
+import weakref
+
+import pytest
+
+from factory.agent_factory import LazyComponent
+from factory.llm_factory import ComponentRegistry
+
+
+class Component:
+    pass
+
+
+def test_singleton_is_shared_across_graphs():
+    registry = ComponentRegistry()
+    with registry.graph_scope("a"):
+        first = registry.get_or_create("llm", "m", "singleton", Component)
+    with registry.graph_scope("b"):
+        second = registry.get_or_create("llm", "m", "singleton", Component)
+    assert first is second
+    assert registry.get_or_create("llm", "m", "singleton", Component) is first
+    assert (registry.hits, registry.misses) == (2, 1)
+
+
+def test_graph_scope_shares_within_one_assembly_only():
+    registry = ComponentRegistry()
+    with registry.graph_scope("a") as graph_a:
+        first = registry.get_or_create("tools", "t", "graph", Component)
+        with registry.graph_scope("nested") as nested:
+            # 嵌套调用复用最外层作用域
+            assert nested == graph_a
+            assert registry.get_or_create("tools", "t", "graph", Component) is first
+    with registry.graph_scope("a") as graph_b:
+        second = registry.get_or_create("tools", "t", "graph", Component)
+    assert graph_a != graph_b and first is not second
+    assert registry.current_graph() is None
+    # 流程图之外 graph 作用域退化为 transient
+    assert registry.get_or_create("tools", "t", "graph", Component) is not registry.get_or_create("tools", "t", "graph", Component)
+
+
+def test_transient_creates_a_new_instance_every_time():
+    registry = ComponentRegistry()
+    with registry.graph_scope("a"):
+        assert registry.get_or_create("tools", "t", "transient", Component) is not registry.get_or_create("tools", "t", "transient", Component)
+    assert registry.misses == 2
+
+
+def test_unknown_scope_is_rejected():
+    with pytest.raises(ValueError):
+        ComponentRegistry().get_or_create("llm", "m", "request", Component)
+
+
+def test_graph_scoped_instances_are_released_after_assembly():
+    registry = ComponentRegistry()
+    refs = []
+    for name in ("a", "b", "c"):
+        with registry.graph_scope(name):
+            refs.append(weakref.ref(registry.get_or_create("rag", "r", "graph", Component)))
+    gc.collect()
+    # 注册表不持有 graph 作用域的实例：流程图被丢弃后实例随之回收
+    assert [ref() for ref in refs] == [None, None, None]
+    assert registry._instances == {}
+
+
+def test_lazy_proxies_resolved_after_assembly_share_the_graph_instance():
+    registry = ComponentRegistry()
+    with registry.graph_scope("a"):
+        first = LazyComponent("rag.r", lambda: registry.get_or_create("rag", "r", "graph", Component))
+        second = LazyComponent("rag.r", lambda: registry.get_or_create("rag", "r", "graph", Component))
+    with registry.graph_scope("b"):
+        other = LazyComponent("rag.r", lambda: registry.get_or_create("rag", "r", "graph", Component))
+    first.value, second.value, other.value = 1, 2, 3  # 写属性触发解析
+    assert first._instance is second._instance
+    assert other._instance is not first._instance
+
+
+def test_concurrent_requests_build_a_singleton_once():
+    registry = ComponentRegistry()
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return Component()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get_or_create("llm", "m", "singleton", build)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1 and len({id(result) for result in results}) == 1
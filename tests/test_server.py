@@ -0,0 +1,135 @@
+import asyncio
+import json
+from typing import Dict, Any, List
+
+import httpx
+
+from app.server import AgentServer
+from app.stub_llm_server import StubLLMServer
+from models.agents_implementations import RAGAgent, CalculatorAgent, RouterAgent
+from models.implementations import HuggingFacePipelineModel, transport_manager
+from models.llm_abc import AbstractLLM, AbstractTool
+from openai import AsyncOpenAI
+
+
+class RouteLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return "RAG" if "是什么" in prompt.split("，判断用户意图", 1)[0] else "CALCULATOR"
+
+
+class FakeRAGModule:
+    version = 0
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        return [f"关于 {query} 的文档"]
+
+
+class MathTool(AbstractTool):
+    async def run(self, input_text: str) -> str:
+        return "计算结果: 63"
+
+
+class StubSystem:
+    """AgentServer 只依赖 app_flow / summary / aclose。"""
+    def __init__(self, app_flow: Any):
+        self.app_flow = app_flow
+        self.closed = False
+
+    def summary(self) -> str:
+        return ""
+
+    async def aclose(self):
+        self.closed = True
+
+
+class GatedFlow:
+    """在 gate 打开之前一直占用执行名额的流程。"""
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.started = asyncio.Event()
+
+    async def astream(self, state: Dict[str, Any], stream_mode=None):
+        self.started.set()
+        await self.gate.wait()
+        yield "updates", {"route": {**state, "decision": "DEFAULT"}}
+
+
+def stub_summary_model() -> HuggingFacePipelineModel:
+    """总结模型：真实的 HuggingFacePipelineModel，请求经 ASGI 传输层直接送入 StubLLMServer。"""
+    model = HuggingFacePipelineModel({"name": "stub", "pipeline_url": "http://stub-llm/v1", "temperature": 0.0})
+    transport = httpx.ASGITransport(app=StubLLMServer(first_token_ms=0, token_ms=0, max_tokens=64))
+    model.client = AsyncOpenAI(base_url="http://stub-llm/v1", api_key="EMPTY",
+                               http_client=httpx.AsyncClient(transport=transport), max_retries=0)
+    return model
+
+
+def build_stub_flow():
+    summary_llm = stub_summary_model()
+    rag = RAGAgent(summary_llm, {}, FakeRAGModule(), {})
+    calc = CalculatorAgent(summary_llm, {"math_solver": MathTool()}, {})
+    return RouterAgent(RouteLLM(), {}, {"name": "TestRouter"}, {"rag_executor": rag, "calc_executor": calc}).get_agent_flow()
+
+
+async def start_server(app_flow: Any, config: Dict[str, Any]) -> AgentServer:
+    server = AgentServer(lambda: StubSystem(app_flow), config)
+    await server.startup()
+    return server
+
+
+def client_for(server: AgentServer) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server), base_url="http://agent")
+
+
+def test_query_streams_token_events_from_stub_llm():
+    async def run():
+        server = await start_server(build_stub_flow(), {})
+        async with client_for(server) as client:
+            response = await client.post("/query", json={"input": "混合搜索是什么？"})
+        await transport_manager.aclose()
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    tokens = [event for event in events if event["type"] == "token"]
+    assert tokens and {event["node"] for event in tokens} == {"RAG"}
+    # 桩模型回显 prompt 的前 20 个字符：执行 Agent 的 prompt 中带有用户的问题
+    assert "".join(event["content"] for event in tokens) == "[桩模型回复] 已收到问题：请基于以下上下文，回答用户的问题：混合搜"
+    assert [event["node"] for event in events if event["type"] == "node"] == ["route", "RAG"]
+    assert events[-1]["type"] == "final" and events[-1]["decision"] == "END"
+    assert "[LLM 最终回复]：[桩模型回复]" in events[-1]["output"]
+
+
+def test_query_rejected_with_429_when_slots_and_queue_are_full():
+    async def run():
+        flow = GatedFlow()
+        server = await start_server(flow, {"max_concurrency": 1, "max_queue": 0})
+        async with client_for(server) as client:
+            first = asyncio.ensure_future(client.post("/query", json={"input": "慢查询"}))
+            await asyncio.wait_for(flow.started.wait(), 5)
+            rejected = await client.post("/query", json={"input": "第二个查询"})
+            flow.gate.set()
+            return await first, rejected, server.stats
+
+    first, rejected, stats = asyncio.run(run())
+    assert first.status_code == 200
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "1"
+    assert stats["rejected"] == 1 and stats["completed"] == 1
+
+
+def test_query_times_out_in_queue_with_503():
+    async def run():
+        flow = GatedFlow()
+        server = await start_server(flow, {"max_concurrency": 1, "max_queue": 1, "queue_timeout_seconds": 0.05})
+        async with client_for(server) as client:
+            first = asyncio.ensure_future(client.post("/query", json={"input": "慢查询"}))
+            await asyncio.wait_for(flow.started.wait(), 5)
+            queued = await client.post("/query", json={"input": "排队的查询"})
+            flow.gate.set()
+            return await first, queued, server.stats
+
+    first, queued, stats = asyncio.run(run())
+    assert first.status_code == 200
+    assert queued.status_code == 503
+    assert stats["queue_timeouts"] == 1 and stats["rejected"] == 0
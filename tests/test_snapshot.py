@@ -0,0 +1,57 @@
+import pytest
+
+from models.llm_abc import AbstractEmbedding
+from rag.rag_module import RAGModule
+from rag.snapshot import SnapshotRAGModule, build_snapshot
+
+
+class CharEmbedding(AbstractEmbedding):
+    """按字符统计生成确定性向量。"""
+    def _vector(self, text):
+        vector = [0.0] * 8
+        for char in text:
+            vector[ord(char) % 8] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+DOCS = {"a": "alpha beta", "b": "gamma delta", "c": "beta gamma epsilon", "d": "zeta eta theta"}
+QUERIES = ["beta", "gamma delta", "theta", "epsilon alpha"]
+
+
+def ranked(module, query):
+    return [doc.page_content for doc, _ in module.hybrid_search_with_scores(query, top_k=3)]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    source = RAGModule(CharEmbedding(), {"db_path": str(tmp_path / "source"), "collection_name": "snapshot_source"})
+    source.ingest_data(list(DOCS.values()), ids=list(DOCS))
+    manifest = build_snapshot(source, str(tmp_path / "snapshot"))
+    expected = {query: ranked(source, query) for query in QUERIES}
+    source.close()
+    module = SnapshotRAGModule(CharEmbedding(), {"snapshot_dir": str(tmp_path / "snapshot")})
+    yield manifest, module, expected
+    module.close()
+
+
+def test_snapshot_reload_returns_the_same_top_k(snapshot):
+    manifest, module, expected = snapshot
+    assert manifest["num_docs"] == len(DOCS) and manifest["collection_name"] == "snapshot_source"
+    assert sorted(module._dense_ids()) == sorted(DOCS)
+    for query in QUERIES:
+        assert ranked(module, query) == expected[query]
+
+
+def test_snapshot_module_rejects_writes(snapshot):
+    _, module, _ = snapshot
+    with pytest.raises(RuntimeError):
+        module.upsert_documents(["new text"], ids=["e"])
+    with pytest.raises(RuntimeError):
+        module.delete_documents(["a"])
+    assert module._dense_count() == len(DOCS)
@@ -0,0 +1,100 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from rag.sparse_index import SparseIndex
+
+VOCABULARY = [f"w{i}" for i in range(40)]
+
+
+def make_corpus(count, seed=7):
+    rng = random.Random(seed)
+    # 长尾词频分布，让 MaxScore 的上界剪枝真正生效
+    weights = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+    return {f"doc-{i}": " ".join(rng.choices(VOCABULARY, weights, k=rng.randint(3, 25))) for i in range(count)}
+
+
+def bm25_reference(corpus, query, k1=1.5, b=0.75):
+    """对全部文档逐一打分的 BM25 参考实现。"""
+    docs = {doc_id: text.split() for doc_id, text in corpus.items()}
+    avgdl = sum(len(tokens) for tokens in docs.values()) / len(docs)
+    df = Counter(term for tokens in docs.values() for term in set(tokens))
+    scores = {}
+    for doc_id, tokens in docs.items():
+        tfs, score = Counter(tokens), 0.0
+        for term, qtf in Counter(query.split()).items():
+            if tfs[term]:
+                idf = math.log(1.0 + (len(docs) - df[term] + 0.5) / (df[term] + 0.5))
+                score += qtf * idf * tfs[term] * (k1 + 1) / (tfs[term] + k1 * (1 - b + b * len(tokens) / avgdl))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+
+def assert_matches_reference(index, corpus, query, k):
+    reference = bm25_reference(corpus, query)
+    expected = sorted(reference.values(), reverse=True)[:k]
+    hits = index.search(query, k)
+    assert [score for _, score in hits] == pytest.approx(expected)
+    for doc_id, score in hits:
+        assert reference[doc_id] == pytest.approx(score)
+
+
+def test_maxscore_top_k_matches_exhaustive_bm25():
+    corpus = make_corpus(300)
+    index = SparseIndex()
+    index.add(list(corpus), list(corpus.values()))
+    for query in ["w0 w1", "w3 w17 w39", "w0 w0 w25", "w5 w6 w7 w8 w9 w10", "w38"]:
+        for k in (1, 5, 20):
+            assert_matches_reference(index, corpus, query, k)
+    assert index.search("unknown", 5) == []
+
+
+def test_segments_survive_reload_and_deletions_are_never_returned(tmp_path):
+    corpus = make_corpus(120)
+    ids = list(corpus)
+    index = SparseIndex(str(tmp_path), max_segments=8)
+    for start in range(0, len(ids), 40):  # 三次 save 生成三个分段
+        index.add(ids[start:start + 40], [corpus[doc_id] for doc_id in ids[start:start + 40]])
+        index.save()
+    removed = ids[::10]
+    assert index.remove(removed + ["missing"]) == len(removed)
+    index.save()
+    index.close()
+
+    reloaded = SparseIndex(str(tmp_path))
+    assert len(reloaded) == len(ids) - len(removed)
+    assert not set(removed) & {doc_id for doc_id, _ in reloaded.search("w0 w1 w2", 200)}
+
+    # 删除比例超过阈值时合并，墓碑被物理清除后 df 与存活文档一致
+    reloaded.remove(ids[1::4])
+    reloaded.save()
+    live = {doc_id: text for doc_id, text in corpus.items() if doc_id in reloaded}
+    assert len(reloaded._segments) == 1 and not reloaded._deleted
+    assert_matches_reference(reloaded, live, "w2 w4 w30", 10)
+    reloaded.close()
+
+
+def test_re_adding_a_document_replaces_its_postings():
+    index = SparseIndex()
+    index.add(["a", "b"], ["apple pie", "banana split"])
+    index.add(["a"], ["cherry tart"])
+    assert len(index) == 2
+    assert index.search("apple", 5) == []
+    assert [doc_id for doc_id, _ in index.search("cherry", 5)] == ["a"]
+
+
+def test_read_only_index_rejects_writes(tmp_path):
+    index = SparseIndex(str(tmp_path))
+    index.add(["a"], ["alpha"])
+    index.save()
+    index.close()
+    snapshot = SparseIndex(str(tmp_path), read_only=True)
+    assert [doc_id for doc_id, _ in snapshot.search("alpha", 1)] == ["a"]
+    with pytest.raises(RuntimeError):
+        snapshot.save()
+    with pytest.raises(RuntimeError):
+        snapshot.clear()
+    snapshot.close()
@@ -0,0 +1,98 @@
+import asyncio
+from typing import List
+
+from models.agents_implementations import CalculatorAgent, RAGAgent, RouterAgent
+from models.llm_abc import AbstractLLM, AbstractTool
+from models.speculation import SpeculativeTasks
+
+
+class KeywordRouteLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        user_input = prompt.split("原始输入：", 1)[1].split("，判断用户意图", 1)[0]
+        await asyncio.sleep(0.01)  # 意图识别期间推测检索已经开始
+        if "计算" in user_input:
+            return "CALCULATOR"
+        return "RAG" if "是什么" in user_input else "DEFAULT"
+
+
+class EchoLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return f"回答<{prompt}>"
+
+
+class CountingRAGModule:
+    version = 0
+
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        self.queries: List[str] = []
+        self.failures = failures
+        self.delay = delay
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("检索后端暂时不可用")
+        return [f"关于 {query} 的文档"]
+
+
+class MathTool(AbstractTool):
+    async def run(self, input_text: str) -> str:
+        return "63"
+
+
+def build(rag_module, cache=False):
+    rag = RAGAgent(EchoLLM(), {}, rag_module, {"result_cache": {"enabled": cache, "semantic": False}})
+    calc = CalculatorAgent(EchoLLM(), {"math_solver": MathTool()}, {})
+    router = RouterAgent(KeywordRouteLLM(), {}, {"speculation": {"enabled": True}},
+                         {"rag_executor": rag, "calc_executor": calc})
+    return router.get_agent_flow(), rag
+
+
+def run_queries(flow, *queries):
+    async def run():
+        return [await flow.ainvoke({"input": query, "output": "", "decision": ""}) for query in queries]
+    return asyncio.run(run())
+
+
+def test_speculation_is_cancelled_and_counted_as_wasted_on_other_routes():
+    rag_module = CountingRAGModule(delay=1.0)
+    flow, rag = build(rag_module)
+    states = run_queries(flow, "帮我计算 3 加 5", "你好")
+    assert [state["decision"] for state in states] == ["CALCULATOR", "DEFAULT"]
+    stats = rag.speculation.stats
+    assert (stats["started"], stats["used"], stats["cancelled"]) == (2, 0, 2)
+    assert stats["wasted_seconds"] > 0 and rag.speculation._pending == {}
+
+
+def test_speculation_is_used_on_a_rag_route_and_discarded_on_a_cache_hit():
+    rag_module = CountingRAGModule()
+    flow, rag = build(rag_module, cache=True)
+    first, repeat = run_queries(flow, "混合搜索是什么", "混合搜索是什么")
+    assert repeat["output"] == first["output"]
+    stats = rag.speculation.stats
+    assert stats["started"] == 2 and stats["used"] == 1
+    assert stats["cancelled"] + stats["discarded"] == 1 and stats["saved_seconds"] > 0
+
+
+def test_failed_speculative_search_falls_back_to_a_fresh_search():
+    rag_module = CountingRAGModule(failures=1)
+    flow, rag = build(rag_module)
+    (state,) = run_queries(flow, "混合搜索是什么")
+    assert rag_module.queries == ["混合搜索是什么", "混合搜索是什么"]
+    assert "关于 混合搜索是什么 的文档" in state["output"]
+    assert rag.speculation.stats["used"] == 1
+
+
+def test_unclaimed_tasks_beyond_max_pending_are_cancelled():
+    async def run():
+        tasks = SpeculativeTasks("test", max_pending=2)
+        ids = [tasks.start(asyncio.sleep(10)) for _ in range(3)]
+        assert tasks.take(ids[0]) is None and list(tasks._pending) == ids[1:]
+        for speculation_id in ids[1:]:
+            tasks.discard(speculation_id)
+        return tasks.stats
+
+    stats = asyncio.run(run())
+    assert (stats["started"], stats["cancelled"], stats["used"]) == (3, 3, 0)
@@ -0,0 +1,72 @@
+from models.llm_abc import AbstractEmbedding
+from rag.rag_module import RAGModule
+from rag.tokenization import CharNGramTokenizer, DictionaryTokenizer, TokenStreamCache, create_tokenizer
+
+
+class CharEmbedding(AbstractEmbedding):
+    """按字符统计生成确定性向量。"""
+    def _vector(self, text):
+        vector = [0.0] * 8
+        for char in text:
+            vector[ord(char) % 8] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class CountingTokenizer(CharNGramTokenizer):
+    def __init__(self):
+        super().__init__({})
+        self.calls = []
+
+    def tokenize(self, text):
+        self.calls.append(text)
+        return super().tokenize(text)
+
+
+def test_ngram_splits_cjk_runs_and_keeps_ascii_words():
+    tokenizer = create_tokenizer({"type": "ngram", "ngram_range": [1, 2]})
+    assert tokenizer.tokenize("向量DB检索 API v2") == ["向", "量", "向量", "db", "检", "索", "检索", "api", "v2"]
+    assert tokenizer.signature == "ngram:1-2"
+
+
+def test_max_match_uses_user_words_without_jieba():
+    tokenizer = DictionaryTokenizer({"user_words": ["向量数据库", "检索"], "use_jieba": False})
+    assert not tokenizer.use_jieba
+    assert tokenizer.tokenize("向量数据库的混合检索RAG") == ["向量数据库", "的", "混", "合", "检索", "rag"]
+    assert tokenizer.signature.startswith("dictionary:maxmatch:")
+    assert tokenizer.signature != DictionaryTokenizer({"user_words": ["检索"], "use_jieba": False}).signature
+
+
+def test_token_cache_skips_tokenizer_on_second_call():
+    cache, tokenizer = TokenStreamCache(), CountingTokenizer()
+    texts, hashes = ["混合检索", "稀疏索引"], ["h1", "h2"]
+    first = cache.tokenize_many(tokenizer, texts, hashes)
+    assert tokenizer.calls == texts
+    assert cache.tokenize_many(tokenizer, texts, hashes) == first
+    assert tokenizer.calls == texts
+    cache.close()
+
+
+def test_tokenizer_signature_change_rebuilds_sparse_index(tmp_path, monkeypatch):
+    config = {"db_path": str(tmp_path), "collection_name": "tokenized"}
+    module = RAGModule(CharEmbedding(), config)
+    module.ingest_data(["混合检索", "稀疏索引"], ids=["a", "b"])
+    module.close()
+
+    rebuilds = []
+    rebuild = RAGModule._rebuild_sparse_index
+    monkeypatch.setattr(RAGModule, "_rebuild_sparse_index", lambda self: (rebuilds.append(1), rebuild(self))[1])
+    same = RAGModule(CharEmbedding(), config)
+    assert rebuilds == []
+    same.close()
+
+    reopened = RAGModule(CharEmbedding(), dict(config, tokenizer={"type": "ngram"}))
+    assert rebuilds == [1] and len(reopened.sparse_index) == 2
+    # 空白分词下整句是一个词，只有切换到 n-gram 后部分查询才能命中
+    assert [doc_id for doc_id, _ in reopened.sparse_index.search("检索", 1)] == ["a"]
+    reopened.close()
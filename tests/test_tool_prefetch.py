@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Dict, Any, List
+
+from models.agents_implementations import CalculatorAgent, RAGAgent, RouterAgent
+from models.llm_abc import AbstractLLM, AbstractTool
+
+
+class KeywordRouteLLM(AbstractLLM):
+    async def generate(self, prompt: str, **kwargs) -> str:
+        user_input = prompt.split("原始输入：", 1)[1].split("，判断用户意图", 1)[0]
+        await asyncio.sleep(0)
+        return "CALCULATOR" if "计算" in user_input else "RAG"
+
+
+class RecordingLLM(AbstractLLM):
+    def __init__(self):
+        self.prompts: List[str] = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.prompts.append(prompt)
+        return "好的"
+
+
+class FakeRAGModule:
+    version = 0
+
+    async def ahybrid_search(self, query: str, top_k: int = 5) -> List[str]:
+        return ["知识库文档"]
+
+
+class WebSearchTool(AbstractTool):
+    def __init__(self, delay: float = 0.0, result: str = "网页结果"):
+        self.delay = delay
+        self.result = result
+        self.started = 0
+        self.cancelled = 0
+
+    async def run(self, input_text: str) -> str:
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+
+class MathTool(AbstractTool):
+    async def run(self, input_text: str) -> str:
+        return "63"
+
+
+def build(web_search: WebSearchTool, prefetch: Dict[str, Any], rag_consumes=("web_search",)):
+    summary_llm = RecordingLLM()
+    rag = RAGAgent(summary_llm, {}, FakeRAGModule(), {"consumes_tools": list(rag_consumes)})
+    calc = CalculatorAgent(summary_llm, {"math_solver": MathTool()}, {})
+    router = RouterAgent(KeywordRouteLLM(), {"web_search": web_search}, {"tool_prefetch": {"web_search": prefetch}},
+                         {"rag_executor": rag, "calc_executor": calc})
+    return router, summary_llm
+
+
+def run_flow(router, query):
+    return asyncio.run(router.get_agent_flow().ainvoke({"input": query, "output": "", "decision": ""}))
+
+
+def test_prefetched_tool_result_reaches_the_rag_prompt():
+    web_search = WebSearchTool()
+    router, summary_llm = build(web_search, {"enabled": True, "timeout_seconds": 1.0})
+    state = run_flow(router, "混合搜索是什么")
+    assert state["tool_results"] == {"web_search": "网页结果"}
+    assert "知识库文档\n[web_search]：网页结果" in summary_llm.prompts[0]
+
+
+def test_prefetch_is_cancelled_when_the_route_does_not_consume_the_tool():
+    web_search = WebSearchTool(delay=10)
+    router, _ = build(web_search, {"enabled": True})
+    started = time.perf_counter()
+    state = run_flow(router, "帮我计算 3 加 5")
+    assert time.perf_counter() - started < 5
+    assert state["decision"] == "CALCULATOR" and state["tool_results"] == {}
+    assert (web_search.started, web_search.cancelled) == (1, 1)
+    assert router.tool_tasks.stats["cancelled"] == 1
+
+
+def test_prefetch_timeout_is_honoured():
+    web_search = WebSearchTool(delay=10)
+    router, summary_llm = build(web_search, {"enabled": True, "timeout_seconds": 0.05})
+    started = time.perf_counter()
+    state = run_flow(router, "混合搜索是什么")
+    assert time.perf_counter() - started < 5
+    assert state["tool_results"] == {} and web_search.cancelled == 1
+    assert "[web_search]" not in summary_llm.prompts[0]
+
+
+def test_tool_without_a_consumer_is_not_prefetched():
+    web_search = WebSearchTool()
+    router, _ = build(web_search, {"enabled": True}, rag_consumes=())
+    assert router.tool_prefetch == {}
+    run_flow(router, "混合搜索是什么")
+    assert web_search.started == 0
+
+    disabled, _ = build(WebSearchTool(), {"enabled": False})
+    assert disabled.tool_prefetch == {}